@@ -0,0 +1,28 @@
+"""
+Gunicorn configuration, picked up automatically from the working directory.
+
+SERVER_MODE=wsgi (default) runs the sync stack with threaded workers.
+SERVER_MODE=asgi runs the same project under uvicorn workers, where the
+/api/async/ endpoints serve slow clients without tying up a worker each.
+
+    gunicorn            # uses marcdwebpage.wsgi or marcdwebpage.asgi per SERVER_MODE
+"""
+import multiprocessing
+import os
+
+
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi').lower()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = 30
+keepalive = 5
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'marcdwebpage.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'marcdwebpage.wsgi:application'
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', '4'))
@@ -0,0 +1,330 @@
+"""
+Effective file access resolution
+
+A user's access level to a file is the highest of:
+- admin if they uploaded it (or are staff)
+- their FilePermission on the file, unless expired
+- any unexpired FolderPermission on the file's folder or one of its ancestors,
+  and admin on everything inside folders they created
+- read if the file is public
+
+Folder grants are expanded with a single recursive query, cached on the
+request and in the shared cache for a short TTL. Any grant or folder change
+bumps a version counter (see main_app.cache.bump_version), which invalidates
+every cached entry at once.
+
+Deactivated grants (see the sweep_expired_permissions command) are ignored.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from rest_framework import permissions
+
+from .cache import bump_version, get_cache, get_version
+from .models import FilePermission, Folder, FolderPermission
+
+
+PERMISSION_LEVELS = {'read': 1, 'write': 2, 'admin': 3}
+NO_ACCESS = 0
+ADMIN_LEVEL = PERMISSION_LEVELS['admin']
+
+PERMISSION_CACHE_TIMEOUT = 60
+VERSION_NAME = 'permissions'
+
+cache = get_cache('permissions')
+
+FOLDER_GRANTS_SQL = """
+WITH RECURSIVE granted (id, level, expires_at) AS (
+    SELECT fp.folder_id,
+           CASE fp.permission_type WHEN 'admin' THEN 3 WHEN 'write' THEN 2 ELSE 1 END,
+           fp.expires_at
+    FROM {folder_permission} fp
+    WHERE fp.user_id = %(user_id)s AND fp.is_active
+      AND (fp.expires_at IS NULL OR fp.expires_at > %(now)s)
+  UNION
+    SELECT f.id, 3, NULL::timestamptz
+    FROM {folder} f
+    WHERE f.created_by_id = %(user_id)s
+  UNION
+    SELECT child.id, granted.level, granted.expires_at
+    FROM {folder} child
+    JOIN granted ON child.parent_id = granted.id
+)
+SELECT id, MAX(level), MIN(expires_at) FROM granted GROUP BY id
+"""
+
+
+def levels_at_least(level):
+    """Permission types that grant at least `level`"""
+    required = PERMISSION_LEVELS[level]
+    return [name for name, value in PERMISSION_LEVELS.items() if value >= required]
+
+
+def active_grant_filter(now=None):
+    """Q object matching grants that are active and have not expired"""
+    now = now or timezone.now()
+    return Q(is_active=True) & (Q(expires_at__isnull=True) | Q(expires_at__gt=now))
+
+
+def get_permission_version():
+    return get_version(VERSION_NAME)
+
+
+_batch_state = threading.local()
+
+
+def bump_permission_version(**kwargs):
+    """Invalidate all cached access data (usable directly as a signal receiver)"""
+    if getattr(_batch_state, 'depth', 0):
+        _batch_state.dirty = True
+        return
+    bump_version(VERSION_NAME)
+
+
+@contextmanager
+def batched_permission_changes():
+    """Coalesce the version bumps of many grant changes into a single bump"""
+    _batch_state.depth = getattr(_batch_state, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _batch_state.depth -= 1
+        if not _batch_state.depth and getattr(_batch_state, 'dirty', False):
+            _batch_state.dirty = False
+            bump_permission_version()
+
+
+class AccessResolver:
+    """Resolves one user's access to files and folders, memoized for a request"""
+
+    def __init__(self, user):
+        self.user = user
+        self.unrestricted = bool(user and user.is_authenticated and (user.is_staff or user.is_superuser))
+        self._folder_levels = None
+        self._file_levels = {}
+
+    def folder_levels(self):
+        """Map of folder id -> level for every folder reachable through a grant"""
+        if self._folder_levels is not None:
+            return self._folder_levels
+        if not self.user or not self.user.is_authenticated:
+            self._folder_levels = {}
+            return self._folder_levels
+
+        cache_key = f"permissions:folders:{get_permission_version()}:{self.user.pk}"
+        levels = cache.get(cache_key)
+        if levels is None:
+            levels, earliest_expiry = self._load_folder_levels()
+            timeout = PERMISSION_CACHE_TIMEOUT
+            if earliest_expiry is not None:
+                # Never serve a grant from cache after it expires
+                seconds_left = (earliest_expiry - timezone.now()).total_seconds()
+                timeout = max(1, min(timeout, int(seconds_left)))
+            cache.set(cache_key, levels, timeout)
+        self._folder_levels = levels
+        return levels
+
+    def _load_folder_levels(self):
+        sql = FOLDER_GRANTS_SQL.format(
+            folder_permission=FolderPermission._meta.db_table,
+            folder=Folder._meta.db_table,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {'user_id': self.user.pk, 'now': timezone.now()})
+            rows = cursor.fetchall()
+
+        levels = {folder_id: level for folder_id, level, _ in rows}
+        expiries = [expires_at for _, _, expires_at in rows if expires_at is not None]
+        return levels, min(expiries) if expiries else None
+
+    def folder_ids_with(self, level):
+        required = PERMISSION_LEVELS[level]
+        return [folder_id for folder_id, value in self.folder_levels().items() if value >= required]
+
+    def filter_files(self, queryset, level='read'):
+        """Restrict a File queryset to files the user holds at least `level` on, in SQL"""
+        if self.unrestricted:
+            return queryset
+        if not self.user or not self.user.is_authenticated:
+            return queryset.filter(is_public=True) if level == 'read' else queryset.none()
+
+        direct_grant = FilePermission.objects.filter(
+            active_grant_filter(),
+            file=OuterRef('pk'),
+            user=self.user,
+            permission_type__in=levels_at_least(level),
+        )
+        condition = Q(uploaded_by=self.user) | Exists(direct_grant)
+        if level == 'read':
+            condition |= Q(is_public=True)
+        folder_ids = self.folder_ids_with(level)
+        if folder_ids:
+            condition |= Q(folder_id__in=folder_ids)
+        return queryset.filter(condition)
+
+    def filter_folders(self, queryset, level='read'):
+        """Restrict a Folder queryset to folders the user created or holds at least `level` on, in SQL"""
+        if self.unrestricted:
+            return queryset
+        if not self.user or not self.user.is_authenticated:
+            return queryset.none()
+        return queryset.filter(Q(created_by=self.user) | Q(id__in=self.folder_ids_with(level)))
+
+    def resolve_files(self, files):
+        """Compute access levels for a batch of File instances with one query"""
+        if self.unrestricted:
+            return {file_obj.pk: ADMIN_LEVEL for file_obj in files}
+
+        pending = [file_obj for file_obj in files if file_obj.pk not in self._file_levels]
+        if pending and self.user and self.user.is_authenticated:
+            direct = {}
+            grants = FilePermission.objects.filter(
+                active_grant_filter(),
+                user=self.user,
+                file_id__in=[file_obj.pk for file_obj in pending],
+            ).values_list('file_id', 'permission_type')
+            for file_id, permission_type in grants:
+                direct[file_id] = PERMISSION_LEVELS.get(permission_type, NO_ACCESS)
+
+            folder_levels = self.folder_levels()
+            for file_obj in pending:
+                level = max(
+                    direct.get(file_obj.pk, NO_ACCESS),
+                    folder_levels.get(file_obj.folder_id, NO_ACCESS),
+                    PERMISSION_LEVELS['read'] if file_obj.is_public else NO_ACCESS,
+                )
+                if file_obj.uploaded_by_id == self.user.pk:
+                    level = ADMIN_LEVEL
+                self._file_levels[file_obj.pk] = level
+        elif pending:
+            for file_obj in pending:
+                self._file_levels[file_obj.pk] = PERMISSION_LEVELS['read'] if file_obj.is_public else NO_ACCESS
+
+        return {file_obj.pk: self._file_levels[file_obj.pk] for file_obj in files}
+
+    def has_file_access(self, file_obj, level='read'):
+        return self.resolve_files([file_obj])[file_obj.pk] >= PERMISSION_LEVELS[level]
+
+    def has_folder_access(self, folder, level='read'):
+        """Check access to a folder; None stands for the root, which everyone may use"""
+        if folder is None or self.unrestricted:
+            return True
+        if not self.user or not self.user.is_authenticated:
+            return False
+        if folder.created_by_id == self.user.pk:
+            return True
+        return self.folder_levels().get(folder.pk, NO_ACCESS) >= PERMISSION_LEVELS[level]
+
+
+def get_access_resolver(request):
+    """Return the AccessResolver memoized on this request"""
+    resolver = getattr(request, '_access_resolver', None)
+    if resolver is None or resolver.user is not request.user:
+        resolver = AccessResolver(request.user)
+        request._access_resolver = resolver
+    return resolver
+
+
+def required_level(method):
+    if method in permissions.SAFE_METHODS:
+        return 'read'
+    if method == 'DELETE':
+        return 'admin'
+    return 'write'
+
+
+class HasFileAccess(permissions.BasePermission):
+    """Object-level check against the user's effective access to a File"""
+
+    def has_object_permission(self, request, view, obj):
+        return get_access_resolver(request).has_file_access(obj, required_level(request.method))
+
+
+class HasFolderAccess(permissions.BasePermission):
+    """Object-level check against the user's effective access to a Folder"""
+
+    def has_object_permission(self, request, view, obj):
+        # Folder metadata stays browsable; only changes need a grant
+        if request.method in permissions.SAFE_METHODS:
+            return True
+        return get_access_resolver(request).has_folder_access(obj, required_level(request.method))
+
+
+GRANT_BATCH_SIZE = 1000
+
+
+def grant_permissions(granted_by, users, files=(), folders=(), permission_type='read', expires_at=None):
+    """
+    Upsert grants for every user on every file and folder. Existing grants are
+    updated in place (and reactivated), so re-sharing is idempotent.
+    Returns the number of file and folder grants written.
+    """
+    file_grants = [
+        FilePermission(
+            file=file_obj,
+            user=user,
+            permission_type=permission_type,
+            granted_by=granted_by,
+            expires_at=expires_at,
+            is_active=True,
+        )
+        for file_obj in files for user in users
+    ]
+    folder_grants = [
+        FolderPermission(
+            folder=folder,
+            user=user,
+            permission_type=permission_type,
+            granted_by=granted_by,
+            expires_at=expires_at,
+            is_active=True,
+        )
+        for folder in folders for user in users
+    ]
+    update_fields = ['permission_type', 'granted_by', 'expires_at', 'is_active']
+
+    # Bump after commit so no request can re-cache the old grants
+    with batched_permission_changes(), transaction.atomic():
+        if file_grants:
+            FilePermission.objects.bulk_create(
+                file_grants,
+                batch_size=GRANT_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=['file', 'user'],
+                update_fields=update_fields,
+            )
+        if folder_grants:
+            FolderPermission.objects.bulk_create(
+                folder_grants,
+                batch_size=GRANT_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=['folder', 'user'],
+                update_fields=update_fields,
+            )
+        bump_permission_version()
+
+    return {'file_grants': len(file_grants), 'folder_grants': len(folder_grants)}
+
+
+def revoke_permissions(users, files=(), folders=()):
+    """Delete the grants of every user on the given files and folders"""
+    user_ids = [user.pk for user in users]
+    with batched_permission_changes(), transaction.atomic():
+        file_count = 0
+        folder_count = 0
+        if files:
+            file_count, _ = FilePermission.objects.filter(
+                user_id__in=user_ids,
+                file_id__in=[file_obj.pk for file_obj in files],
+            ).delete()
+        if folders:
+            folder_count, _ = FolderPermission.objects.filter(
+                user_id__in=user_ids,
+                folder_id__in=[folder.pk for folder in folders],
+            ).delete()
+        bump_permission_version()
+
+    return {'file_grants': file_count, 'folder_grants': folder_count}
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Folder, File, FileTag, FileVersion, FilePermission, FilePreview, WaitlistEntry, ContactSubmission, ContactUs, UserSecurityQuestions, PasswordResetCode, AdminLoginLog
+from .models import Folder, File, FileTag, FileVersion, FilePermission, FolderPermission, FilePreview, WaitlistEntry, ContactSubmission, ContactUs, UserSecurityQuestions, PasswordResetCode, AdminLoginLog, EmailOutbox
 
 
 class FileInline(admin.TabularInline):
@@ -64,6 +64,12 @@ class FilePermissionAdmin(admin.ModelAdmin):
     search_fields = ['file__name', 'user__username', 'granted_by__username']
 
 
+class FolderPermissionAdmin(admin.ModelAdmin):
+    list_display = ['folder', 'user', 'permission_type', 'granted_by', 'granted_at', 'is_expired']
+    list_filter = ['permission_type', 'granted_at', 'granted_by']
+    search_fields = ['folder__name', 'user__username', 'granted_by__username']
+
+
 class FilePreviewAdmin(admin.ModelAdmin):
     list_display = ['file', 'generated_at']
     list_filter = ['generated_at']
@@ -71,8 +77,8 @@ class FilePreviewAdmin(admin.ModelAdmin):
 
 
 class WaitlistEntryAdmin(admin.ModelAdmin):
-    list_display = ['entry_id', 'email', 'created_at']
-    list_filter = ['created_at']
+    list_display = ['entry_id', 'email', 'campaign', 'created_at']
+    list_filter = ['created_at', 'campaign']
     search_fields = ['email', 'entry_id']
     readonly_fields = ['entry_id', 'created_at']
 
@@ -92,17 +98,18 @@ class ContactUsAdmin(admin.ModelAdmin):
 
 
 class UserSecurityQuestionsAdmin(admin.ModelAdmin):
-    list_display = ['user', 'security_answer', 'professor_last_name', 'created_at']
+    list_display = ['user', 'created_at', 'updated_at']
     list_filter = ['created_at']
     search_fields = ['user__username', 'user__email']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['security_answer', 'professor_last_name', 'created_at', 'updated_at']
 
 
 class PasswordResetCodeAdmin(admin.ModelAdmin):
-    list_display = ['user', 'code', 'created_at', 'expires_at', 'is_used', 'is_valid']
+    list_display = ['user', 'created_at', 'expires_at', 'is_used', 'attempts', 'is_valid']
     list_filter = ['created_at', 'expires_at', 'is_used']
-    search_fields = ['user__username', 'user__email', 'code']
-    readonly_fields = ['created_at', 'expires_at', 'is_valid']
+    search_fields = ['user__username', 'user__email']
+    readonly_fields = ['code_hash', 'created_at', 'expires_at', 'attempts', 'is_valid']
+    list_select_related = ['user']
     
     def is_valid(self, obj):
         return obj.is_valid()
@@ -111,10 +118,11 @@ class PasswordResetCodeAdmin(admin.ModelAdmin):
 
 
 class AdminLoginLogAdmin(admin.ModelAdmin):
-    list_display = ['user', 'login_time', 'ip_address', 'success', 'failure_reason']
+    list_display = ['username', 'user', 'login_time', 'ip_address', 'success', 'failure_reason']
     list_filter = ['login_time', 'success', 'ip_address']
-    search_fields = ['user__username', 'ip_address', 'failure_reason']
-    readonly_fields = ['login_time', 'ip_address', 'user_agent', 'success', 'failure_reason']
+    search_fields = ['username', 'ip_address', 'failure_reason']
+    readonly_fields = ['username', 'user', 'login_time', 'ip_address', 'user_agent', 'success', 'failure_reason']
+    list_select_related = ['user']
     ordering = ['-login_time']
     
     def has_add_permission(self, request):
@@ -127,11 +135,24 @@ class AdminLoginLogAdmin(admin.ModelAdmin):
         return request.user.is_superuser  # Only superusers can delete logs
 
 
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ['to_email', 'subject', 'status', 'attempts', 'created_at', 'sent_at', 'next_attempt_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['to_email', 'subject', 'last_error']
+    readonly_fields = ['to_email', 'from_email', 'subject', 'status', 'attempts', 'next_attempt_at', 'last_error', 'created_at', 'sent_at']
+    exclude = ['body']  # may hold a reset code
+    ordering = ['-created_at']
+    
+    def has_add_permission(self, request):
+        return False
+
+
 admin.site.register(Folder, FolderAdmin)
 admin.site.register(File, FileAdmin)
 admin.site.register(FileTag, FileTagAdmin)
 admin.site.register(FileVersion, FileVersionAdmin)
 admin.site.register(FilePermission, FilePermissionAdmin)
+admin.site.register(FolderPermission, FolderPermissionAdmin)
 admin.site.register(FilePreview, FilePreviewAdmin)
 admin.site.register(WaitlistEntry, WaitlistEntryAdmin)
 admin.site.register(ContactSubmission, ContactSubmissionAdmin)
@@ -139,3 +160,4 @@ admin.site.register(ContactUs, ContactUsAdmin)
 admin.site.register(UserSecurityQuestions, UserSecurityQuestionsAdmin)
 admin.site.register(PasswordResetCode, PasswordResetCodeAdmin)
 admin.site.register(AdminLoginLog, AdminLoginLogAdmin)
+admin.site.register(EmailOutbox, EmailOutboxAdmin)
@@ -13,4 +13,49 @@ class MainAppConfig(AppConfig):
             if created:
                 Token.objects.get_or_create(user=instance)
 
-        post_save.connect(create_auth_token, sender=User)
+        post_save.connect(create_auth_token, sender=User, weak=False, dispatch_uid='create-auth-token')
+
+        # Drop cached access data whenever grants or the folder tree change
+        from django.db.models.signals import post_delete
+        from .access import bump_permission_version
+        from .models import FilePermission, FolderPermission, Folder
+
+        for model in (FilePermission, FolderPermission, Folder):
+            post_save.connect(bump_permission_version, sender=model, dispatch_uid=f'permissions-save-{model.__name__}')
+            post_delete.connect(bump_permission_version, sender=model, dispatch_uid=f'permissions-delete-{model.__name__}')
+
+        # Keep the denormalized per-tag file counts current
+        from django.db.models.signals import m2m_changed, pre_delete
+        from .models import File
+        from . import tagging
+
+        m2m_changed.connect(tagging.tags_changed, sender=File.tags.through, dispatch_uid='tag-counts-m2m')
+        pre_delete.connect(tagging.file_pre_delete, sender=File, dispatch_uid='tag-counts-pre-delete')
+        post_delete.connect(tagging.file_post_delete, sender=File, dispatch_uid='tag-counts-post-delete')
+
+        # Cached JWT users must not outlive a password change or deactivation
+        from .authentication import invalidate_cached_user
+
+        post_save.connect(invalidate_cached_user, sender=User, dispatch_uid='auth-cache-save-user')
+        post_delete.connect(invalidate_cached_user, sender=User, dispatch_uid='auth-cache-delete-user')
+
+        # Per-worker counters for the connection stats endpoint
+        from django.core.signals import request_started
+        from django.db.backends.signals import connection_created
+        from . import db
+
+        connection_created.connect(db.connection_opened, dispatch_uid='db-stats-connection-created')
+        request_started.connect(db.request_started, dispatch_uid='db-stats-request-started')
+
+        # Per-request query timing for main_app.metrics
+        from .metrics import install_query_timer
+
+        connection_created.connect(install_query_timer, dispatch_uid='metrics-query-timer')
+
+        # Send outbox retries from every server process, not only from those that queue email
+        from django.conf import settings
+
+        if settings.EMAIL_OUTBOX_WORKER:
+            from .outbox import worker as outbox_worker
+
+            request_started.connect(outbox_worker.start, dispatch_uid='outbox-worker-start')
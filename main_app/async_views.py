@@ -0,0 +1,299 @@
+"""
+Async views for I/O-bound endpoints
+
+Served under /api/async/. Under an ASGI server (see gunicorn.conf.py,
+SERVER_MODE=asgi) a slow client costs an idle coroutine instead of a whole
+worker: request bodies are received by the event loop before the view runs,
+files are streamed chunk by chunk from the storage in a thread pool, and
+ZIP archives are built and sent incrementally instead of in a temp file.
+
+The sync endpoints stay the default; these mirror their behaviour and
+responses. They also work under WSGI, just without the concurrency benefit:
+downloads are then streamed from plain iterators on the worker thread.
+"""
+import json
+import mimetypes
+import zipfile
+
+from asgiref.sync import sync_to_async
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed
+
+from .access import AccessResolver
+from .authentication import HeaderSchemeAuthentication
+from .models import File, Folder
+from .ratelimit import apply_headers, check_rate_limit
+from .serializers import ContactUsSerializer, WaitlistEntrySerializer
+
+
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+def error_response(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+async def authenticate_request(request):
+    """Authenticate from the Authorization header; returns an error response on failure"""
+    try:
+        result = await sync_to_async(HeaderSchemeAuthentication().authenticate)(request)
+    except AuthenticationFailed as e:
+        detail = e.detail.get('detail', e.detail) if isinstance(e.detail, dict) else e.detail
+        return error_response(str(detail), 401)
+    if result is None:
+        return error_response('Authentication credentials were not provided.', 401)
+    request.user, request.auth = result
+    return None
+
+
+async def enforce_rate_limit(request, key_prefix, limit, period, key='user_or_ip'):
+    """Returns (result, error response or None)"""
+    result = await sync_to_async(check_rate_limit)(request, key_prefix, limit, period, key)
+    if not result.allowed:
+        response = JsonResponse(
+            {'error': 'Rate limit exceeded. Please try again later.', 'retry_after': result.retry_after},
+            status=429,
+        )
+        return result, apply_headers(response, result)
+    return result, None
+
+
+def iter_storage_file(name, chunk_size=FILE_CHUNK_SIZE):
+    """Read a stored file in chunks"""
+    with default_storage.open(name, 'rb') as handle:
+        while True:
+            chunk = handle.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+class ZipStream:
+    """Write-only, unseekable sink for zipfile that hands back what was written"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_zip(entries):
+    """
+    Stream a ZIP of (arcname, storage name or None, placeholder text) entries.
+    Entries without a storage name are written as placeholder text files.
+    """
+    sink = ZipStream()
+    archive = zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED)
+    try:
+        for arcname, storage_name, placeholder in entries:
+            if storage_name is None:
+                archive.writestr(arcname, placeholder)
+            else:
+                with archive.open(arcname, 'w', force_zip64=True) as member:
+                    for chunk in iter_storage_file(storage_name):
+                        member.write(chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        archive.close()
+    yield sink.drain()
+
+
+async def aiter_in_thread(iterator):
+    """
+    Step a sync iterator in the thread pool, so storage reads and compression
+    never block the event loop
+    """
+    done = object()
+    try:
+        while True:
+            item = await sync_to_async(next, thread_sensitive=False)(iterator, done)
+            if item is done:
+                break
+            yield item
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(close, thread_sensitive=False)()
+
+
+def streaming_content(request, iterator):
+    """
+    The response body for `iterator`: stepped in a thread under ASGI. Under
+    WSGI the iterator is returned as is; Django would read an async one into
+    memory before sending any of it.
+    """
+    if isinstance(request, ASGIRequest):
+        return aiter_in_thread(iterator)
+    return iterator
+
+
+def collect_folder_zip_entries(folder, resolver):
+    """
+    ZIP layout of FolderDownloadView: the folder's own files at the top level,
+    subfolder files under `<folder>/<subfolder>/...`. Loads every readable file
+    in the subtree with one query.
+    """
+    paths = {folder.id: ''}
+    pending = list(
+        Folder.objects.filter(id__in=folder.get_descendant_ids(include_self=False)).values('id', 'name', 'parent_id')
+    )
+    while pending:
+        remaining = []
+        for sub in pending:
+            parent_path = paths.get(sub['parent_id'])
+            if parent_path is None:
+                remaining.append(sub)
+                continue
+            paths[sub['id']] = f"{parent_path or folder.name}/{sub['name']}"
+        if len(remaining) == len(pending):
+            break
+        pending = remaining
+
+    files = resolver.filter_files(File.objects.filter(folder_id__in=paths.keys())).order_by('folder_id', 'name')
+    entries = []
+    for file_obj in files.only('name', 'file', 'folder_id', 'file_size'):
+        prefix = paths[file_obj.folder_id]
+        arcname = f"{prefix}/{file_obj.name}" if prefix else file_obj.name
+        if file_obj.file and default_storage.exists(file_obj.file.name):
+            entries.append((arcname, file_obj.file.name, None))
+        elif file_obj.file and not prefix:
+            placeholder = (
+                f"File '{file_obj.name}' was not found in storage.\n"
+                f"This file may have been deleted or the upload failed.\n"
+                f"Original path: {file_obj.file.name}\n"
+                f"File size in database: {file_obj.get_file_size_display()}"
+            )
+            entries.append((f"MISSING_{file_obj.name}.txt", None, placeholder))
+    return entries
+
+
+async def file_download(request, pk):
+    """Async FileDownloadView: streams the file instead of reading it into memory"""
+    if request.method != 'GET':
+        return error_response('Method not allowed', 405)
+    error = await authenticate_request(request)
+    if error:
+        return error
+    limit, error = await enforce_rate_limit(request, 'file_download', 200, 3600)
+    if error:
+        return error
+
+    resolver = AccessResolver(request.user)
+    readable = await sync_to_async(resolver.filter_files)(File.objects.all())
+    file_obj = await readable.filter(id=pk).afirst()
+    if file_obj is None:
+        return error_response('Not found.', 404)
+    if not file_obj.file:
+        return error_response('File not found', 404)
+    if not await sync_to_async(default_storage.exists, thread_sensitive=False)(file_obj.file.name):
+        return error_response('File not found on disk', 404)
+
+    content_type, _ = mimetypes.guess_type(file_obj.file.name)
+    response = StreamingHttpResponse(
+        streaming_content(request, iter_storage_file(file_obj.file.name)),
+        content_type=content_type or 'application/octet-stream',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{file_obj.name}"'
+    size = await sync_to_async(default_storage.size, thread_sensitive=False)(file_obj.file.name)
+    response['Content-Length'] = str(size)
+    return apply_headers(response, limit)
+
+
+async def folder_download(request, pk):
+    """Async FolderDownloadView: the ZIP is streamed while it is built"""
+    if request.method != 'GET':
+        return error_response('Method not allowed', 405)
+    error = await authenticate_request(request)
+    if error:
+        return error
+    limit, error = await enforce_rate_limit(request, 'folder_download', 50, 3600)
+    if error:
+        return error
+
+    resolver = AccessResolver(request.user)
+    readable = await sync_to_async(resolver.filter_folders)(Folder.objects.all())
+    folder = await readable.filter(pk=pk).afirst()
+    if folder is None:
+        return error_response('Not found.', 404)
+
+    entries = await sync_to_async(collect_folder_zip_entries)(folder, resolver)
+    response = StreamingHttpResponse(streaming_content(request, iter_zip(entries)), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{folder.name}.zip"'
+    return apply_headers(response, limit)
+
+
+@csrf_exempt
+async def file_upload(request):
+    """
+    Async entry point for FileUploadView. Under ASGI the multipart body has
+    been received by the event loop by now, so a slow upload never holds a
+    thread; storing the file then runs the sync view's logic in a thread.
+    """
+    if request.method != 'POST':
+        return error_response('Method not allowed', 405)
+    from .views import FileUploadView
+
+    response = await sync_to_async(FileUploadView.as_view())(request)
+    # DRF responses render lazily; render in the thread pool too
+    return await sync_to_async(response.render)()
+
+
+async def _create_from_json(request, serializer_class, key_prefix, limit):
+    try:
+        data = json.loads(request.body or b'{}') if request.content_type == 'application/json' else request.POST
+    except (ValueError, UnicodeDecodeError):
+        return None, None, error_response('Invalid JSON body', 400)
+
+    rate, error = await enforce_rate_limit(request, key_prefix, limit, 3600, key='ip')
+    if error:
+        return None, None, error
+
+    serializer = serializer_class(data=data)
+    if not await sync_to_async(serializer.is_valid)():
+        return None, rate, apply_headers(JsonResponse(serializer.errors, status=400), rate)
+    await sync_to_async(serializer.save)()
+    return serializer, rate, None
+
+
+@csrf_exempt
+async def waitlist_signup(request):
+    """Async WaitlistView"""
+    if request.method != 'POST':
+        return error_response('Method not allowed', 405)
+    serializer, rate, error = await _create_from_json(request, WaitlistEntrySerializer, 'waitlist', 10)
+    if error:
+        return error
+    response = JsonResponse({
+        'message': 'Successfully added to waitlist!',
+        'email': serializer.data['email'],
+    }, status=201)
+    return apply_headers(response, rate)
+
+
+@csrf_exempt
+async def contact_submit(request):
+    """Async ContactView"""
+    if request.method != 'POST':
+        return error_response('Method not allowed', 405)
+    serializer, rate, error = await _create_from_json(request, ContactUsSerializer, 'contact', 5)
+    if error:
+        return error
+    return apply_headers(JsonResponse({'message': 'Thanks for reaching out!'}, status=201), rate)
@@ -0,0 +1,164 @@
+"""
+Admin login audit log
+
+Login attempts are recorded as plain dicts on an in-process BatchBuffer and
+written with one bulk_create per batch by a background thread, so the login
+path does no database work for the audit log, and a brute-force burst costs
+one INSERT per batch instead of a User lookup plus an INSERT per attempt.
+
+The username is stored as it was typed. For failed attempts the matching
+user (if any) is resolved once per batch with a single query; unknown
+usernames are stored with user=None.
+
+login_summary computes the analytics for a filtered set of log rows in one
+aggregate query.
+"""
+from datetime import timedelta
+from ipaddress import ip_address
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from .buffering import BatchBuffer
+from .models import AdminLoginLog
+
+
+MAX_USERNAME_LENGTH = 150
+MAX_USER_AGENT_LENGTH = 1000
+MAX_FAILURE_REASON_LENGTH = 255
+
+
+def record_admin_login(username, request=None, success=True, failure_reason='', user_id=None):
+    """Queue an admin login attempt; returns False if the buffer was full and it was dropped"""
+    ip = None
+    user_agent = ''
+    if request is not None:
+        ip = AdminLoginLog.get_client_ip(request)
+        user_agent = request.META.get('HTTP_USER_AGENT', '')
+        try:
+            ip = str(ip_address(ip.strip())) if ip else None
+        except ValueError:
+            ip = None
+    return login_log_buffer.add({
+        'username': (username or '')[:MAX_USERNAME_LENGTH],
+        'user_id': user_id,
+        'login_time': timezone.now(),
+        'ip_address': ip,
+        'user_agent': user_agent[:MAX_USER_AGENT_LENGTH],
+        'success': success,
+        'failure_reason': (failure_reason or '')[:MAX_FAILURE_REASON_LENGTH],
+    })
+
+
+def store_login_events(events):
+    """BatchBuffer flush function: one user lookup and one INSERT per batch"""
+    unresolved = {event['username'] for event in events if event['user_id'] is None and event['username']}
+    user_ids = dict(User.objects.filter(username__in=unresolved).values_list('username', 'id')) if unresolved else {}
+    AdminLoginLog.objects.bulk_create([
+        AdminLoginLog(**{**event, 'user_id': event['user_id'] or user_ids.get(event['username'])})
+        for event in events
+    ])
+
+
+login_log_buffer = BatchBuffer(
+    'admin-login-log',
+    store_login_events,
+    flush_size=500,
+    flush_interval=settings.ADMIN_LOGIN_LOG_FLUSH_INTERVAL,
+    max_pending=settings.ADMIN_LOGIN_LOG_BUFFER_SIZE,
+)
+
+
+SUMMARY_INTERVALS = ('hour', 'day')
+MAX_SUMMARY_DAYS = 366
+
+
+def filter_login_logs(queryset, params):
+    """
+    Apply the `days`, `user_id`, `username`, `ip` and `success` (or legacy
+    `success_only`) query parameters; raises ValueError for invalid values.
+    """
+    days = int(params.get('days', 30))
+    if not 0 < days <= MAX_SUMMARY_DAYS:
+        raise ValueError(f'days must be between 1 and {MAX_SUMMARY_DAYS}')
+    queryset = queryset.filter(login_time__gte=timezone.now() - timedelta(days=days))
+    if params.get('user_id'):
+        queryset = queryset.filter(user_id=int(params['user_id']))
+    if params.get('username'):
+        queryset = queryset.filter(username=params['username'])
+    if params.get('ip'):
+        queryset = queryset.filter(ip_address=str(ip_address(params['ip'])))
+    success = params.get('success')
+    if success is None and params.get('success_only', 'false').lower() == 'true':
+        success = 'true'
+    if success is not None:
+        if success.lower() not in ('true', 'false'):
+            raise ValueError('success must be true or false')
+        queryset = queryset.filter(success=success.lower() == 'true')
+    return queryset
+
+
+# GROUPING() is a bit mask of the columns *not* grouped in a row's grouping set
+GRAND_TOTAL, BY_USERNAME, BY_IP, BY_BUCKET = 0b111, 0b011, 0b101, 0b110
+
+SUMMARY_SQL = """
+    SELECT grouping_set, username, user_id, ip_address, bucket, total, succeeded, failed
+    FROM (
+        SELECT
+            GROUPING(username, ip_address, bucket) AS grouping_set,
+            username,
+            MAX(user_id) AS user_id,
+            HOST(ip_address) AS ip_address,
+            bucket,
+            COUNT(*) AS total,
+            COUNT(*) FILTER (WHERE success) AS succeeded,
+            COUNT(*) FILTER (WHERE NOT success) AS failed,
+            ROW_NUMBER() OVER (
+                PARTITION BY GROUPING(username, ip_address, bucket)
+                ORDER BY COUNT(*) FILTER (WHERE NOT success) DESC, COUNT(*) DESC, username, ip_address
+            ) AS position
+        FROM ({logs}) AS logs
+        GROUP BY GROUPING SETS ((), (username), (ip_address), (bucket))
+    ) AS grouped
+    WHERE position <= %s OR grouping_set IN ({grand_total}, {by_bucket})
+    ORDER BY grouping_set, bucket, position
+"""
+
+
+def login_summary(queryset, interval='hour', limit=10):
+    """
+    Totals, success/failure split, the `limit` usernames and IPs with the
+    most failures, and per-`interval` buckets for the given log rows, from a
+    single query (one pass over the rows, using GROUPING SETS).
+    """
+    if interval not in SUMMARY_INTERVALS:
+        raise ValueError(f'interval must be one of {", ".join(SUMMARY_INTERVALS)}')
+    logs = (
+        queryset.order_by()
+        .annotate(bucket=Trunc('login_time', interval))
+        .values('username', 'user_id', 'ip_address', 'success', 'bucket')
+    )
+    logs_sql, logs_params = logs.query.sql_with_params()
+    sql = SUMMARY_SQL.format(logs=logs_sql, grand_total=GRAND_TOTAL, by_bucket=BY_BUCKET)
+
+    summary = {'total': 0, 'successful': 0, 'failed': 0, 'interval': interval, 'by_username': [], 'by_ip': [], 'buckets': []}
+    current_tz = timezone.get_current_timezone() if settings.USE_TZ else None
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, (*logs_params, limit))
+        for grouping_set, username, user_id, ip, bucket, total, succeeded, failed in cursor.fetchall():
+            counts = {'total': total, 'successful': succeeded, 'failed': failed}
+            if grouping_set == GRAND_TOTAL:
+                summary.update(total=total, successful=succeeded, failed=failed)
+            elif grouping_set == BY_USERNAME:
+                summary['by_username'].append({'username': username, 'user_id': user_id, **counts})
+            elif grouping_set == BY_IP:
+                summary['by_ip'].append({'ip_address': ip, **counts})
+            elif grouping_set == BY_BUCKET:
+                # Trunc returns local wall-clock times without a zone from raw SQL
+                if current_tz is not None and timezone.is_naive(bucket):
+                    bucket = timezone.make_aware(bucket, current_tz)
+                summary['buckets'].append({'start': bucket, **counts})
+    return summary
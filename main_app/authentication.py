@@ -0,0 +1,130 @@
+"""
+Request authentication
+
+CachedJWTAuthentication resolves the user from the `auth` cache namespace
+instead of the database on every request. Tokens carry a hash of the user's
+password hash (simplejwt's CHECK_REVOKE_TOKEN claim), so a password change
+revokes older tokens, and the cached user is dropped whenever the User row is
+saved or deleted (password changes and resets, deactivation, ...).
+
+Access tokens revoked at logout are rejected using the per-worker
+revocation filter in main_app.revocation.
+
+HeaderSchemeAuthentication picks the one authentication class that matches the
+Authorization header scheme, rather than trying each class in turn.
+"""
+import copy
+import threading
+import time
+
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import BaseAuthentication, TokenAuthentication, get_authorization_header
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import get_cache
+from .revocation import is_token_revoked
+
+
+USER_CACHE_TIMEOUT = 300
+# Users are also kept in-process for a few seconds, so hot paths skip even a
+# shared-cache round trip (a query, with the database cache backend). Other
+# workers only see an invalidation once this expires. Each request gets its own
+# copy, since views may modify request.user.
+LOCAL_USER_TIMEOUT = 5
+LOCAL_USER_MAX_ENTRIES = 1000
+
+auth_cache = get_cache('auth')
+
+_local_users = {}
+_local_lock = threading.Lock()
+
+
+def user_cache_key(user_id):
+    return f'user:{user_id}'
+
+
+def _get_local_user(user_id):
+    entry = _local_users.get(user_id)
+    if entry is not None and entry[1] > time.monotonic():
+        return copy.copy(entry[0])
+    return None
+
+
+def _set_local_user(user_id, user):
+    with _local_lock:
+        if len(_local_users) >= LOCAL_USER_MAX_ENTRIES:
+            _local_users.clear()
+        _local_users[user_id] = (copy.copy(user), time.monotonic() + LOCAL_USER_TIMEOUT)
+
+
+def invalidate_cached_user(sender=None, instance=None, **kwargs):
+    """Drop a user from the auth cache (usable directly as a signal receiver)"""
+    if instance is not None and instance.pk is not None:
+        with _local_lock:
+            _local_users.pop(instance.pk, None)
+        auth_cache.delete(user_cache_key(instance.pk))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that serves the user from cache, keyed by user id"""
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        # In-memory Bloom filter check; see main_app.revocation
+        if is_token_revoked(validated_token):
+            raise InvalidToken(_('Token has been revoked'))
+        return validated_token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        user = _get_local_user(user_id)
+        if user is None:
+            cache_key = user_cache_key(user_id)
+            user = auth_cache.get(cache_key)
+            if user is None:
+                try:
+                    user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+                except self.user_model.DoesNotExist:
+                    raise AuthenticationFailed(_('User not found'), code='user_not_found')
+                auth_cache.set(cache_key, user, USER_CACHE_TIMEOUT)
+            _set_local_user(user_id, user)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        # Tokens issued before the version claim was enabled have no claim; they expire on their own
+        token_version = validated_token.get(api_settings.REVOKE_TOKEN_CLAIM)
+        if token_version is not None and token_version != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+
+        return user
+
+
+class HeaderSchemeAuthentication(BaseAuthentication):
+    """
+    Dispatch on the Authorization header scheme: `Bearer` goes to
+    CachedJWTAuthentication and `Token` to DRF's TokenAuthentication.
+    """
+    schemes = {
+        b'bearer': CachedJWTAuthentication,
+        b'token': TokenAuthentication,
+    }
+
+    def authenticate(self, request):
+        header = get_authorization_header(request).split()
+        if not header:
+            return None
+        authentication_class = self.schemes.get(header[0].lower())
+        if authentication_class is None:
+            return None
+        return authentication_class().authenticate(request)
+
+    def authenticate_header(self, request):
+        return CachedJWTAuthentication().authenticate_header(request)
@@ -0,0 +1,46 @@
+"""
+Login backend accepting a username or an email address
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Lower
+
+
+UserModel = get_user_model()
+
+
+class UsernameOrEmailBackend(ModelBackend):
+    """
+    Resolve the login identifier as a username or a case-insensitive email
+    with one indexed query (auth_user has a functional index on lower(email)),
+    then check the password once. Unknown identifiers still run one dummy hash
+    so response times don't reveal which accounts exist.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if not username or password is None:
+            return None
+
+        identifier = username.strip()
+        user = (
+            UserModel._default_manager
+            .annotate(email_lower=Lower('email'))
+            .filter(Q(username=identifier) | Q(email_lower=identifier.lower()))
+            # An exact username match wins over an email match; then the oldest account
+            .order_by(
+                Case(When(username=identifier, then=Value(0)), default=Value(1), output_field=IntegerField()),
+                'pk',
+            )
+            .first()
+        )
+
+        if user is None:
+            # Same cost as a real check (see ModelBackend.authenticate)
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,248 @@
+"""
+Brute-force protection for the login endpoints
+
+Failed logins are counted per username, per client IP and per subnet (/24
+for IPv4, /64 for IPv6) over BRUTEFORCE_WINDOW seconds. When a counter
+reaches its limit, that username, IP or subnet is locked out for
+BRUTEFORCE_LOCKOUT_SECONDS, doubling with every further lockout (up to
+BRUTEFORCE_MAX_LOCKOUT_SECONDS) until it has been quiet for a day. IP and
+subnet lockouts are skipped when the resolved IP is not a public address or
+is one of BRUTEFORCE_TRUSTED_PROXIES: it is shared by everyone behind it.
+
+The check runs before authenticate(), so a locked-out attempt never reaches
+the password hasher. State lives in the rate limit backend (see
+main_app.ratelimit), shared between workers; each worker also remembers
+the lockouts it has seen for up to BRUTEFORCE_LOCAL_CACHE_SECONDS, so
+repeated attempts during a lockout are rejected from memory.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import Counter
+from ipaddress import ip_address, ip_network
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.response import Response
+
+from .ratelimit import get_backend
+
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'bf'
+SUBNET_PREFIXES = {4: 24, 6: 64}
+# Lockout levels are forgotten after this long without a new lockout
+LEVEL_TTL = 86400
+
+
+def limits():
+    return {
+        'username': settings.BRUTEFORCE_USERNAME_LIMIT,
+        'ip': settings.BRUTEFORCE_IP_LIMIT,
+        'subnet': settings.BRUTEFORCE_SUBNET_LIMIT,
+    }
+
+
+def trusted_proxies():
+    return [ip_network(value.strip(), strict=False) for value in settings.BRUTEFORCE_TRUSTED_PROXIES]
+
+
+def is_shared_address(address):
+    """
+    Whether an address stands for many clients: a non-public one (private,
+    loopback, carrier-grade NAT..., usually the proxy itself when the proxy
+    chain is misconfigured) or one of BRUTEFORCE_TRUSTED_PROXIES. Locking it
+    out would lock out everyone behind it.
+    """
+    if getattr(address, 'ipv4_mapped', None):
+        address = address.ipv4_mapped
+    if not address.is_global:
+        return True
+    return any(address in network for network in trusted_proxies())
+
+
+def login_keys(username=None, ip=None):
+    """(scope, value, key) for each scope that applies to an attempt"""
+    keys = []
+    username = (username or '').strip().lower()
+    if username:
+        digest = hashlib.sha256(username.encode()).hexdigest()[:32]
+        keys.append(('username', username, f'{KEY_PREFIX}:user:{digest}'))
+    try:
+        address = ip_address(ip) if ip else None
+    except ValueError:
+        address = None
+    if address is not None and not is_shared_address(address):
+        subnet = ip_network(f'{address}/{SUBNET_PREFIXES[address.version]}', strict=False)
+        keys.append(('ip', str(address), f'{KEY_PREFIX}:ip:{address}'))
+        keys.append(('subnet', str(subnet), f'{KEY_PREFIX}:net:{subnet}'))
+    return keys
+
+
+class LocalLockouts:
+    """Lockouts this worker has seen, each kept for at most BRUTEFORCE_LOCAL_CACHE_SECONDS"""
+
+    max_entries = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        recheck_at, locked_until = entry
+        if recheck_at <= now:
+            self.discard(key)
+            return None
+        return locked_until
+
+    def set(self, key, locked_until, now):
+        # Re-read from the shared store now and then, so an unlock from another worker applies
+        recheck_at = min(locked_until, now + settings.BRUTEFORCE_LOCAL_CACHE_SECONDS)
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+            self._entries[key] = (recheck_at, locked_until)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class BruteForceStats:
+    """Per-process counters, exported on /metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.blocked = Counter()
+        self.lockouts = Counter()
+
+    def add(self, failures=0, blocked=None, lockout=None):
+        with self._lock:
+            self.failures += failures
+            if blocked:
+                self.blocked[blocked] += 1
+            if lockout:
+                self.lockouts[lockout] += 1
+
+    def render(self):
+        """Prometheus text exposition format"""
+        with self._lock:
+            lines = [
+                '# HELP login_failures_total Failed login attempts that reached password checking',
+                '# TYPE login_failures_total counter',
+                f'login_failures_total {self.failures}',
+                '# HELP login_blocked_total Login attempts rejected by a brute-force lockout, by scope',
+                '# TYPE login_blocked_total counter',
+            ]
+            lines += [f'login_blocked_total{{scope="{scope}"}} {self.blocked[scope]}' for scope in limits()]
+            lines += [
+                '# HELP login_lockouts_total Brute-force lockouts started, by scope',
+                '# TYPE login_lockouts_total counter',
+            ]
+            lines += [f'login_lockouts_total{{scope="{scope}"}} {self.lockouts[scope]}' for scope in limits()]
+        return '\n'.join(lines) + '\n'
+
+
+local_lockouts = LocalLockouts()
+stats = BruteForceStats()
+
+
+def check_login(username, ip):
+    """Seconds until this attempt may be made, or 0 if it may go ahead"""
+    if not settings.BRUTEFORCE_ENABLED:
+        return 0
+    now = time.time()
+    backend = get_backend()
+    retry_after, blocked_scope = 0, None
+    for scope, _, key in login_keys(username, ip):
+        locked_until = local_lockouts.get(key, now)
+        if locked_until is None:
+            locked_until = backend.get_state(f'{key}:lock')
+            if locked_until and locked_until > now:
+                local_lockouts.set(key, locked_until, now)
+        if locked_until and locked_until - now > retry_after:
+            retry_after, blocked_scope = locked_until - now, scope
+    if blocked_scope is None:
+        return 0
+    stats.add(blocked=blocked_scope)
+    return max(1, math.ceil(retry_after))
+
+
+def record_failure(username, ip):
+    """Count a failed login; locks out every scope that reaches its limit"""
+    if not settings.BRUTEFORCE_ENABLED:
+        return
+    now = time.time()
+    backend = get_backend()
+    scope_limits = limits()
+    for scope, value, key in login_keys(username, ip):
+        if backend.incr(f'{key}:fail', settings.BRUTEFORCE_WINDOW) < scope_limits[scope]:
+            continue
+        level = backend.incr(f'{key}:level', LEVEL_TTL)
+        duration = min(settings.BRUTEFORCE_LOCKOUT_SECONDS * 2 ** (level - 1), settings.BRUTEFORCE_MAX_LOCKOUT_SECONDS)
+        locked_until = now + duration
+        backend.update(f'{key}:lock', lambda state: (locked_until, None), duration)
+        # The next lockout takes another full set of failures (after this one ends)
+        backend.delete(f'{key}:fail')
+        local_lockouts.set(key, locked_until, now)
+        stats.add(lockout=scope)
+        logger.warning('Login lockout', extra={'scope': scope, 'value': value, 'lockout_number': level, 'seconds': duration})
+    stats.add(failures=1)
+
+
+def record_success(username, ip):
+    """A successful login clears the username's and IP's failure counts"""
+    if not settings.BRUTEFORCE_ENABLED:
+        return
+    get_backend().delete(*[
+        f'{key}:fail' for scope, _, key in login_keys(username, ip) if scope != 'subnet'
+    ])
+
+
+def lockout_status(username=None, ip=None):
+    backend = get_backend()
+    now = time.time()
+    scope_limits = limits()
+    entries = []
+    for scope, value, key in login_keys(username, ip):
+        locked_until = backend.get_state(f'{key}:lock')
+        locked = bool(locked_until and locked_until > now)
+        entries.append({
+            'scope': scope,
+            'value': value,
+            'failures': backend.get(f'{key}:fail'),
+            'limit': scope_limits[scope],
+            'lockouts': backend.get(f'{key}:level'),
+            'locked': locked,
+            'retry_after': math.ceil(locked_until - now) if locked else 0,
+        })
+    return entries
+
+
+def unlock(username=None, ip=None):
+    """Clear failures, lockouts and lockout levels for a username and/or an IP and its subnet"""
+    keys = login_keys(username, ip)
+    get_backend().delete(*[f'{key}:{suffix}' for _, _, key in keys for suffix in ('fail', 'lock', 'level')])
+    for _, _, key in keys:
+        local_lockouts.discard(key)
+    return [{'scope': scope, 'value': value} for scope, value, _ in keys]
+
+
+def lockout_response(retry_after):
+    response = Response(
+        {'error': 'Too many failed login attempts. Please try again later.', 'retry_after': retry_after},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+    )
+    response['Retry-After'] = str(retry_after)
+    return response
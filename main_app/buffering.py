@@ -0,0 +1,107 @@
+"""
+In-process write buffers
+
+BatchBuffer collects items from request threads and hands them to a flush
+function in batches, from a background thread: as soon as `flush_size`
+items are waiting, otherwise every `flush_interval` seconds, and at exit.
+Request threads never write to the database themselves. At most
+`max_pending` items are held; beyond that new items are dropped and
+counted, so a burst can't grow memory without bound.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+from django.db import close_old_connections, connection
+
+
+logger = logging.getLogger(__name__)
+
+
+class BatchBuffer:
+    def __init__(self, name, flush_func, flush_size=500, flush_interval=5.0, max_pending=10000):
+        self.name = name
+        self.flush_func = flush_func
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.dropped = 0
+        self.flushed = 0
+        self._items = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread_pid = None
+
+    def add(self, item):
+        """Queue an item; returns False if it was dropped because the buffer is full"""
+        self._ensure_thread()
+        with self._lock:
+            if len(self._items) >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._items.append(item)
+            full = len(self._items) >= self.flush_size
+        if full:
+            self._wakeup.set()
+        return True
+
+    def extend(self, items):
+        """Queue several items; returns how many were accepted"""
+        self._ensure_thread()
+        with self._lock:
+            room = max(0, self.max_pending - len(self._items))
+            accepted = list(items)[:room]
+            self.dropped += len(items) - len(accepted)
+            self._items.extend(accepted)
+            full = len(self._items) >= self.flush_size
+        if full:
+            self._wakeup.set()
+        return len(accepted)
+
+    def pending(self):
+        return len(self._items)
+
+    def flush(self):
+        """Write out everything pending, in the calling thread"""
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch, self._items = self._items[:self.flush_size], self._items[self.flush_size:]
+                if not batch:
+                    return
+                try:
+                    self.flush_func(batch)
+                    self.flushed += len(batch)
+                except Exception:
+                    # Buffered writes are best effort; losing a batch must not kill the flusher
+                    logger.exception('Failed to flush %s items from the %s buffer', len(batch), self.name)
+
+    def _ensure_thread(self):
+        # Started lazily, and again after a fork, since threads don't survive forks
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            thread = threading.Thread(target=self._run, name=f'{self.name}-flusher', daemon=True)
+            thread.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if not self._items:
+                continue
+            close_old_connections()
+            try:
+                self.flush()
+            finally:
+                # The flusher is idle most of the time; don't hold a connection meanwhile
+                connection.close()
+            # Let a burst accumulate into the next batch instead of flushing item by item
+            time.sleep(0.05)
@@ -0,0 +1,176 @@
+"""
+Namespaced caches with hit/miss statistics
+
+Each subsystem uses its own cache alias (see CACHE_NAMESPACES in settings),
+so keys never collide and one namespace can be cleared without touching the
+others. Reads through `get_cache(namespace)` are counted in-process and
+flushed periodically into the default cache, so `cache_stats()` reports
+totals across all workers.
+
+Version counters that invalidate whole families of cached values (access
+levels, revoked tokens) live in the CacheVersion table rather than in a
+cache: incr() is not atomic on the database cache, so concurrent bumps
+could be lost and stale entries outlive a change.
+"""
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+
+from .metrics import record_cache as record_request_cache
+from .models import CacheVersion
+
+
+STATS_FLUSH_INTERVAL = 10  # seconds
+STATS_FLUSH_OPERATIONS = 100
+STATS_KEY = 'cache-stats:{namespace}:{field}'
+STATS_FIELDS = ('hits', 'misses')
+
+_MISSING = object()
+
+
+class CacheStats:
+    """Hit/miss counters for one namespace, buffered locally between flushes"""
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self.local = dict.fromkeys(STATS_FIELDS, 0)
+        self._pending = dict.fromkeys(STATS_FIELDS, 0)
+        self._last_flush = time.monotonic()
+
+    def record(self, hits=0, misses=0):
+        record_request_cache(hits, misses)
+        with self._lock:
+            self.local['hits'] += hits
+            self.local['misses'] += misses
+            self._pending['hits'] += hits
+            self._pending['misses'] += misses
+            due = (
+                sum(self._pending.values()) >= STATS_FLUSH_OPERATIONS
+                or time.monotonic() - self._last_flush >= STATS_FLUSH_INTERVAL
+            )
+            if not due:
+                return
+            pending, self._pending = self._pending, dict.fromkeys(STATS_FIELDS, 0)
+            self._last_flush = time.monotonic()
+        self._flush(pending)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, dict.fromkeys(STATS_FIELDS, 0)
+            self._last_flush = time.monotonic()
+        self._flush(pending)
+
+    def _flush(self, pending):
+        store = caches['default']
+        for field, amount in pending.items():
+            if not amount:
+                continue
+            key = STATS_KEY.format(namespace=self.namespace, field=field)
+            try:
+                store.add(key, 0, None)
+                store.incr(key, amount)
+            except Exception:
+                # Statistics are best effort and must never break a request
+                pass
+
+    def totals(self):
+        store = caches['default']
+        keys = {field: STATS_KEY.format(namespace=self.namespace, field=field) for field in STATS_FIELDS}
+        values = store.get_many(list(keys.values()))
+        return {field: values.get(key, 0) for field, key in keys.items()}
+
+
+class NamespacedCache:
+    """Wraps a cache alias, counting hits and misses on reads"""
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.stats = CacheStats(namespace)
+
+    @property
+    def cache(self):
+        return caches[self.namespace]
+
+    def get(self, key, default=None):
+        value = self.cache.get(key, _MISSING)
+        if value is _MISSING:
+            self.stats.record(misses=1)
+            return default
+        self.stats.record(hits=1)
+        return value
+
+    def get_many(self, keys):
+        keys = list(keys)
+        values = self.cache.get_many(keys)
+        self.stats.record(hits=len(values), misses=len(keys) - len(values))
+        return values
+
+    def get_or_set(self, key, default, timeout=None):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = default() if callable(default) else default
+            self.cache.add(key, value, timeout)
+        return value
+
+    def __getattr__(self, name):
+        # set, add, delete, incr, clear, ... go straight to the backend
+        return getattr(self.cache, name)
+
+
+_namespaces = {}
+_namespaces_lock = threading.Lock()
+
+
+def get_cache(namespace='default'):
+    """Return the NamespacedCache for a namespace, falling back to 'default' if it isn't configured"""
+    if namespace not in settings.CACHES:
+        namespace = 'default'
+    wrapper = _namespaces.get(namespace)
+    if wrapper is None:
+        with _namespaces_lock:
+            wrapper = _namespaces.setdefault(namespace, NamespacedCache(namespace))
+    return wrapper
+
+
+def cache_stats():
+    """Hit rates per namespace: `local` for this worker, `total` across all workers"""
+    result = {}
+    for namespace, config in settings.CACHES.items():
+        wrapper = get_cache(namespace)
+        wrapper.stats.flush()
+        namespace_stats = {
+            'backend': config['BACKEND'].rsplit('.', 1)[-1],
+            'key_prefix': config.get('KEY_PREFIX', ''),
+            'version': config.get('VERSION', 1),
+        }
+        for scope, counts in (('local', dict(wrapper.stats.local)), ('total', wrapper.stats.totals())):
+            lookups = counts['hits'] + counts['misses']
+            namespace_stats[scope] = {
+                **counts,
+                'hit_rate': round(counts['hits'] / lookups, 4) if lookups else None,
+            }
+        result[namespace] = namespace_stats
+    return {'pid': os.getpid(), 'namespaces': result}
+
+
+def get_version(name):
+    """Current value of a version counter, created on first use"""
+    versions = CacheVersion.objects.filter(name=name).values_list('version', flat=True)
+    version = versions.first()
+    if version is None:
+        # Seed from the clock so a recreated counter never reuses an old version
+        CacheVersion.objects.bulk_create([CacheVersion(name=name, version=int(time.time() * 1000))], ignore_conflicts=True)
+        version = versions.first()
+    return version
+
+
+def bump_version(name):
+    """Increment a version counter in one UPDATE, so concurrent bumps are never lost"""
+    if not CacheVersion.objects.filter(name=name).update(version=F('version') + 1):
+        get_version(name)
+        CacheVersion.objects.filter(name=name).update(version=F('version') + 1)
@@ -0,0 +1,72 @@
+"""
+Response compression
+
+CompressionMiddleware compresses buffered responses of the content types in
+COMPRESSION_CONTENT_TYPES with the best encoding the client accepts:
+brotli (when the `brotli` package is installed), then gzip. It skips:
+
+- streaming responses, which would lose their streaming,
+- downloads (responses with a Content-Disposition), which are sent as
+  stored; most uploads are already compressed formats anyway,
+- responses that already have a Content-Encoding,
+- bodies under COMPRESSION_MIN_SIZE bytes, where the headers cost more
+  than compression saves.
+
+HTML is not in the default content types: admin pages carry CSRF tokens,
+and compressing secrets next to reflected input enables BREACH.
+"""
+import gzip
+import re
+
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+
+ACCEPT_ENCODING_PART = re.compile(r'\s*([A-Za-z0-9*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*')
+
+
+def accepted_encodings(header):
+    """{encoding: q} from an Accept-Encoding header"""
+    accepted = {}
+    for part in header.split(','):
+        match = ACCEPT_ENCODING_PART.fullmatch(part)
+        if not match:
+            continue
+        try:
+            q = float(match.group(2)) if match.group(2) is not None else 1.0
+        except ValueError:
+            continue
+        accepted[match.group(1).lower()] = q
+    return accepted
+
+
+def choose_encoding(header):
+    """'br', 'gzip' or None for an Accept-Encoding header"""
+    if not header:
+        return None
+    accepted = accepted_encodings(header)
+    wildcard = accepted.get('*', 0)
+    candidates = (('br', 'gzip') if brotli is not None else ('gzip',))
+    best, best_q = None, 0
+    for encoding in candidates:
+        # Ties go to the earlier (better compressing) encoding
+        q = accepted.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    # mtime=0 keeps the output identical for identical input
+    return gzip.compress(content, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def is_compressible(content_type):
+    media_type = content_type.split(';', 1)[0].strip().lower()
+    return media_type in settings.COMPRESSION_CONTENT_TYPES
@@ -0,0 +1,48 @@
+"""
+Database connection statistics
+
+Counts, per worker process, how many database connections were opened and
+how many requests were served, so it is visible whether connections are
+reused (CONN_MAX_AGE / DB_POOL in settings) or opened per request.
+"""
+import os
+import threading
+from collections import Counter
+
+from django.db import connections
+
+
+_lock = threading.Lock()
+_connections_opened = Counter()
+_requests = 0
+
+
+def connection_opened(sender, connection, **kwargs):
+    """connection_created receiver"""
+    with _lock:
+        _connections_opened[connection.alias] += 1
+
+
+def request_started(sender, **kwargs):
+    """request_started receiver"""
+    global _requests
+    with _lock:
+        _requests += 1
+
+
+def connection_stats():
+    """Connection settings and counters for this worker, per database alias"""
+    stats = {'pid': os.getpid(), 'requests': _requests, 'databases': {}}
+    for alias in connections:
+        settings_dict = connections.settings[alias]
+        entry = {
+            'conn_max_age': settings_dict.get('CONN_MAX_AGE'),
+            'health_checks': settings_dict.get('CONN_HEALTH_CHECKS'),
+            'connections_opened': _connections_opened[alias],
+            'pool': None,
+        }
+        pool = getattr(connections[alias], 'pool', None) if 'pool' in settings_dict.get('OPTIONS', {}) else None
+        if pool is not None:
+            entry['pool'] = {'min_size': pool.min_size, 'max_size': pool.max_size, **pool.get_stats()}
+        stats['databases'][alias] = entry
+    return stats
@@ -0,0 +1,130 @@
+"""
+Password hashers with per-deployment cost settings and a bounded hashing pool
+
+The hashers keep Django's algorithm names, so existing hashes still verify.
+When a stored hash uses a different algorithm or cost than the preferred
+hasher, Django re-hashes the password on the next successful login.
+
+Every encode/verify runs on a small thread pool (hashlib and argon2 release
+the GIL while hashing), so at most HASHING_POOL_WORKERS hashes use the CPU at
+once. Hashing waits for a free worker, except inside fail_fast_hashing(),
+which the login views use: there, when HASHING_POOL_QUEUE hashes are already
+waiting, HashingPoolBusy is raised at once and the view answers 503 instead
+of queueing behind a login storm while file requests starve. The Django admin
+login form, createsuperuser and other set_password() callers always wait.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher,
+    PBKDF2PasswordHasher,
+    ScryptPasswordHasher,
+)
+
+
+class HashingPoolBusy(Exception):
+    """The hashing pool is full; only raised inside fail_fast_hashing()"""
+    retry_after = 1
+
+
+_local = threading.local()
+
+
+@contextmanager
+def fail_fast_hashing():
+    """Within this block, hashing raises HashingPoolBusy instead of waiting when the pool is full"""
+    previous = getattr(_local, 'fail_fast', False)
+    _local.fail_fast = True
+    try:
+        yield
+    finally:
+        _local.fail_fast = previous
+
+
+class HashingPool:
+    """Runs hash functions on a bounded thread pool with a bounded queue"""
+
+    def __init__(self, max_workers, max_queue, timeout):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='password-hash')
+
+    def run(self, func, *args, **kwargs):
+        # A hasher calling itself (verify -> encode) is already on the pool
+        if getattr(_local, 'in_pool', False):
+            return func(*args, **kwargs)
+        fail_fast = getattr(_local, 'fail_fast', False)
+        if not self._slots.acquire(blocking=not fail_fast):
+            raise HashingPoolBusy()
+        try:
+            future = self._executor.submit(self._call, func, args, kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is held until the hash finishes, even if this request stops waiting
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout if fail_fast else None)
+        except FutureTimeoutError:
+            raise HashingPoolBusy()
+
+    @staticmethod
+    def _call(func, args, kwargs):
+        _local.in_pool = True
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.in_pool = False
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hashing_pool():
+    """The process's hashing pool, created on first use (after any worker fork)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = HashingPool(
+                    max_workers=settings.HASHING_POOL_WORKERS,
+                    max_queue=settings.HASHING_POOL_QUEUE,
+                    timeout=settings.HASHING_POOL_TIMEOUT,
+                )
+    return _pool
+
+
+class PooledHasherMixin:
+    def encode(self, *args, **kwargs):
+        return get_hashing_pool().run(super().encode, *args, **kwargs)
+
+    def verify(self, password, encoded):
+        return get_hashing_pool().run(super().verify, password, encoded)
+
+    def harden_runtime(self, password, encoded):
+        return get_hashing_pool().run(super().harden_runtime, password, encoded)
+
+
+class TunedPBKDF2PasswordHasher(PooledHasherMixin, PBKDF2PasswordHasher):
+    iterations = getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS', None) or PBKDF2PasswordHasher.iterations
+
+
+class TunedScryptPasswordHasher(PooledHasherMixin, ScryptPasswordHasher):
+    work_factor = getattr(settings, 'PASSWORD_SCRYPT_WORK_FACTOR', ScryptPasswordHasher.work_factor)
+    block_size = getattr(settings, 'PASSWORD_SCRYPT_BLOCK_SIZE', ScryptPasswordHasher.block_size)
+    parallelism = getattr(settings, 'PASSWORD_SCRYPT_PARALLELISM', ScryptPasswordHasher.parallelism)
+    # scrypt needs 128 * n * r bytes; leave headroom over OpenSSL's 32 MiB default
+    maxmem = 2 * 128 * work_factor * block_size
+
+
+class TunedArgon2PasswordHasher(PooledHasherMixin, Argon2PasswordHasher):
+    """Requires the argon2-cffi package"""
+    time_cost = getattr(settings, 'PASSWORD_ARGON2_TIME_COST', Argon2PasswordHasher.time_cost)
+    memory_cost = getattr(settings, 'PASSWORD_ARGON2_MEMORY_COST', Argon2PasswordHasher.memory_cost)
+    parallelism = getattr(settings, 'PASSWORD_ARGON2_PARALLELISM', Argon2PasswordHasher.parallelism)
@@ -0,0 +1,142 @@
+"""
+Bulk waitlist ingestion
+
+Normalizes, validates and de-duplicates large batches of emails, then inserts
+them in chunks with `bulk_create` instead of saving one `WaitlistEntry` at a time.
+"""
+import csv
+import re
+
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from .models import WaitlistEntry
+
+
+# Same rules as WaitlistEntrySerializer.validate_email, compiled once
+EMAIL_PATTERN = re.compile(r'^[^\s@]+@[^\s@]+\.[^\s@]+$')
+NOEMAIL_PATTERN = re.compile(r'noemail', re.IGNORECASE)
+
+EMAIL_MAX_LENGTH = WaitlistEntry._meta.get_field('email').max_length
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REJECTED_SAMPLES = 100
+
+
+def normalize_email(value):
+    """Strip whitespace and case-fold an email so duplicates compare equal"""
+    if not isinstance(value, str):
+        return ''
+    return value.strip().lower()
+
+
+def validate_email(email):
+    """Return an error message for an invalid (normalized) email, or None"""
+    if not email:
+        return 'Email is required'
+    if len(email) > EMAIL_MAX_LENGTH:
+        return f'Email cannot be longer than {EMAIL_MAX_LENGTH} characters'
+    if NOEMAIL_PATTERN.search(email):
+        return 'Please enter a valid email address'
+    if not EMAIL_PATTERN.match(email):
+        return 'Please enter a valid email address format'
+    return None
+
+
+def dedup_key(email, campaign, per_campaign):
+    """
+    Key of an ingested entry, unique across the waitlist: the email, or the
+    email and campaign when de-duplicating per campaign. Emails can't contain
+    whitespace, so the space separator is unambiguous.
+    """
+    return f'{email} {campaign}' if per_campaign else email
+
+
+def iter_csv_emails(lines):
+    """
+    Yield emails from CSV lines. Uses the column headed `email` when there is
+    one, otherwise the first column of every row.
+    """
+    reader = csv.reader(lines)
+    column = 0
+    for row_number, row in enumerate(reader):
+        if not row:
+            continue
+        if row_number == 0:
+            header = [cell.strip().lower() for cell in row]
+            if 'email' in header:
+                column = header.index('email')
+                continue
+        if column < len(row):
+            yield row[column]
+
+
+def ingest_emails(emails, campaign='', per_campaign=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Ingest an iterable of emails into the waitlist.
+
+    Emails are de-duplicated against each other and against existing entries,
+    either across the whole waitlist or only within `campaign` when
+    `per_campaign` is set. Returns a dict of counts.
+    """
+    result = {
+        'received': 0,
+        'inserted': 0,
+        'duplicates': 0,
+        'rejected': 0,
+        'rejected_samples': [],
+    }
+    seen = set()
+    pending = []
+
+    for raw in emails:
+        result['received'] += 1
+        email = normalize_email(raw)
+
+        error = validate_email(email)
+        if error:
+            result['rejected'] += 1
+            if len(result['rejected_samples']) < MAX_REJECTED_SAMPLES:
+                result['rejected_samples'].append({'email': raw, 'error': error})
+            continue
+
+        if email in seen:
+            result['duplicates'] += 1
+            continue
+        seen.add(email)
+        pending.append(email)
+
+        if len(pending) >= chunk_size:
+            _insert_chunk(pending, campaign, per_campaign, result)
+            pending = []
+
+    if pending:
+        _insert_chunk(pending, campaign, per_campaign, result)
+
+    return result
+
+
+def _insert_chunk(emails, campaign, per_campaign, result):
+    """Drop emails that already exist, then bulk insert the rest with reserved entry IDs"""
+    existing = WaitlistEntry.objects.annotate(email_lower=Lower('email')).filter(email_lower__in=emails)
+    if per_campaign:
+        existing = existing.filter(campaign=campaign)
+    existing_emails = set(existing.values_list('email_lower', flat=True))
+
+    new_emails = [email for email in emails if email not in existing_emails]
+    result['duplicates'] += len(emails) - len(new_emails)
+    if not new_emails:
+        return
+
+    with transaction.atomic():
+        entry_ids = WaitlistEntry.allocate_entry_ids(len(new_emails))
+        # Rows another import added since the check above share a dedup key and are skipped
+        WaitlistEntry.objects.bulk_create([
+            WaitlistEntry(
+                entry_id=entry_id, email=email, campaign=campaign,
+                dedup_key=dedup_key(email, campaign, per_campaign),
+            )
+            for entry_id, email in zip(entry_ids, new_emails)
+        ], ignore_conflicts=True)
+        inserted = WaitlistEntry.objects.filter(entry_id__in=entry_ids).count()
+    result['inserted'] += inserted
+    result['duplicates'] += len(new_emails) - inserted
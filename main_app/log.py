@@ -0,0 +1,154 @@
+"""
+Structured, non-blocking logging
+
+Request threads only put records on a bounded in-memory queue
+(QueueingHandler); a background QueueListener thread formats them as JSON
+and writes them out. If the queue is full the record is dropped and counted
+rather than making the request wait on stdout.
+
+Every record carries the id of the request that logged it (RequestIdFilter,
+set by RequestIdMiddleware and echoed in the X-Request-ID response header).
+DEBUG records can be sampled per request (SamplingFilter), so a sampled
+request keeps all of its debug lines. The logging setup itself is in
+LOGGING in settings.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import threading
+import uuid
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+
+_request_id = ContextVar('request_id', default=None)
+REQUEST_ID_HEADER = 'X-Request-ID'
+# Client supplied ids are kept only when they look like ids
+VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# LogRecord attributes that are not `extra=` fields
+RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+def start_request(incoming_id=None):
+    """Bind a request id to the current context; returns (request id, token for end_request)"""
+    request_id = incoming_id if incoming_id and VALID_REQUEST_ID.match(incoming_id) else uuid.uuid4().hex
+    return request_id, _request_id.set(request_id)
+
+
+def end_request(token):
+    _request_id.reset(token)
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep `rate` of DEBUG records, deciding once per request"""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = float(rate)
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        request_id = _request_id.get()
+        if request_id is None:
+            return random.random() < self.rate
+        return zlib.crc32(request_id.encode()) / 0xFFFFFFFF < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including `extra=` fields"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            entry['request_id'] = request_id
+        for key, value in vars(record).items():
+            if key not in RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class QueueingHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to a background thread that writes them with `target`
+    (a handler built by this class from `formatter`). Never blocks.
+    """
+
+    def __init__(self, queue_size=10000, stream=None):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.target = logging.StreamHandler(stream)
+        self.dropped = 0
+        self._listener = None
+        self._listener_pid = None
+        self._start_lock = threading.Lock()
+
+    def setFormatter(self, fmt):
+        # Formatting happens on the listener thread, not in the request
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Resolve the message and traceback now (args may change later),
+        # but leave the JSON formatting to the listener
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_listener(self):
+        # Started lazily, and again after a fork, since threads don't survive forks
+        if self._listener_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener = logging.handlers.QueueListener(self.queue, self.target, respect_handler_level=True)
+            self._listener.start()
+            self._listener_pid = os.getpid()
+            atexit.register(self.flush_and_stop)
+
+    def flush_and_stop(self):
+        if self._listener is not None and self._listener_pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
+            self._listener_pid = None
+
+    def close(self):
+        self.flush_and_stop()
+        super().close()
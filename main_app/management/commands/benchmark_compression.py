@@ -0,0 +1,81 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import Resolver404, resolve
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from main_app.compression import brotli, compress
+from main_app.renderers import FastJSONRenderer
+
+
+DEFAULT_PATHS = ['/api/files/', '/api/folders/', '/api/file-tags/']
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure JSON rendering time and compressed sizes of listing endpoints: '
+        "DRF's JSONRenderer vs FastJSONRenderer, and identity vs gzip vs brotli"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help=f'API paths with optional query string (default: {" ".join(DEFAULT_PATHS)})')
+        parser.add_argument('--user', required=True, help='Username to list as')
+        parser.add_argument('--repeat', type=int, default=50, help='Renders/compressions per measurement')
+        parser.add_argument('--host', default='localhost', help='Host header for the requests (must be in ALLOWED_HOSTS)')
+
+    def handle(self, *args, **options):
+        if options['repeat'] <= 0:
+            raise CommandError('--repeat must be positive')
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'No user {options["user"]!r}')
+
+        factory = APIRequestFactory(SERVER_NAME=options['host'])
+        for path in options['paths'] or DEFAULT_PATHS:
+            data = self._fetch(factory, user, path)
+            if data is None:
+                continue
+            self._report(path, data, options['repeat'])
+
+    def _fetch(self, factory, user, path):
+        """The view's unrendered response data, or None if it failed"""
+        try:
+            match = resolve(path.split('?', 1)[0])
+        except Resolver404:
+            self.stdout.write(f'{path}: no such path')
+            return None
+        request = factory.get(path)
+        force_authenticate(request, user=user)
+        response = match.func(request, *match.args, **match.kwargs)
+        if response.status_code != 200 or not hasattr(response, 'data'):
+            self.stdout.write(f'{path}: HTTP {response.status_code}, skipped')
+            return None
+        return response.data
+
+    def _report(self, path, data, repeat):
+        drf_body, drf_time = self._measure(lambda: JSONRenderer().render(data), repeat)
+        fast_body, fast_time = self._measure(lambda: FastJSONRenderer().render(data), repeat)
+        self.stdout.write(f'{path}: {len(fast_body)} bytes of JSON')
+        self.stdout.write(
+            f'  render: JSONRenderer {drf_time * 1000:.2f} ms, FastJSONRenderer {fast_time * 1000:.2f} ms '
+            f'({drf_time / max(fast_time, 1e-9):.1f}x, output {"identical" if drf_body == fast_body else "differs"})'
+        )
+        for encoding in ('gzip', 'br'):
+            if encoding == 'br' and brotli is None:
+                self.stdout.write('  br: skipped (pip install brotli)')
+                continue
+            compressed, seconds = self._measure(lambda: compress(fast_body, encoding), repeat)
+            self.stdout.write(
+                f'  {encoding}: {len(compressed)} bytes ({100 * len(compressed) / max(len(fast_body), 1):.1f}%), '
+                f'{seconds * 1000:.2f} ms'
+            )
+
+    def _measure(self, func, repeat):
+        """func's result and its mean run time in seconds over `repeat` runs"""
+        started = time.perf_counter()
+        for _ in range(repeat):
+            result = func()
+        return result, (time.perf_counter() - started) / repeat
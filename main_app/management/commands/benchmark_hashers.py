@@ -0,0 +1,69 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import get_hashers
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.hashers import PooledHasherMixin
+
+
+class Command(BaseCommand):
+    help = 'Measure password hashes per second for each configured hasher on this machine'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=2.0, help='How long to hash for per measurement')
+        parser.add_argument('--threads', type=int, default=0, help='Also measure with this many concurrent threads')
+        parser.add_argument('--algorithm', action='append', help='Only benchmark these algorithms (repeatable)')
+
+    def handle(self, *args, **options):
+        if options['seconds'] <= 0:
+            raise CommandError('--seconds must be positive')
+
+        hashers = [
+            hasher for hasher in get_hashers()
+            if not options['algorithm'] or hasher.algorithm in options['algorithm']
+        ]
+        if not hashers:
+            raise CommandError('No matching hashers configured')
+
+        for index, hasher in enumerate(hashers):
+            label = f'{hasher.algorithm} ({type(hasher).__name__}){" [preferred]" if index == 0 else ""}'
+            try:
+                encoded = self._raw(hasher).encode('benchmark-password', hasher.salt())
+            except (ValueError, ImportError) as e:
+                self.stdout.write(f'{label}: skipped ({e})')
+                continue
+
+            summary = ', '.join(
+                f'{key}={value}' for key, value in hasher.safe_summary(encoded).items()
+                if key not in ('algorithm', 'salt', 'hash')
+            )
+            rate, latency = self._measure(hasher, encoded, options['seconds'], 1)
+            line = f'{label}: {rate:.1f} hashes/s, {latency * 1000:.0f} ms per login ({summary})'
+            if options['threads'] > 1:
+                parallel_rate, _ = self._measure(hasher, encoded, options['seconds'], options['threads'])
+                line += f'; {parallel_rate:.1f} hashes/s with {options["threads"]} threads'
+            self.stdout.write(line)
+
+    @staticmethod
+    def _raw(hasher):
+        """The hasher without the hashing pool, which would cap the threads measured"""
+        return super(PooledHasherMixin, hasher) if isinstance(hasher, PooledHasherMixin) else hasher
+
+    def _measure(self, hasher, encoded, seconds, threads):
+        """Verify repeatedly for `seconds` on `threads` threads; returns (hashes/s, seconds per hash)"""
+        deadline = time.perf_counter() + seconds
+        verify = self._raw(hasher).verify
+
+        def work():
+            count = 0
+            while time.perf_counter() < deadline:
+                verify('benchmark-password', encoded)
+                count += 1
+            return count
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            total = sum(executor.map(lambda _: work(), range(threads)))
+        elapsed = time.perf_counter() - started
+        return total / elapsed, elapsed * threads / max(total, 1)
@@ -0,0 +1,104 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Hold many slow connections open against a running server and measure how '
+        'fast it still answers normal requests (compare SERVER_MODE=wsgi and asgi)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Endpoint to probe, e.g. http://localhost:8000/api/async/waitlist/')
+        parser.add_argument('--slow-clients', type=int, default=200, help='Connections that trickle a request body')
+        parser.add_argument('--body-size', type=int, default=64 * 1024, help='Bytes each slow client uploads')
+        parser.add_argument('--byte-interval', type=float, default=0.5, help='Seconds between slow client writes')
+        parser.add_argument('--chunk', type=int, default=16, help='Bytes per slow client write')
+        parser.add_argument('--probes', type=int, default=50, help='Normal requests sent while slow clients are connected')
+        parser.add_argument('--probe-timeout', type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('Only plain http:// URLs are supported')
+        asyncio.run(self._run(url, options))
+
+    async def _run(self, url, options):
+        host, port = url.hostname, url.port or 80
+        path = url.path or '/'
+        stop = asyncio.Event()
+
+        slow = [
+            asyncio.create_task(self._slow_client(host, port, path, options, stop))
+            for _ in range(options['slow_clients'])
+        ]
+        await asyncio.sleep(1)  # let the slow clients connect and occupy the server
+
+        latencies, failures = [], 0
+        for _ in range(options['probes']):
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(self._probe(host, port, path), options['probe_timeout'])
+                latencies.append(time.perf_counter() - started)
+            except (OSError, asyncio.TimeoutError):
+                failures += 1
+
+        stop.set()
+        connected = sum(await asyncio.gather(*slow))
+
+        self.stdout.write(f'slow clients connected: {connected}/{options["slow_clients"]}')
+        if latencies:
+            latencies.sort()
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            self.stdout.write(
+                f'probe latency: median {statistics.median(latencies) * 1000:.1f} ms, '
+                f'p95 {p95 * 1000:.1f} ms, max {latencies[-1] * 1000:.1f} ms'
+            )
+        self.stdout.write(f'probe failures/timeouts: {failures}/{options["probes"]}')
+
+    async def _slow_client(self, host, port, path, options, stop):
+        """Send headers promptly, then trickle the body until told to stop; returns 1 if it connected"""
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            return 0
+        try:
+            writer.write(
+                f'POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n'
+                f'Content-Length: {options["body_size"]}\r\n\r\n'.encode()
+            )
+            sent = 0
+            while not stop.is_set() and sent < options['body_size']:
+                chunk = b' ' * min(options['chunk'], options['body_size'] - sent)
+                writer.write(chunk)
+                await writer.drain()
+                sent += len(chunk)
+                try:
+                    await asyncio.wait_for(stop.wait(), options['byte_interval'])
+                except asyncio.TimeoutError:
+                    pass
+        except OSError:
+            pass
+        finally:
+            writer.close()
+        return 1
+
+    async def _probe(self, host, port, path):
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            body = b'{}'
+            writer.write(
+                f'POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n'
+                f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body
+            )
+            await writer.drain()
+            status_line = await reader.readline()
+            if not status_line:
+                raise OSError('Connection closed without a response')
+            await reader.read()
+        finally:
+            writer.close()
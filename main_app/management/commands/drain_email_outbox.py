@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from main_app.outbox import drain_outbox
+
+
+class Command(BaseCommand):
+    help = 'Send due emails from the outbox, in batches over one mail server connection per batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Emails per connection (default: EMAIL_OUTBOX_BATCH_SIZE)')
+        parser.add_argument('--loop', action='store_true', help='Keep running, draining every --interval seconds')
+        parser.add_argument('--interval', type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        for option in ('batch_size', 'interval'):
+            if options[option] is not None and options[option] <= 0:
+                raise CommandError(f"--{option.replace('_', '-')} must be positive")
+
+        while True:
+            close_old_connections()
+            sent, failed = drain_outbox(batch_size=options['batch_size'])
+            if sent or failed or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'Sent {sent} emails, {failed} failed'))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,49 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.ingestion import DEFAULT_CHUNK_SIZE, ingest_emails, iter_csv_emails
+
+
+class Command(BaseCommand):
+    help = "Bulk import waitlist emails from a CSV file (use '-' to read from stdin)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file with an 'email' column, or one email per line")
+        parser.add_argument('--campaign', default='', help='Campaign to tag the imported entries with')
+        parser.add_argument(
+            '--per-campaign',
+            action='store_true',
+            help='Only treat emails as duplicates within the same campaign',
+        )
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if options['chunk_size'] <= 0:
+            raise CommandError('--chunk-size must be positive')
+
+        try:
+            if path == '-':
+                result = self._ingest(sys.stdin, options)
+            else:
+                with open(path, newline='', encoding='utf-8-sig') as csv_file:
+                    result = self._ingest(csv_file, options)
+        except OSError as e:
+            raise CommandError(f'Could not read {path}: {e}')
+
+        for sample in result['rejected_samples']:
+            self.stderr.write(f"Rejected {sample['email']!r}: {sample['error']}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Received {result['received']}, inserted {result['inserted']}, "
+            f"duplicates {result['duplicates']}, rejected {result['rejected']}"
+        ))
+
+    def _ingest(self, lines, options):
+        return ingest_emails(
+            iter_csv_emails(lines),
+            campaign=options['campaign'],
+            per_campaign=options['per_campaign'],
+            chunk_size=options['chunk_size'],
+        )
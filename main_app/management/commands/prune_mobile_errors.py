@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.mobile_errors import prune_mobile_errors
+
+
+class Command(BaseCommand):
+    help = 'Delete mobile error samples, hourly counts and groups older than the retention periods'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--report-days', type=int, help='Keep sample reports this many days (default: MOBILE_ERROR_REPORT_RETENTION_DAYS)')
+        parser.add_argument('--count-days', type=int, help='Keep hourly counts and idle groups this many days (default: MOBILE_ERROR_COUNT_RETENTION_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        for option in ('report_days', 'count_days', 'batch_size'):
+            if options[option] is not None and options[option] <= 0:
+                raise CommandError(f"--{option.replace('_', '-')} must be positive")
+
+        deleted = prune_mobile_errors(
+            report_days=options['report_days'],
+            count_days=options['count_days'],
+            batch_size=options['batch_size'],
+        )
+        summary = ', '.join(f'{count} {name}' for name, count in deleted.items()) or 'nothing'
+        self.stdout.write(self.style.SUCCESS(f'Pruned {summary}'))
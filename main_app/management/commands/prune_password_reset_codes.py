@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.models import PasswordResetCode
+
+
+class Command(BaseCommand):
+    help = 'Delete used and expired password reset codes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size must be positive')
+
+        deleted = PasswordResetCode.prune(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} used or expired password reset codes'))
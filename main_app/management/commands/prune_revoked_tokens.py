@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.revocation import prune_revoked_tokens
+
+
+class Command(BaseCommand):
+    help = 'Delete revoked-token entries whose tokens have expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size must be positive')
+
+        deleted = prune_revoked_tokens(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} expired revoked tokens'))
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from main_app.access import batched_permission_changes
+from main_app.models import FilePermission, FolderPermission
+
+
+class Command(BaseCommand):
+    help = 'Deactivate (or delete) file and folder permissions whose expiry has passed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode',
+            choices=['deactivate', 'delete'],
+            default='deactivate',
+            help='Keep expired grants as inactive rows (default) or delete them',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size <= 0:
+            raise CommandError('--batch-size must be positive')
+
+        now = timezone.now()
+        with batched_permission_changes():
+            for model in (FilePermission, FolderPermission):
+                swept = self._sweep(model, now, options['mode'], batch_size)
+                self.stdout.write(f'{model.__name__}: {swept} expired grants ({options["mode"]})')
+
+        self.stdout.write(self.style.SUCCESS('Expired permissions swept'))
+
+    def _sweep(self, model, now, mode, batch_size):
+        """Process expired grants in id batches so no single statement locks the whole table"""
+        expired = model.objects.filter(expires_at__lte=now)
+        if mode == 'deactivate':
+            expired = expired.filter(is_active=True)
+
+        swept = 0
+        last_id = 0
+        while True:
+            ids = list(
+                expired.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                return swept
+            last_id = ids[-1]
+            with transaction.atomic():
+                batch = model.objects.filter(id__in=ids)
+                if mode == 'deactivate':
+                    swept += batch.update(is_active=False)
+                else:
+                    swept += batch.delete()[0]
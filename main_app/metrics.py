@@ -0,0 +1,211 @@
+"""
+Request performance metrics
+
+PerformanceMiddleware measures, for every request, wall time, database
+queries and their time, cache hits and misses (reads through
+main_app.cache), response bytes (counted as streaming responses are sent)
+and the matched URL route. The numbers are:
+
+- sent back as a Server-Timing header when SERVER_TIMING_ENABLED,
+- aggregated in memory per route and served in Prometheus text format by
+  /metrics (per worker process; scrape every worker or sum in Prometheus).
+
+Database time is measured by an execute wrapper installed once per
+connection, which is a no-op outside a measured request.
+"""
+import bisect
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+
+# Request duration buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('started', 'db_queries', 'db_time', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def server_timing(self, duration):
+        return (
+            f'app;dur={duration * 1000:.1f}, '
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries", '
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"'
+        )
+
+
+def start_request():
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def record_cache(hits=0, misses=0):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+def query_timer(execute, sql, params, many, context):
+    """Database execute wrapper; see install_query_timer"""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - started
+        metrics.db_queries += 1
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """connection_created receiver: time every query on the new connection"""
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_timer)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RouteStats:
+    __slots__ = ('duration', 'db_queries', 'statuses', 'db_time', 'cache_hits', 'cache_misses', 'response_bytes')
+
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.db_queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.statuses = defaultdict(int)
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.response_bytes = 0
+
+
+class MetricsRegistry:
+    """Per-route aggregates for this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = defaultdict(RouteStats)
+
+    def observe(self, route, method, status, duration, metrics):
+        with self._lock:
+            stats = self._routes[(route, method)]
+            stats.duration.observe(duration)
+            stats.db_queries.observe(metrics.db_queries)
+            stats.statuses[status] += 1
+            stats.db_time += metrics.db_time
+            stats.cache_hits += metrics.cache_hits
+            stats.cache_misses += metrics.cache_misses
+
+    def add_bytes(self, route, method, size):
+        with self._lock:
+            self._routes[(route, method)].response_bytes += size
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def render(self):
+        """Prometheus text exposition format"""
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = []
+
+            def histogram(name, help_text, attr):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (route, method), stats in routes:
+                    hist = getattr(stats, attr)
+                    labels = f'route="{escape(route)}",method="{method}"'
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.count}')
+                    lines.append(f'{name}_sum{{{labels}}} {hist.sum:.6f}')
+                    lines.append(f'{name}_count{{{labels}}} {hist.count}')
+
+            def counter(name, help_text, value_of):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for (route, method), stats in routes:
+                    lines.append(f'{name}{{route="{escape(route)}",method="{method}"}} {value_of(stats)}')
+
+            histogram('http_request_duration_seconds', 'Request wall time', 'duration')
+            histogram('http_request_db_queries', 'Database queries per request', 'db_queries')
+
+            lines.append('# HELP http_requests_total Requests by response status')
+            lines.append('# TYPE http_requests_total counter')
+            for (route, method), stats in routes:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'http_requests_total{{route="{escape(route)}",method="{method}",status="{status}"}} {count}')
+
+            counter('http_request_db_seconds_total', 'Time spent in database queries', lambda s: f'{s.db_time:.6f}')
+            counter('http_request_cache_hits_total', 'Cache hits', lambda s: s.cache_hits)
+            counter('http_request_cache_misses_total', 'Cache misses', lambda s: s.cache_misses)
+            counter('http_response_bytes_total', 'Response body bytes sent', lambda s: s.response_bytes)
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+
+
+def route_name(request):
+    """Low-cardinality route label: the matched URL pattern, not the concrete path"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return '/' + match.route if match.route else (match.view_name or 'unmatched')
+
+
+def counting_stream(chunks, route, method):
+    """Pass a streaming body through, recording its size once it has been sent"""
+    size = 0
+    try:
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        registry.add_bytes(route, method, size)
+
+
+async def acounting_stream(chunks, route, method):
+    size = 0
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        registry.add_bytes(route, method, size)
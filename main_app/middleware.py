@@ -1,12 +1,18 @@
 """
 Custom middleware for the main_app
 """
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.utils.deprecation import MiddlewareMixin
-from django.contrib.auth import get_user
-from django.contrib.auth.models import AnonymousUser
 from django.http import HttpResponse
 from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+import logging
 import re
+import time
+
+from .useragents import get_client_info, prefix_matcher
+
+logger = logging.getLogger(__name__)
 
 
 class DisableCSRFForAPIMiddleware(MiddlewareMixin):
@@ -15,30 +21,20 @@ class DisableCSRFForAPIMiddleware(MiddlewareMixin):
     Enhanced for mobile compatibility
     """
     
+    # URL prefixes that should be exempt from CSRF. This also covers the
+    # mobile-only exemptions (/waitlist/, /contactus/, /api/login/, /login/),
+    # so the User-Agent doesn't need to be checked here.
+    is_exempt_path = staticmethod(prefix_matcher([
+        '/api/',
+        '/login/',
+        '/auth/',
+        '/waitlist/',
+        '/contactus/',
+    ]))
+    
     def process_request(self, request):
-        # List of URL prefixes that should be exempt from CSRF
-        csrf_exempt_prefixes = [
-            '/api/',
-            '/login/',
-            '/auth/',
-            '/waitlist/',
-            '/contactus/',
-        ]
-        
-        # Check if the request path starts with any of the exempt prefixes
-        if any(request.path.startswith(prefix) for prefix in csrf_exempt_prefixes):
+        if self.is_exempt_path(request.path):
             setattr(request, '_dont_enforce_csrf_checks', True)
-        
-        # Additional mobile-specific CSRF exemption
-        user_agent = request.META.get('HTTP_USER_AGENT', '').lower()
-        mobile_indicators = ['mobile', 'android', 'iphone', 'ipad', 'ipod', 'blackberry', 'webos']
-        
-        if any(indicator in user_agent for indicator in mobile_indicators):
-            # For mobile devices, be more lenient with CSRF for specific endpoints
-            mobile_exempt_paths = ['/waitlist/', '/contactus/', '/api/login/', '/login/']
-            if any(request.path.startswith(path) for path in mobile_exempt_paths):
-                setattr(request, '_dont_enforce_csrf_checks', True)
-        
         return None 
 
 
@@ -46,11 +42,7 @@ class MobileCompatibilityMiddleware(MiddlewareMixin):
     """Add mobile-friendly headers and handle mobile-specific issues"""
     
     def process_response(self, request, response):
-        # Add mobile-friendly headers
-        user_agent = request.META.get('HTTP_USER_AGENT', '').lower()
-        mobile_indicators = ['mobile', 'android', 'iphone', 'ipad', 'ipod', 'blackberry', 'webos']
-        
-        if any(indicator in user_agent for indicator in mobile_indicators):
+        if get_client_info(request).is_mobile:
             # Add headers for mobile compatibility
             response['Access-Control-Allow-Origin'] = '*'
             response['Access-Control-Allow-Methods'] = 'GET, POST, PUT, PATCH, DELETE, OPTIONS'
@@ -71,39 +63,206 @@ class AdminLoginLoggingMiddleware(MiddlewareMixin):
     def process_request(self, request):
         # Only process admin login requests
         if request.path == '/admin/login/' and request.method == 'POST':
-            # Store request info for logging in process_response
+            # Store request info for logging in process_response (never the password itself)
             request._admin_login_attempt = True
             request._admin_login_data = {
                 'username': request.POST.get('username', ''),
-                'password': request.POST.get('password', ''),
+                'has_password': bool(request.POST.get('password')),
             }
         return None
     
     def process_response(self, request, response):
         # Check if this was an admin login attempt
         if hasattr(request, '_admin_login_attempt'):
+            from .models import AdminLoginLog
             username = request._admin_login_data.get('username', '')
             
-            # Check if login was successful
-            if response.status_code == 302 and 'admin/' in response.get('Location', ''):
-                # Successful login - find the user
-                from django.contrib.auth import get_user
-                try:
-                    user = get_user(request)
-                    if user and not isinstance(user, AnonymousUser):
-                        from .models import AdminLoginLog
-                        AdminLoginLog.log_successful_login(user, request)
-                except Exception as e:
-                    print(f"Error logging successful admin login: {e}")
+            # A successful login redirects (to `next`, which may be outside
+            # admin/), and django.contrib.auth.login() has put the user on the request
+            user = getattr(request, 'user', None)
+            if response.status_code == 302 and user is not None and user.is_authenticated:
+                AdminLoginLog.log_successful_login(user, request)
             else:
                 # Failed login
-                from .models import AdminLoginLog
                 failure_reason = 'Invalid credentials'
                 if not username:
                     failure_reason = 'Missing username'
-                elif not request._admin_login_data.get('password'):
+                elif not request._admin_login_data.get('has_password'):
                     failure_reason = 'Missing password'
                 
                 AdminLoginLog.log_failed_login(username, request, failure_reason)
         
-        return response 
\ No newline at end of file
+        return response
+
+
+class ReplicaPinMiddleware:
+    """
+    Read-your-writes for the read replica: a successful write pins the client
+    to the primary database for REPLICA_PIN_SECONDS (cookie, plus a header
+    that cookie-less clients can send back). See main_app/routers.py.
+    """
+    
+    def __init__(self, get_response):
+        from .routers import replica_configured
+        if not replica_configured():
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        from .routers import PIN_COOKIE, PIN_HEADER, _pinned, _wrote, parse_pin, pin_expiry
+        
+        pinned = parse_pin(request.COOKIES.get(PIN_COOKIE)) or parse_pin(request.headers.get(PIN_HEADER))
+        pinned_token = _pinned.set(pinned)
+        wrote_token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            _pinned.reset(pinned_token)
+            _wrote.reset(wrote_token)
+        
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            until = f'{pin_expiry():.3f}'
+            response.set_cookie(
+                PIN_COOKIE, until, max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax', secure=request.is_secure(),
+            )
+            response[PIN_HEADER] = until
+        return response
+
+
+class PerformanceMiddleware:
+    """Per-request timing, query, cache and size metrics (see main_app/metrics.py)"""
+    
+    METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        from .metrics import end_request, start_request
+        
+        metrics, token = start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(token)
+        return self.process_response(request, response, metrics)
+    
+    async def __acall__(self, request):
+        from .metrics import end_request, start_request
+        
+        metrics, token = start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request(token)
+        return self.process_response(request, response, metrics)
+    
+    def process_response(self, request, response, metrics):
+        from .metrics import acounting_stream, counting_stream, registry, route_name
+        
+        duration = time.perf_counter() - metrics.started
+        route = route_name(request)
+        method = request.method if request.method in self.METHODS else 'OTHER'
+        registry.observe(route, method, response.status_code, duration, metrics)
+        if response.streaming:
+            wrap = acounting_stream if response.is_async else counting_stream
+            response.streaming_content = wrap(response.streaming_content, route, method)
+        else:
+            registry.add_bytes(route, method, len(response.content))
+        
+        if settings.SERVER_TIMING_ENABLED:
+            response['Server-Timing'] = metrics.server_timing(duration)
+        return response
+
+
+class RequestIdMiddleware:
+    """Tag the request's log records with an id, taken from X-Request-ID or generated, and echo it back"""
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        from .log import REQUEST_ID_HEADER, end_request, start_request
+        
+        request.request_id, token = start_request(request.headers.get(REQUEST_ID_HEADER))
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(token)
+        response[REQUEST_ID_HEADER] = request.request_id
+        return response
+    
+    async def __acall__(self, request):
+        from .log import REQUEST_ID_HEADER, end_request, start_request
+        
+        request.request_id, token = start_request(request.headers.get(REQUEST_ID_HEADER))
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request(token)
+        response[REQUEST_ID_HEADER] = request.request_id
+        return response
+
+
+class CompressionMiddleware:
+    """Compress buffered JSON/text responses with brotli or gzip as negotiated (see main_app/compression.py)"""
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        if not settings.COMPRESSION_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+    
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+    
+    def process_response(self, request, response):
+        from django.utils.cache import patch_vary_headers
+        from .compression import choose_encoding, compress, is_compressible
+        
+        if response.streaming or response.has_header('Content-Encoding') or response.has_header('Content-Disposition'):
+            return response
+        if not is_compressible(response.get('Content-Type', '')):
+            return response
+        # Whatever the outcome, the body depends on Accept-Encoding for caches
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+        encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+        if encoding is None:
+            return response
+        
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # The representation changed, so a strong validator no longer holds
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-19 12:12
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+CREATE_ENTRY_SEQUENCE = """
+CREATE SEQUENCE IF NOT EXISTS main_app_waitlistentry_entry_seq;
+SELECT setval(
+    'main_app_waitlistentry_entry_seq',
+    COALESCE(
+        (SELECT MAX(CAST(SUBSTRING(entry_id FROM 4) AS INTEGER))
+         FROM main_app_waitlistentry
+         WHERE entry_id ~ '^WL-[0-9]+$'),
+        0
+    ) + 1,
+    false
+);
+"""
+
+DROP_ENTRY_SEQUENCE = "DROP SEQUENCE IF EXISTS main_app_waitlistentry_entry_seq;"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0016_add_contact_entry_id_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='waitlistentry',
+            name='campaign',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='waitlistentry',
+            index=models.Index(django.db.models.functions.text.Lower('email'), models.F('campaign'), name='waitlist_email_campaign_idx'),
+        ),
+        # Entry IDs are allocated from a sequence so bulk inserts can reserve a block at once
+        migrations.RunSQL(CREATE_ENTRY_SEQUENCE, DROP_ENTRY_SEQUENCE),
+    ]
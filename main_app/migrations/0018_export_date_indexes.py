@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-19 12:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0017_waitlist_campaign_and_entry_sequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contactus',
+            index=models.Index(fields=['created_at'], name='main_app_co_created_a8680a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='waitlistentry',
+            index=models.Index(fields=['created_at'], name='main_app_wa_created_dd2be5_idx'),
+        ),
+    ]
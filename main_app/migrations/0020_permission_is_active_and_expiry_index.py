@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-19 12:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0019_folderpermission'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filepermission',
+            name='is_active',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='folderpermission',
+            name='is_active',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name='filepermission',
+            index=models.Index(condition=models.Q(('expires_at__isnull', False)), fields=['expires_at'], name='filepermission_expires_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='folderpermission',
+            index=models.Index(condition=models.Q(('expires_at__isnull', False)), fields=['expires_at'], name='folderpermission_expires_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-19 12:20
+
+from django.db import migrations, models
+
+
+BACKFILL_FILES_COUNT = """
+UPDATE main_app_filetag tag
+SET files_count = counts.total
+FROM (
+    SELECT filetag_id, COUNT(*) AS total
+    FROM main_app_file_tags
+    GROUP BY filetag_id
+) counts
+WHERE counts.filetag_id = tag.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0020_permission_is_active_and_expiry_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filetag',
+            name='files_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(BACKFILL_FILES_COUNT, migrations.RunSQL.noop),
+    ]
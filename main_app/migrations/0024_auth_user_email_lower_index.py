@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Case-insensitive email lookups for login (main_app.backends.UsernameOrEmailBackend)"""
+
+    dependencies = [
+        ('main_app', '0023_create_cache_tables'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS auth_user_email_lower_idx ON auth_user (lower(email));',
+            'DROP INDEX IF EXISTS auth_user_email_lower_idx;',
+        ),
+    ]
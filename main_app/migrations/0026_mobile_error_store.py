@@ -0,0 +1,65 @@
+# Generated by Django 5.2 on 2026-10-19 12:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0025_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MobileErrorGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=64, unique=True)),
+                ('error_type', models.CharField(max_length=100)),
+                ('message', models.TextField()),
+                ('stack_signature', models.TextField(blank=True)),
+                ('first_seen', models.DateTimeField()),
+                ('last_seen', models.DateTimeField(db_index=True)),
+                ('occurrences', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-last_seen'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MobileErrorCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('device', models.CharField(max_length=20)),
+                ('browser', models.CharField(max_length=20)),
+                ('count', models.BigIntegerField(default=0)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counts', to='main_app.mobileerrorgroup')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hour'], name='main_app_mo_hour_7347e7_idx')],
+                'constraints': [models.UniqueConstraint(fields=('group', 'hour', 'device', 'browser'), name='mobile_error_count_bucket')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MobileErrorReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('received_at', models.DateTimeField(db_index=True)),
+                ('device', models.CharField(max_length=20)),
+                ('browser', models.CharField(max_length=20)),
+                ('user_agent', models.TextField(blank=True)),
+                ('ip', models.GenericIPAddressField(blank=True, null=True)),
+                ('page_url', models.TextField(blank=True)),
+                ('message', models.TextField(blank=True)),
+                ('stack', models.TextField(blank=True)),
+                ('details', models.JSONField(blank=True, default=dict)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reports', to='main_app.mobileerrorgroup')),
+            ],
+            options={
+                'ordering': ['-received_at'],
+                'indexes': [models.Index(fields=['group', 'received_at'], name='main_app_mo_group_i_00f76d_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2 on 2026-10-19 12:41
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_usernames(apps, schema_editor):
+    AdminLoginLog = apps.get_model('main_app', 'AdminLoginLog')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    db = schema_editor.connection.alias
+    AdminLoginLog.objects.using(db).filter(username='', user__isnull=False).update(
+        username=Subquery(User.objects.using(db).filter(pk=OuterRef('user_id')).values('username')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0026_mobile_error_store'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='adminloginlog',
+            name='username',
+            field=models.CharField(blank=True, max_length=150),
+        ),
+        migrations.RunPython(backfill_usernames, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='adminloginlog',
+            name='login_time',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='adminloginlog',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='admin_logins', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
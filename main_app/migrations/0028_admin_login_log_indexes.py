@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-19 12:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0027_admin_login_log_username'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='adminloginlog',
+            name='user',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='admin_logins', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='adminloginlog',
+            index=models.Index(fields=['login_time', 'success'], name='adminlog_time_success_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adminloginlog',
+            index=models.Index(fields=['user', 'login_time'], name='adminlog_user_time_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations, models
+from django.utils.crypto import salted_hmac
+
+
+def hash_existing_codes(apps, schema_editor):
+    # Same keyed hash as PasswordResetCode.hash_code, so outstanding codes keep working
+    PasswordResetCode = apps.get_model('main_app', 'PasswordResetCode')
+    db = schema_editor.connection.alias
+    codes = list(PasswordResetCode.objects.using(db).filter(is_used=False).only('id', 'user_id', 'code'))
+    for reset_code in codes:
+        reset_code.code_hash = salted_hmac(
+            'main_app.PasswordResetCode', f'{reset_code.user_id}:{reset_code.code}', algorithm='sha256'
+        ).hexdigest()
+    PasswordResetCode.objects.using(db).bulk_update(codes, ['code_hash'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0029_email_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='passwordresetcode',
+            name='code_hash',
+            field=models.CharField(default='', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='passwordresetcode',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(hash_existing_codes, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='passwordresetcode',
+            name='code',
+        ),
+        migrations.AddIndex(
+            model_name='passwordresetcode',
+            index=models.Index(condition=models.Q(('is_used', False)), fields=['user', 'expires_at'], name='resetcode_active_idx'),
+        ),
+    ]
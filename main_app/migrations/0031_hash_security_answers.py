@@ -0,0 +1,40 @@
+from django.contrib.auth.hashers import make_password
+from django.db import migrations, models
+
+
+def normalize_answer(answer):
+    return ' '.join((answer or '').split()).lower()
+
+
+def hash_answers(apps, schema_editor):
+    # One-time conversion of the plaintext answers, normalized as in UserSecurityQuestions.hash_answer
+    UserSecurityQuestions = apps.get_model('main_app', 'UserSecurityQuestions')
+    db = schema_editor.connection.alias
+    rows = list(UserSecurityQuestions.objects.using(db).only('id', 'security_answer', 'professor_last_name'))
+    for row in rows:
+        for field in ('security_answer', 'professor_last_name'):
+            normalized = normalize_answer(getattr(row, field))
+            setattr(row, field, make_password(normalized) if normalized else '')
+    UserSecurityQuestions.objects.using(db).bulk_update(rows, ['security_answer', 'professor_last_name'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0030_hash_password_reset_codes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='usersecurityquestions',
+            name='professor_last_name',
+            field=models.CharField(help_text="Hash of Professor Rob's last name", max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='usersecurityquestions',
+            name='security_answer',
+            field=models.CharField(help_text='Hash of the answer to the security question', max_length=255),
+        ),
+        # Hashes can't be turned back into answers
+        migrations.RunPython(hash_answers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0031_hash_security_answers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='waitlistentry',
+            name='dedup_key',
+            field=models.CharField(blank=True, editable=False, max_length=355, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='waitlistentry',
+            constraint=models.UniqueConstraint(fields=('dedup_key',), name='waitlist_dedup_key_uniq'),
+        ),
+    ]
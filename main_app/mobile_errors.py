@@ -0,0 +1,283 @@
+"""
+Mobile error report store
+
+Reports from mobile-error-reporter.js are validated in the request and put
+on an in-process BatchBuffer; a background thread writes them out in
+batches. The request itself never touches the database: its rate limit is
+counted in report_limits, a process-local backend, so the per-client limit
+applies per worker rather than across all of them.
+
+Each report gets a fingerprint from its error type, its message with the
+variable parts (numbers, ids, URLs, quoted values) masked, and the top stack
+frames without line numbers or bundle hashes. Per flush, reports are folded
+into:
+- MobileErrorGroup: one row per fingerprint with an occurrence counter,
+- MobileErrorCount: counts per group, hour, device and browser (what the
+  aggregate API reads),
+- MobileErrorReport: at most MOBILE_ERROR_SAMPLES_PER_FLUSH sample reports
+  per group, so an error storm is counted exactly but stored once.
+"""
+import hashlib
+import re
+from collections import Counter
+from datetime import timedelta
+from ipaddress import ip_address
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .buffering import BatchBuffer
+from .models import MobileErrorCount, MobileErrorGroup, MobileErrorReport
+from .ratelimit import MemoryBackend
+
+
+MAX_BATCH_REPORTS = 50
+MAX_TYPE_LENGTH = 100
+MAX_MESSAGE_LENGTH = 2000
+MAX_STACK_LENGTH = 10000
+MAX_URL_LENGTH = 2000
+SIGNATURE_FRAMES = 5
+DETAIL_FIELDS = ('browser_info', 'network_info', 'request_url', 'response_status')
+MAX_SUMMARY_HOURS = 24 * 366
+
+MESSAGE_MASKS = [
+    (re.compile(r'https?://\S+'), '<url>'),
+    (re.compile(r'\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b', re.I), '<uuid>'),
+    (re.compile(r'\b0x[0-9a-f]+\b|\b[0-9a-f]{12,}\b', re.I), '<hex>'),
+    (re.compile(r'"[^"]*"|\'[^\']*\''), '<str>'),
+    (re.compile(r'\d+(\.\d+)?'), '<n>'),
+]
+FRAME_LOCATION = re.compile(r'(?:https?://[^/\s]+)?(?:/[^\s:()]*/)?([^/\s:()]+?)(?:\.[0-9a-f]{6,})?(\.\w+)?(?:\?[^\s:()]*)?(?::\d+){1,2}')
+
+
+def normalize_message(message):
+    for pattern, replacement in MESSAGE_MASKS:
+        message = pattern.sub(replacement, message)
+    return ' '.join(message.split())[:300]
+
+
+def stack_signature(stack):
+    """Top frames with line numbers, hosts, query strings and bundle hashes removed"""
+    frames = []
+    for line in stack.splitlines():
+        line = line.strip()
+        if not line or not (line.startswith('at ') or '@' in line or FRAME_LOCATION.search(line)):
+            continue
+        frames.append(FRAME_LOCATION.sub(lambda m: m.group(1) + (m.group(2) or ''), line))
+        if len(frames) == SIGNATURE_FRAMES:
+            break
+    return '\n'.join(frames)
+
+
+def fingerprint(error_type, message, signature):
+    return hashlib.sha256(f'{error_type}\n{normalize_message(message)}\n{signature}'.encode()).hexdigest()
+
+
+def _text(value, limit):
+    return value[:limit] if isinstance(value, str) else ''
+
+
+def parse_reports(payload):
+    """
+    Accepts one report object, a list of them, or {"reports": [...]}.
+    Returns the list of report dicts; raises ValueError if the payload is malformed.
+    """
+    if isinstance(payload, dict) and isinstance(payload.get('reports'), list):
+        payload = payload['reports']
+    reports = payload if isinstance(payload, list) else [payload]
+    if not reports:
+        raise ValueError('No reports provided')
+    if len(reports) > MAX_BATCH_REPORTS:
+        raise ValueError(f'At most {MAX_BATCH_REPORTS} reports per request')
+    if not all(isinstance(report, dict) for report in reports):
+        raise ValueError('Each report must be an object')
+    return reports
+
+
+def build_report(raw, user_agent, client, ip, received_at):
+    error_type = _text(raw.get('error_type'), MAX_TYPE_LENGTH) or 'unknown'
+    message = _text(raw.get('error_message'), MAX_MESSAGE_LENGTH)
+    stack = _text(raw.get('error_stack'), MAX_STACK_LENGTH)
+    signature = stack_signature(stack)
+    try:
+        ip = str(ip_address(ip)) if ip else None
+    except ValueError:
+        ip = None
+    return {
+        'fingerprint': fingerprint(error_type, message, signature),
+        'error_type': error_type,
+        'message': message,
+        'signature': signature,
+        'stack': stack,
+        'received_at': received_at,
+        'device': client.device,
+        'browser': client.browser,
+        'user_agent': user_agent[:1000],
+        'ip': ip,
+        'page_url': _text(raw.get('page_url'), MAX_URL_LENGTH),
+        'details': {field: raw[field] for field in DETAIL_FIELDS if field in raw},
+    }
+
+
+def record_reports(raw_reports, user_agent, client, ip):
+    """
+    Queue validated reports for storage; `client` is the request's ClientInfo.
+    Returns (fingerprints of accepted reports, dropped count).
+    """
+    now = timezone.now()
+    reports = [build_report(raw, user_agent, client, ip, now) for raw in raw_reports]
+    accepted = error_buffer.extend(reports)
+    return [report['fingerprint'] for report in reports[:accepted]], len(reports) - accepted
+
+
+GROUP_UPSERT_SQL = """
+    INSERT INTO {table} (fingerprint, error_type, message, stack_signature, first_seen, last_seen, occurrences)
+    VALUES {values}
+    ON CONFLICT (fingerprint) DO UPDATE SET
+        occurrences = {table}.occurrences + EXCLUDED.occurrences,
+        last_seen = GREATEST({table}.last_seen, EXCLUDED.last_seen)
+    RETURNING id, fingerprint
+"""
+
+COUNT_UPSERT_SQL = """
+    INSERT INTO {table} (group_id, hour, device, browser, count)
+    VALUES {values}
+    ON CONFLICT (group_id, hour, device, browser) DO UPDATE SET
+        count = {table}.count + EXCLUDED.count
+"""
+
+
+def store_reports(reports):
+    """BatchBuffer flush function: fold a batch of reports into groups, hourly counts and samples"""
+    groups = {}
+    counts = Counter()
+    samples = []
+    samples_per_group = Counter()
+    for report in reports:
+        key = report['fingerprint']
+        group = groups.get(key)
+        if group is None:
+            groups[key] = group = {
+                'error_type': report['error_type'],
+                'message': normalize_message(report['message']) if report['message'] else '',
+                'signature': report['signature'],
+                'first_seen': report['received_at'],
+                'last_seen': report['received_at'],
+                'occurrences': 0,
+            }
+        group['occurrences'] += 1
+        group['first_seen'] = min(group['first_seen'], report['received_at'])
+        group['last_seen'] = max(group['last_seen'], report['received_at'])
+        hour = report['received_at'].replace(minute=0, second=0, microsecond=0)
+        counts[(key, hour, report['device'], report['browser'])] += 1
+        if samples_per_group[key] < settings.MOBILE_ERROR_SAMPLES_PER_FLUSH:
+            samples_per_group[key] += 1
+            samples.append(report)
+
+    # Rows are written in key order so concurrent flushes from other workers can't deadlock
+    group_rows = [
+        (key, g['error_type'], g['message'], g['signature'], g['first_seen'], g['last_seen'], g['occurrences'])
+        for key, g in sorted(groups.items())
+    ]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            GROUP_UPSERT_SQL.format(
+                table=MobileErrorGroup._meta.db_table,
+                values=', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(group_rows)),
+            ),
+            [value for row in group_rows for value in row],
+        )
+        group_ids = {key: group_id for group_id, key in cursor.fetchall()}
+
+        count_rows = sorted(
+            (group_ids[key], hour, device, browser, amount)
+            for (key, hour, device, browser), amount in counts.items()
+        )
+        cursor.execute(
+            COUNT_UPSERT_SQL.format(
+                table=MobileErrorCount._meta.db_table,
+                values=', '.join(['(%s, %s, %s, %s, %s)'] * len(count_rows)),
+            ),
+            [value for row in count_rows for value in row],
+        )
+
+        MobileErrorReport.objects.bulk_create([
+            MobileErrorReport(
+                group_id=group_ids[report['fingerprint']],
+                received_at=report['received_at'],
+                device=report['device'],
+                browser=report['browser'],
+                user_agent=report['user_agent'],
+                ip=report['ip'],
+                page_url=report['page_url'],
+                message=report['message'],
+                stack=report['stack'],
+                details=report['details'],
+            )
+            for report in samples
+        ])
+
+
+error_buffer = BatchBuffer(
+    'mobile-errors',
+    store_reports,
+    flush_size=500,
+    flush_interval=settings.MOBILE_ERROR_FLUSH_INTERVAL,
+    max_pending=settings.MOBILE_ERROR_BUFFER_SIZE,
+)
+
+# Rate limit counters for the report endpoint, kept off the shared backend
+report_limits = MemoryBackend()
+
+
+def error_summary(since, limit=20, device=None, browser=None):
+    """Top error groups and device/browser breakdowns since `since`, from the hourly counts"""
+    counts = MobileErrorCount.objects.filter(hour__gte=since.replace(minute=0, second=0, microsecond=0))
+    if device:
+        counts = counts.filter(device=device)
+    if browser:
+        counts = counts.filter(browser=browser)
+
+    top = list(counts.values('group').annotate(count=Sum('count')).order_by('-count', 'group')[:limit])
+    groups = MobileErrorGroup.objects.in_bulk([row['group'] for row in top])
+    return {
+        'since': since,
+        'total': counts.aggregate(total=Sum('count'))['total'] or 0,
+        'top_errors': [
+            {
+                'id': row['group'],
+                'fingerprint': groups[row['group']].fingerprint,
+                'error_type': groups[row['group']].error_type,
+                'message': groups[row['group']].message,
+                'count': row['count'],
+                'occurrences': groups[row['group']].occurrences,
+                'first_seen': groups[row['group']].first_seen,
+                'last_seen': groups[row['group']].last_seen,
+            }
+            for row in top
+        ],
+        'by_device': list(counts.values('device').annotate(count=Sum('count')).order_by('-count')),
+        'by_browser': list(counts.values('browser').annotate(count=Sum('count')).order_by('-count')),
+    }
+
+
+def prune_mobile_errors(report_days=None, count_days=None, batch_size=5000):
+    """Apply the retention settings; returns the number of rows deleted per model"""
+    now = timezone.now()
+    report_cutoff = now - timedelta(days=report_days or settings.MOBILE_ERROR_REPORT_RETENTION_DAYS)
+    count_cutoff = now - timedelta(days=count_days or settings.MOBILE_ERROR_COUNT_RETENTION_DAYS)
+    deleted = Counter()
+    for model, queryset in (
+        (MobileErrorReport, MobileErrorReport.objects.filter(received_at__lt=report_cutoff)),
+        (MobileErrorCount, MobileErrorCount.objects.filter(hour__lt=count_cutoff)),
+        # Deleting a group also deletes its remaining counts and samples
+        (MobileErrorGroup, MobileErrorGroup.objects.filter(last_seen__lt=count_cutoff)),
+    ):
+        while True:
+            ids = list(queryset.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            deleted[model.__name__] += model.objects.filter(id__in=ids).delete()[1].get(model._meta.label, 0)
+    return dict(deleted)
@@ -1,5 +1,7 @@
-from django.db import models
+from django.db import models, connection
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User
+from django.utils.timezone import now
 from django.core.validators import RegexValidator
 from django.core.exceptions import ValidationError
 from django.contrib.postgres.search import SearchVectorField
@@ -53,6 +55,26 @@ class Folder(models.Model):
                 return True
             current = current.parent
         return False
+    
+    def get_descendant_ids(self, include_self=True):
+        """IDs of every folder below this one, fetched with a single recursive query"""
+        table = self._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH RECURSIVE subtree (id) AS (
+                    SELECT id FROM {table} WHERE parent_id = %s
+                  UNION
+                    SELECT child.id FROM {table} child JOIN subtree ON child.parent_id = subtree.id
+                )
+                SELECT id FROM subtree
+                """,
+                [self.pk],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        if include_self:
+            ids.insert(0, self.pk)
+        return ids
 
 
 class FileTag(models.Model):
@@ -60,6 +82,7 @@ class FileTag(models.Model):
     color = models.CharField(max_length=7, default='#007bff')  # Hex color
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    files_count = models.PositiveIntegerField(default=0, editable=False)  # Kept in sync by main_app.tagging
     
     def __str__(self):
         return self.name
@@ -179,10 +202,15 @@ class FilePermission(models.Model):
     granted_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='granted_permissions')
     granted_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
     
     class Meta:
         unique_together = ['file', 'user']
         ordering = ['-granted_at']
+        indexes = [
+            # Lets the expiry sweeper find expiring grants without scanning permanent ones
+            models.Index(fields=['expires_at'], condition=models.Q(expires_at__isnull=False), name='filepermission_expires_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.permission_type} on {self.file.name}"
@@ -195,6 +223,34 @@ class FilePermission(models.Model):
         return False
 
 
+class FolderPermission(models.Model):
+    """Grant on a folder, inherited by every file and subfolder beneath it"""
+    folder = models.ForeignKey(Folder, on_delete=models.CASCADE, related_name='permissions')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='folder_permissions')
+    permission_type = models.CharField(max_length=20, choices=FilePermission.PERMISSION_CHOICES, default='read')
+    granted_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='granted_folder_permissions')
+    granted_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+    
+    class Meta:
+        unique_together = ['folder', 'user']
+        ordering = ['-granted_at']
+        indexes = [
+            models.Index(fields=['expires_at'], condition=models.Q(expires_at__isnull=False), name='folderpermission_expires_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.permission_type} on folder {self.folder.name}"
+    
+    def is_expired(self):
+        """Check if the permission has expired"""
+        if self.expires_at:
+            from django.utils import timezone
+            return timezone.now() > self.expires_at
+        return False
+
+
 class FilePreview(models.Model):
     file = models.OneToOneField(File, on_delete=models.CASCADE, related_name='preview')
     thumbnail = models.ImageField(upload_to='thumbnails/', null=True, blank=True)
@@ -206,9 +262,16 @@ class FilePreview(models.Model):
 
 
 class WaitlistEntry(models.Model):
+    # Postgres sequence backing entry IDs (created in migration 0017)
+    ENTRY_ID_SEQUENCE = 'main_app_waitlistentry_entry_seq'
+
     entry_id = models.CharField(max_length=20, unique=True, editable=False, blank=True)
     email = models.EmailField()
+    campaign = models.CharField(max_length=100, blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Set by bulk ingestion only (see main_app.ingestion.dedup_key), so concurrent
+    # imports can't add the same email twice. Signups leave it empty.
+    dedup_key = models.CharField(max_length=355, null=True, blank=True, editable=False)
     
     def clean(self):
         super().clean()
@@ -227,23 +290,38 @@ class WaitlistEntry(models.Model):
     def save(self, *args, **kwargs):
         if not self.entry_id:
             # Generate unique entry ID: WL-001, WL-002, etc.
-            last_entry = WaitlistEntry.objects.order_by('-id').first()
-            if last_entry and last_entry.entry_id:
-                last_id_num = int(last_entry.entry_id.replace("WL-", ""))
-                new_id_num = last_id_num + 1
-            else:
-                new_id_num = 1
-            self.entry_id = f"WL-{new_id_num:03d}"  # WL-001, WL-002, etc.
+            self.entry_id = self.allocate_entry_ids(1)[0]
         
         self.clean()
         super().save(*args, **kwargs)
     
+    @classmethod
+    def allocate_entry_ids(cls, count):
+        """Reserve `count` entry IDs from the database sequence in one round trip"""
+        if count <= 0:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(%s) FROM generate_series(1, %s)",
+                [cls.ENTRY_ID_SEQUENCE, count]
+            )
+            return [f"WL-{row[0]:03d}" for row in cursor.fetchall()]  # WL-001, WL-002, etc.
+    
     def __str__(self):
         return f"{self.entry_id} - {self.email} - {self.created_at.strftime('%Y-%m-%d %H:%M:%S')}"
     
     class Meta:
         verbose_name_plural = "Waitlist Entries"
         ordering = ['-created_at']
+        indexes = [
+            # Case-insensitive duplicate lookups during bulk ingestion
+            models.Index(Lower('email'), 'campaign', name='waitlist_email_campaign_idx'),
+            # Date-range filters on exports
+            models.Index(fields=['created_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['dedup_key'], name='waitlist_dedup_key_uniq'),
+        ]
 
 
 class ContactSubmission(models.Model):
@@ -311,6 +389,12 @@ class ContactUs(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Date-range filters on exports
+            models.Index(fields=['created_at']),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.entry_id:
             # Generate unique entry ID: CU-001, CU-002, etc.
@@ -355,9 +439,14 @@ class ContactUs(models.Model):
 
 
 class UserSecurityQuestions(models.Model):
+    """
+    Security question answers, stored like passwords: normalized (case and
+    surrounding/repeated whitespace don't matter), then salted and hashed
+    with the configured password hasher. Set them with set_answers().
+    """
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='security_questions')
-    security_answer = models.CharField(max_length=255, help_text="Answer to security question")
-    professor_last_name = models.CharField(max_length=100, help_text="Professor Rob's last name")
+    security_answer = models.CharField(max_length=255, help_text="Hash of the answer to the security question")
+    professor_last_name = models.CharField(max_length=255, help_text="Hash of Professor Rob's last name")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -368,29 +457,59 @@ class UserSecurityQuestions(models.Model):
     def __str__(self):
         return f"Security questions for {self.user.username}"
     
+    @staticmethod
+    def normalize_answer(answer):
+        return ' '.join((answer or '').split()).lower()
+    
+    @classmethod
+    def hash_answer(cls, answer):
+        """Salted hash of the normalized answer; a blank answer stays blank (not set)"""
+        from django.contrib.auth.hashers import make_password
+        normalized = cls.normalize_answer(answer)
+        return make_password(normalized) if normalized else ''
+    
+    def set_answers(self, security_answer, professor_last_name):
+        self.security_answer = self.hash_answer(security_answer)
+        self.professor_last_name = self.hash_answer(professor_last_name)
+    
+    def _check(self, answer, encoded):
+        from django.contrib.auth.hashers import check_password
+        normalized = self.normalize_answer(answer)
+        return bool(normalized and encoded) and check_password(normalized, encoded)
+    
     def verify_security_answer(self, answer):
         """Verify the security answer (case-insensitive)"""
-        return self.security_answer.lower().strip() == answer.lower().strip()
+        return self._check(answer, self.security_answer)
     
     def verify_professor_lastname(self, lastname):
         """Verify professor's last name (case-insensitive)"""
-        return self.professor_last_name.lower().strip() == lastname.lower().strip()
+        return self._check(lastname, self.professor_last_name)
 
 
 class PasswordResetCode(models.Model):
+    """
+    A one-time password reset code. Only a keyed hash of the code, scoped to
+    the user, is stored; the code itself exists only in the email. Each wrong
+    guess counts against PASSWORD_RESET_MAX_ATTEMPTS.
+    """
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reset_codes')
-    code = models.CharField(max_length=6, unique=True)
+    code_hash = models.CharField(max_length=64)
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField()
     is_used = models.BooleanField(default=False)
+    attempts = models.PositiveSmallIntegerField(default=0)
     
     class Meta:
         verbose_name = "Password Reset Code"
         verbose_name_plural = "Password Reset Codes"
         ordering = ['-created_at']
+        indexes = [
+            # Active codes only: the verify lookup and the invalidation in create_for_user
+            models.Index(fields=['user', 'expires_at'], name='resetcode_active_idx', condition=models.Q(is_used=False)),
+        ]
     
     def __str__(self):
-        return f"Reset code for {self.user.username} - {self.code}"
+        return f"Reset code for {self.user.username} ({'used' if self.is_used else 'active'})"
     
     def is_expired(self):
         """Check if the code has expired"""
@@ -398,17 +517,24 @@ class PasswordResetCode(models.Model):
         return timezone.now() > self.expires_at
     
     def is_valid(self):
-        """Check if the code is valid (not expired and not used)"""
-        return not self.is_expired() and not self.is_used
+        """Check if the code is valid (not expired, not used and not guessed at too often)"""
+        from django.conf import settings
+        return not self.is_expired() and not self.is_used and self.attempts < settings.PASSWORD_RESET_MAX_ATTEMPTS
     
     @classmethod
     def generate_code(cls):
         """Generate a random 6-digit code"""
         return ''.join(secrets.choice('0123456789') for _ in range(6))
     
+    @staticmethod
+    def hash_code(user_id, code):
+        """HMAC of the code keyed with SECRET_KEY and scoped to the user"""
+        from django.utils.crypto import salted_hmac
+        return salted_hmac('main_app.PasswordResetCode', f'{user_id}:{code}', algorithm='sha256').hexdigest()
+    
     @classmethod
     def create_for_user(cls, user):
-        """Create a new reset code for a user"""
+        """Create a new reset code for a user; the plain code is on the returned instance's `code`"""
         # Invalidate any existing codes for this user
         cls.objects.filter(user=user, is_used=False).update(is_used=True)
         
@@ -417,16 +543,67 @@ class PasswordResetCode(models.Model):
         code = cls.generate_code()
         expires_at = timezone.now() + timedelta(minutes=15)  # 15 minutes expiry
         
-        return cls.objects.create(
+        reset_code = cls.objects.create(
             user=user,
-            code=code,
+            code_hash=cls.hash_code(user.pk, code),
             expires_at=expires_at
         )
+        reset_code.code = code
+        return reset_code
+    
+    @classmethod
+    def check_code(cls, email, code, consume=False):
+        """
+        The user's active reset code if `code` matches it, else None. One
+        indexed query finds the code (through auth_user's lower(email) index);
+        a wrong code only increments its attempt counter. With consume=True
+        the code is atomically marked used, so it works exactly once.
+        """
+        from django.conf import settings
+        from django.db.models import F
+        from django.utils import timezone
+        from django.utils.crypto import constant_time_compare
+        
+        max_attempts = settings.PASSWORD_RESET_MAX_ATTEMPTS
+        reset_code = (
+            cls.objects.select_related('user')
+            .annotate(email_lower=Lower('user__email'))
+            .filter(email_lower=email.strip().lower(), is_used=False, expires_at__gt=timezone.now(), attempts__lt=max_attempts)
+            .order_by('-created_at')
+            .first()
+        )
+        if reset_code is None:
+            return None
+        active = cls.objects.filter(pk=reset_code.pk, is_used=False, attempts__lt=max_attempts)
+        if not constant_time_compare(reset_code.code_hash, cls.hash_code(reset_code.user_id, code)):
+            active.update(attempts=F('attempts') + 1)
+            return None
+        if consume and not active.update(is_used=True):
+            # Used up by a concurrent request
+            return None
+        return reset_code
+    
+    @classmethod
+    def prune(cls, batch_size=5000):
+        """Delete used and expired codes in batches; returns the number deleted"""
+        from django.utils import timezone
+        stale = cls.objects.filter(models.Q(is_used=True) | models.Q(expires_at__lte=timezone.now()))
+        deleted = 0
+        while True:
+            ids = list(stale.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            deleted += cls.objects.filter(id__in=ids).delete()[0]
+        return deleted
 
 
 class AdminLoginLog(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='admin_logins')
-    login_time = models.DateTimeField(auto_now_add=True)
+    # Rows are written in batches by main_app.audit; `username` is what was
+    # typed, so unknown usernames are logged too (with user=None)
+    # Indexed by adminlog_user_time_idx below, which also serves user-only lookups
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, db_index=False, related_name='admin_logins')
+    username = models.CharField(max_length=150, blank=True)
+    login_time = models.DateTimeField(default=now)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(blank=True)
     success = models.BooleanField(default=True)
@@ -436,51 +613,28 @@ class AdminLoginLog(models.Model):
         verbose_name = "Admin Login Log"
         verbose_name_plural = "Admin Login Logs"
         ordering = ['-login_time']
+        indexes = [
+            # Time-range analytics and the success/failure split (see main_app.audit.login_summary)
+            models.Index(fields=['login_time', 'success'], name='adminlog_time_success_idx'),
+            # One user's history, newest first
+            models.Index(fields=['user', 'login_time'], name='adminlog_user_time_idx'),
+        ]
     
     def __str__(self):
         status = "SUCCESS" if self.success else f"FAILED: {self.failure_reason}"
-        return f"{self.user.username} - {self.login_time} - {status}"
+        return f"{self.username} - {self.login_time} - {status}"
     
     @classmethod
     def log_successful_login(cls, user, request=None):
-        """Log a successful admin login"""
-        ip_address = None
-        user_agent = ""
-        
-        if request:
-            ip_address = cls.get_client_ip(request)
-            user_agent = request.META.get('HTTP_USER_AGENT', '')
-        
-        return cls.objects.create(
-            user=user,
-            ip_address=ip_address,
-            user_agent=user_agent,
-            success=True
-        )
+        """Queue a successful admin login for the audit log"""
+        from .audit import record_admin_login
+        return record_admin_login(user.username, request, success=True, user_id=user.pk)
     
     @classmethod
     def log_failed_login(cls, username, request=None, failure_reason=""):
-        """Log a failed admin login attempt"""
-        ip_address = None
-        user_agent = ""
-        
-        if request:
-            ip_address = cls.get_client_ip(request)
-            user_agent = request.META.get('HTTP_USER_AGENT', '')
-        
-        # Try to find the user, or create a placeholder entry
-        try:
-            user = User.objects.get(username=username)
-        except User.DoesNotExist:
-            user = None
-        
-        return cls.objects.create(
-            user=user,
-            ip_address=ip_address,
-            user_agent=user_agent,
-            success=False,
-            failure_reason=failure_reason
-        )
+        """Queue a failed admin login attempt for the audit log"""
+        from .audit import record_admin_login
+        return record_admin_login(username, request, success=False, failure_reason=failure_reason)
     
     @staticmethod
     def get_client_ip(request):
@@ -491,3 +645,132 @@ class AdminLoginLog(models.Model):
         else:
             ip = request.META.get('REMOTE_ADDR')
         return ip
+
+
+class RateLimitCounter(models.Model):
+    """Rate limit state for the database rate limit backend (see main_app.ratelimit)"""
+    key = models.CharField(max_length=255, unique=True)
+    count = models.BigIntegerField(default=0)
+    state = models.JSONField(null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return f"{self.key}: {self.count}"
+
+
+class CacheVersion(models.Model):
+    """Invalidation counter for a family of cached values (see main_app.cache.bump_version)"""
+    name = models.CharField(max_length=100, unique=True)
+    version = models.BigIntegerField()
+    
+    def __str__(self):
+        return f"{self.name}: {self.version}"
+
+
+class RevokedToken(models.Model):
+    """A revoked JWT, kept until the token would have expired anyway (see main_app.revocation)"""
+    jti = models.CharField(max_length=255, unique=True)
+    token_type = models.CharField(max_length=20, blank=True)
+    # No FK constraint: tokens of since-deleted users can still be revoked
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='revoked_tokens')
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return f"{self.token_type} {self.jti}"
+
+
+class MobileErrorGroup(models.Model):
+    """Mobile error reports that share a fingerprint (see main_app.mobile_errors)"""
+    fingerprint = models.CharField(max_length=64, unique=True)
+    error_type = models.CharField(max_length=100)
+    message = models.TextField()
+    stack_signature = models.TextField(blank=True)
+    first_seen = models.DateTimeField()
+    last_seen = models.DateTimeField(db_index=True)
+    occurrences = models.BigIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-last_seen']
+    
+    def __str__(self):
+        return f"{self.error_type}: {self.message[:80]} ({self.occurrences})"
+
+
+class MobileErrorCount(models.Model):
+    """Occurrences of an error group per hour, device and browser"""
+    group = models.ForeignKey(MobileErrorGroup, on_delete=models.CASCADE, related_name='counts')
+    hour = models.DateTimeField()
+    device = models.CharField(max_length=20)
+    browser = models.CharField(max_length=20)
+    count = models.BigIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'hour', 'device', 'browser'], name='mobile_error_count_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['hour']),
+        ]
+    
+    def __str__(self):
+        return f"{self.group_id} {self.hour:%Y-%m-%d %H:00} {self.device}/{self.browser}: {self.count}"
+
+
+class MobileErrorReport(models.Model):
+    """A stored sample of an individual report; every report is counted in MobileErrorCount"""
+    group = models.ForeignKey(MobileErrorGroup, on_delete=models.CASCADE, related_name='reports')
+    received_at = models.DateTimeField(db_index=True)
+    device = models.CharField(max_length=20)
+    browser = models.CharField(max_length=20)
+    user_agent = models.TextField(blank=True)
+    ip = models.GenericIPAddressField(null=True, blank=True)
+    page_url = models.TextField(blank=True)
+    message = models.TextField(blank=True)
+    stack = models.TextField(blank=True)
+    details = models.JSONField(default=dict, blank=True)
+    
+    class Meta:
+        ordering = ['-received_at']
+        indexes = [
+            models.Index(fields=['group', 'received_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.group_id} at {self.received_at}"
+
+
+class EmailOutbox(models.Model):
+    """An email waiting to be sent, written in the transaction that produced it (see main_app.outbox)"""
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (SENT, 'Sent'), (FAILED, 'Failed')]
+
+    to_email = models.EmailField()
+    from_email = models.CharField(max_length=254)
+    subject = models.CharField(max_length=255)
+    # Cleared once the email is sent, since it may hold a reset code
+    body = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Email Outbox Entry"
+        verbose_name_plural = "Email Outbox"
+        ordering = ['-created_at']
+        indexes = [
+            # The drain query only ever looks at pending rows
+            models.Index(
+                fields=['next_attempt_at'],
+                name='emailoutbox_due_idx',
+                condition=models.Q(status='pending'),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to_email} ({self.status})"
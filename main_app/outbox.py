@@ -0,0 +1,176 @@
+"""
+Transactional email outbox
+
+queue_email() writes an EmailOutbox row in the caller's transaction, so an
+email exists exactly when the change that caused it was committed, and the
+request never waits on the mail server. Once the transaction commits, the
+worker thread of this process is woken to send it.
+
+drain_outbox() sends due emails in batches over one SMTP connection per
+batch. Each row is claimed before sending, by pushing its next attempt time
+past the claim timeout, so concurrent drains (other workers, the
+drain_email_outbox command) never send the same email twice, and an email
+claimed by a process that died is retried once the claim runs out. Failed
+sends are retried with exponential backoff up to EMAIL_OUTBOX_MAX_ATTEMPTS,
+then marked failed.
+
+With EMAIL_OUTBOX_WORKER on, each server process starts a worker thread
+with its first request (see apps.py), so retries and emails left behind by
+a restart are sent without waiting for the process to queue one itself;
+the thread drains once at start, then when woken and every
+EMAIL_OUTBOX_POLL_INTERVAL seconds. `python manage.py drain_email_outbox`
+sends what is due from cron, or runs as a dedicated sender with --loop
+(then set EMAIL_OUTBOX_WORKER=False to keep sending out of the web workers).
+"""
+import logging
+import os
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+
+logger = logging.getLogger(__name__)
+
+CLAIM_TIMEOUT = timedelta(minutes=10)
+MAX_RETRY_DELAY = 3600
+
+
+def queue_email(to_email, subject, body, from_email=None):
+    """Add an email to the outbox in the current transaction; it is sent after commit"""
+    entry = EmailOutbox.objects.create(
+        to_email=to_email,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        subject=subject,
+        body=body,
+    )
+    if settings.EMAIL_OUTBOX_WORKER:
+        transaction.on_commit(worker.wake)
+    return entry
+
+
+def retry_delay(attempts):
+    return min(settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+def claim_batch(batch_size):
+    """Lock up to batch_size due emails for this drain; returns them"""
+    now = timezone.now()
+    with transaction.atomic():
+        entries = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status=EmailOutbox.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        for entry in entries:
+            entry.attempts += 1
+            entry.next_attempt_at = now + CLAIM_TIMEOUT
+        EmailOutbox.objects.bulk_update(entries, ['attempts', 'next_attempt_at'])
+    return entries
+
+
+def send_batch(entries):
+    """Send claimed emails over one connection and record each one's outcome; returns (sent, failed)"""
+    sent, failed = [], []
+    try:
+        smtp = get_connection(fail_silently=False)
+        smtp.open()
+    except Exception as e:
+        failed = [(entry, e) for entry in entries]
+    else:
+        try:
+            for entry in entries:
+                message = EmailMessage(entry.subject, entry.body, entry.from_email, [entry.to_email], connection=smtp)
+                try:
+                    smtp.send_messages([message])
+                except Exception as e:
+                    failed.append((entry, e))
+                else:
+                    sent.append(entry)
+        finally:
+            try:
+                smtp.close()
+            except Exception:
+                logger.warning('Error closing the mail connection', exc_info=True)
+
+    now = timezone.now()
+    for entry in sent:
+        entry.status = EmailOutbox.SENT
+        entry.sent_at = now
+        entry.body = ''
+        entry.last_error = ''
+    for entry, error in failed:
+        entry.last_error = f'{type(error).__name__}: {error}'[:1000]
+        if entry.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+            entry.status = EmailOutbox.FAILED
+            logger.error('Giving up on email %s after %s attempts: %s', entry.pk, entry.attempts, entry.last_error)
+        else:
+            entry.next_attempt_at = now + timedelta(seconds=retry_delay(entry.attempts))
+            logger.warning('Email %s failed (attempt %s): %s', entry.pk, entry.attempts, entry.last_error)
+    EmailOutbox.objects.bulk_update(entries, ['status', 'sent_at', 'body', 'last_error', 'next_attempt_at'])
+    return len(sent), len(failed)
+
+
+def drain_outbox(batch_size=None, max_batches=None):
+    """Send everything that is due; returns (sent, failed) totals"""
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    sent = failed = batches = 0
+    while max_batches is None or batches < max_batches:
+        entries = claim_batch(batch_size)
+        if not entries:
+            break
+        batch_sent, batch_failed = send_batch(entries)
+        sent += batch_sent
+        failed += batch_failed
+        batches += 1
+        if batch_sent == 0:
+            # The mail server is down; leave the rest for the retry schedule
+            break
+    return sent, failed
+
+
+class OutboxWorker:
+    """Background thread that drains the outbox when woken and every EMAIL_OUTBOX_POLL_INTERVAL seconds"""
+
+    def __init__(self):
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread_pid = None
+
+    def start(self, **kwargs):
+        """Start this process's thread if it isn't running; also a request_started receiver"""
+        self._ensure_thread()
+
+    def wake(self):
+        self._ensure_thread()
+        self._wakeup.set()
+
+    def _ensure_thread(self):
+        # Started lazily, and again after a fork, since threads don't survive forks
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            threading.Thread(target=self._run, name='email-outbox', daemon=True).start()
+
+    def _run(self):
+        while True:
+            close_old_connections()
+            try:
+                drain_outbox()
+            except Exception:
+                logger.exception('Failed to drain the email outbox')
+            finally:
+                connection.close()
+            self._wakeup.wait(settings.EMAIL_OUTBOX_POLL_INTERVAL)
+            self._wakeup.clear()
+
+
+worker = OutboxWorker()
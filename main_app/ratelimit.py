@@ -0,0 +1,346 @@
+"""
+Rate limiting
+
+Limits are enforced with either a sliding window counter (the default) or a
+token bucket, on top of a pluggable backend:
+
+- memory: per-process dict guarded by a lock (single worker / development)
+- cache: a Django cache alias; increments are atomic on Redis, Memcached and
+  LocMem caches, so point it at a shared Redis-compatible cache in production
+- db: the RateLimitCounter table, using atomic upserts and row locks
+
+Requests are keyed per route (the key prefix) and per client, by IP address,
+by user, or by user when authenticated and IP otherwise.
+"""
+import math
+import random
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import RateLimitCounter
+
+
+RateLimitResult = namedtuple('RateLimitResult', ['allowed', 'limit', 'remaining', 'reset', 'retry_after'])
+
+KEY_PREFIX = 'rl'
+
+
+class MemoryBackend:
+    """Process-local backend. Counters are not shared between workers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def _live(self, key, now):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    def incr(self, key, ttl):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live(key, now)
+            count = entry[0] + 1 if entry else 1
+            self._data[key] = (count, entry[1] if entry else now + ttl)
+            if len(self._data) > 10000:
+                self._prune(now)
+            return count
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key, time.monotonic())
+            return entry[0] if entry else 0
+
+    def get_state(self, key):
+        """The state stored by update(), or None"""
+        with self._lock:
+            entry = self._live(key, time.monotonic())
+            return entry[0] if entry else None
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def update(self, key, func, ttl):
+        """Atomically replace the stored state with func(state); returns func's result"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live(key, now)
+            new_state, result = func(entry[0] if entry else None)
+            self._data[key] = (new_state, now + ttl)
+            return result
+
+    def _prune(self, now):
+        for key in [key for key, (_, expires) in self._data.items() if expires <= now]:
+            del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class CacheBackend:
+    """Backend on a Django cache alias, shared between workers when the cache is"""
+
+    lock_timeout = 5
+    lock_attempts = 50
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def incr(self, key, ttl):
+        # add() is a no-op when the key exists, so the TTL is only set once per window
+        self.cache.add(key, 0, ttl)
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Expired between add() and incr()
+            self.cache.set(key, 1, ttl)
+            return 1
+
+    def get(self, key):
+        return self.cache.get(key, 0)
+
+    def get_state(self, key):
+        return self.cache.get(key)
+
+    def delete(self, *keys):
+        self.cache.delete_many(keys)
+
+    def update(self, key, func, ttl):
+        lock_key = f'{key}:lock'
+        locked = False
+        for _ in range(self.lock_attempts):
+            locked = self.cache.add(lock_key, 1, self.lock_timeout)
+            if locked:
+                break
+            time.sleep(0.01)
+        # If the lock holder is stuck, proceed unlocked rather than block the request
+        try:
+            new_state, result = func(self.cache.get(key))
+            self.cache.set(key, new_state, ttl)
+            return result
+        finally:
+            if locked:
+                self.cache.delete(lock_key)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class DatabaseBackend:
+    """Backend on the RateLimitCounter table, shared by every worker using the database"""
+
+    prune_probability = 0.01
+
+    INCR_SQL = """
+        INSERT INTO {table} (key, count, expires_at)
+        VALUES (%(key)s, 1, %(expires_at)s)
+        ON CONFLICT (key) DO UPDATE SET
+            count = CASE WHEN {table}.expires_at <= %(now)s THEN 1 ELSE {table}.count + 1 END,
+            expires_at = CASE WHEN {table}.expires_at <= %(now)s THEN EXCLUDED.expires_at ELSE {table}.expires_at END
+        RETURNING count
+    """
+
+    def incr(self, key, ttl):
+        now = timezone.now()
+        sql = self.INCR_SQL.format(table=RateLimitCounter._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {'key': key, 'now': now, 'expires_at': now + timedelta(seconds=ttl)})
+            count = cursor.fetchone()[0]
+        self._maybe_prune(now)
+        return count
+
+    def get(self, key):
+        count = RateLimitCounter.objects.filter(key=key, expires_at__gt=timezone.now()).values_list('count', flat=True).first()
+        return count or 0
+
+    def get_state(self, key):
+        return RateLimitCounter.objects.filter(key=key, expires_at__gt=timezone.now()).values_list('state', flat=True).first()
+
+    def delete(self, *keys):
+        RateLimitCounter.objects.filter(key__in=keys).delete()
+
+    def update(self, key, func, ttl):
+        now = timezone.now()
+        with transaction.atomic():
+            RateLimitCounter.objects.bulk_create(
+                [RateLimitCounter(key=key, expires_at=now + timedelta(seconds=ttl))],
+                ignore_conflicts=True,
+            )
+            counter = RateLimitCounter.objects.select_for_update().get(key=key)
+            state = counter.state if counter.expires_at > now else None
+            counter.state, result = func(state)
+            counter.expires_at = now + timedelta(seconds=ttl)
+            counter.save(update_fields=['state', 'expires_at'])
+        return result
+
+    def _maybe_prune(self, now):
+        if random.random() < self.prune_probability:
+            RateLimitCounter.objects.filter(expires_at__lte=now).delete()
+
+    def clear(self):
+        RateLimitCounter.objects.all().delete()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the backend named by settings.RATELIMIT_BACKEND, created once per process"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = getattr(settings, 'RATELIMIT_BACKEND', 'cache')
+                if name == 'memory':
+                    _backend = MemoryBackend()
+                elif name == 'db':
+                    _backend = DatabaseBackend()
+                else:
+                    _backend = CacheBackend(getattr(settings, 'RATELIMIT_CACHE_ALIAS', 'default'))
+    return _backend
+
+
+def sliding_window(backend, key, limit, period):
+    """
+    Sliding window counter: the current fixed window's count plus the previous
+    window's count weighted by how much of it still overlaps the sliding window.
+    Rejected requests count too, so a client that keeps retrying stays limited.
+    """
+    now = time.time()
+    window = int(now // period)
+    elapsed = (now % period) / period
+
+    current = backend.incr(f'{key}:{window}', period * 2)
+    previous = backend.get(f'{key}:{window - 1}')
+    estimated = previous * (1 - elapsed) + current
+
+    window_left = period - now % period
+    if estimated <= limit:
+        return RateLimitResult(True, limit, max(0, int(limit - estimated)), math.ceil(window_left), 0)
+
+    if current >= limit:
+        # Wait for the next window, then for this window's weight to fall under the limit
+        retry_after = window_left + period * max(0.0, 1 - limit / current)
+    else:
+        retry_after = (1 - (limit - current) / previous - elapsed) * period
+    retry_after = max(1, math.ceil(retry_after))
+    return RateLimitResult(False, limit, 0, retry_after, retry_after)
+
+
+def token_bucket(backend, key, limit, period):
+    """Token bucket holding up to `limit` tokens, refilled at limit/period tokens per second"""
+    rate = limit / period
+    now = time.time()
+
+    def take(state):
+        tokens, updated_at = state if state else (limit, now)
+        tokens = min(limit, tokens + max(0.0, now - updated_at) * rate)
+        if tokens >= 1:
+            tokens -= 1
+            reset = math.ceil((limit - tokens) / rate)
+            return [tokens, now], RateLimitResult(True, limit, int(tokens), reset, 0)
+        retry_after = max(1, math.ceil((1 - tokens) / rate))
+        return [tokens, now], RateLimitResult(False, limit, 0, retry_after, retry_after)
+
+    return backend.update(f'{key}:tb', take, period)
+
+
+def get_client_ip(request):
+    """
+    Client IP address. X-Forwarded-For is only trusted for the number of
+    proxies in settings.RATELIMIT_PROXY_COUNT, since clients can forge it.
+    """
+    proxy_count = getattr(settings, 'RATELIMIT_PROXY_COUNT', 0)
+    if proxy_count:
+        forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if forwarded:
+            return forwarded[-min(proxy_count, len(forwarded))]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def client_identity(request, key):
+    user = getattr(request, 'user', None)
+    authenticated = bool(user and user.is_authenticated)
+    if key == 'user' or (key == 'user_or_ip' and authenticated):
+        if authenticated:
+            return f'user:{user.pk}'
+    return f'ip:{get_client_ip(request)}'
+
+
+def check_rate_limit(request, key_prefix, limit, period, key='user_or_ip', algorithm=None, backend=None):
+    """Count this request against the limit and return a RateLimitResult"""
+    return check_subject_rate_limit(key_prefix, client_identity(request, key), limit, period, algorithm, backend)
+
+
+def check_subject_rate_limit(key_prefix, subject, limit, period, algorithm=None, backend=None):
+    """
+    Count an attempt against the limit for any subject, e.g. the account a
+    request targets rather than the client making it
+    """
+    algorithm = algorithm or getattr(settings, 'RATELIMIT_ALGORITHM', 'sliding_window')
+    limiter = token_bucket if algorithm == 'token_bucket' else sliding_window
+    return limiter(backend or get_backend(), f'{KEY_PREFIX}:{key_prefix}:{subject}', limit, period)
+
+
+def apply_headers(response, result):
+    response['X-RateLimit-Limit'] = str(result.limit)
+    response['X-RateLimit-Remaining'] = str(result.remaining)
+    response['X-RateLimit-Reset'] = str(result.reset)
+    if not result.allowed:
+        response['Retry-After'] = str(result.retry_after)
+    return response
+
+
+def rate_limit(key_prefix, limit=100, period=3600, key='user_or_ip', algorithm=None, backend=None):
+    """
+    Rate limiting decorator for APIView methods
+    key_prefix: route name the limit applies to
+    limit: maximum requests per period
+    period: time period in seconds
+    key: 'ip', 'user' or 'user_or_ip'
+    algorithm: 'sliding_window' or 'token_bucket' (defaults to settings.RATELIMIT_ALGORITHM)
+    backend: backend instance to count in (defaults to get_backend())
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(self, request, *args, **kwargs):
+            if not getattr(settings, 'RATELIMIT_ENABLED', True):
+                return view_func(self, request, *args, **kwargs)
+
+            result = check_rate_limit(request, key_prefix, limit, period, key, algorithm, backend)
+            if not result.allowed:
+                response = Response(
+                    {'error': 'Rate limit exceeded. Please try again later.', 'retry_after': result.retry_after},
+                    status=status.HTTP_429_TOO_MANY_REQUESTS
+                )
+                return apply_headers(response, result)
+
+            try:
+                response = view_func(self, request, *args, **kwargs)
+            except Exception as exc:
+                # Let DRF render validation errors etc. here so they carry the headers too
+                response = self.handle_exception(exc)
+            return apply_headers(response, result)
+        return wrapper
+    return decorator
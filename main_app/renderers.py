@@ -0,0 +1,36 @@
+"""
+JSON rendering
+
+FastJSONRenderer renders with orjson when it is installed, several times
+faster than the standard library encoder on large listings, and produces
+the same JSON as DRF's JSONRenderer: dates, decimals, lazy strings and
+other non-native types still go through DRF's encoder, and U+2028/U+2029
+are escaped. Indented output (the `indent` media type parameter) and
+anything orjson can't encode fall back to JSONRenderer.
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # optional
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    if orjson is not None:
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except (orjson.JSONEncodeError, TypeError):
+            # e.g. integers beyond 64 bits
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same as JSONRenderer: these are valid JSON but not valid JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
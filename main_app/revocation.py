@@ -0,0 +1,182 @@
+"""
+JWT revocation
+
+Revoked token ids (JTIs) are stored in RevokedToken. Each worker keeps a Bloom
+filter of them, so checking a token is a few in-memory hash probes; only a
+filter hit (a revoked token or a rare false positive) is confirmed against
+the database.
+
+Revoking bumps a version counter (see main_app.cache.bump_version). Workers
+poll that counter at most every REVOCATION_SYNC_INTERVAL seconds and, when it changed,
+add only the rows revoked since their last sync, so a revocation reaches every
+worker within a few seconds without a query per request. Filters are rebuilt
+from scratch after pruning or when they fill up.
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from .cache import bump_version, get_version
+from .models import RevokedToken
+
+
+REVOCATION_SYNC_INTERVAL = 2  # seconds between version checks per worker
+REVOCATION_REBUILD_INTERVAL = 3600  # full rebuild, dropping pruned entries
+# Rows are read back from slightly before the last sync, in case a revocation
+# committed after a later one
+SYNC_OVERLAP = timedelta(seconds=10)
+FILTER_CAPACITY = 100000
+FILTER_ERROR_RATE = 0.001
+VERSION_NAME = 'revocation'
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings"""
+
+    def __init__(self, capacity=FILTER_CAPACITY, error_rate=FILTER_ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        # Double hashing: two 64-bit halves of one digest give every probe position
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+def get_revocation_version():
+    return get_version(VERSION_NAME)
+
+
+def bump_revocation_version():
+    bump_version(VERSION_NAME)
+
+
+class RevocationList:
+    """Per-worker view of the revoked JTIs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filter = None
+        self._version = None
+        self._synced_at = None
+        self._built_at = 0
+        self._checked_at = 0
+
+    def _rebuild(self):
+        now = timezone.now()
+        jtis = list(RevokedToken.objects.filter(expires_at__gt=now).values_list('jti', flat=True))
+        bloom = BloomFilter(capacity=max(FILTER_CAPACITY, len(jtis) * 2))
+        for jti in jtis:
+            bloom.add(jti)
+        self._filter = bloom
+        self._synced_at = now
+        self._built_at = time.monotonic()
+
+    def _sync(self):
+        now = timezone.now()
+        new_jtis = RevokedToken.objects.filter(
+            revoked_at__gte=self._synced_at - SYNC_OVERLAP
+        ).values_list('jti', flat=True)
+        for jti in new_jtis:
+            self._filter.add(jti)
+        self._synced_at = now
+
+    def refresh(self, force=False):
+        """Bring the filter up to date if the shared version moved (checked at most every few seconds)"""
+        now = time.monotonic()
+        if not force and self._filter is not None and now - self._checked_at < REVOCATION_SYNC_INTERVAL:
+            return
+        with self._lock:
+            self._checked_at = now
+            version = get_revocation_version()
+            stale = (
+                self._filter is None
+                or now - self._built_at > REVOCATION_REBUILD_INTERVAL
+                or self._filter.count > self._filter.capacity
+            )
+            if stale:
+                self._rebuild()
+            elif version != self._version:
+                self._sync()
+            self._version = version
+
+    def add(self, jti):
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+
+    def is_revoked(self, jti):
+        self.refresh()
+        if jti not in self._filter:
+            return False
+        # Confirm filter hits, which may be false positives
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+
+revocation_list = RevocationList()
+
+
+def is_token_revoked(token):
+    jti = token.get(api_settings.JTI_CLAIM)
+    return bool(jti) and revocation_list.is_revoked(jti)
+
+
+def revoke_token(token):
+    """
+    Revoke a validated simplejwt token. Returns False if it was already
+    revoked, so callers can use this as an atomic single-use check.
+    """
+    jti = token.get(api_settings.JTI_CLAIM)
+    if not jti:
+        return False
+    exp = token.get('exp')
+    expires_at = (
+        datetime.fromtimestamp(exp, tz=dt_timezone.utc) if exp
+        else timezone.now() + api_settings.REFRESH_TOKEN_LIFETIME
+    )
+    try:
+        with transaction.atomic():
+            RevokedToken.objects.create(
+                jti=jti,
+                token_type=token.get(api_settings.TOKEN_TYPE_CLAIM, ''),
+                user_id=token.get(api_settings.USER_ID_CLAIM),
+                expires_at=expires_at,
+            )
+    except IntegrityError:
+        return False
+    revocation_list.add(jti)
+    transaction.on_commit(bump_revocation_version)
+    return True
+
+
+def prune_revoked_tokens(batch_size=5000):
+    """Delete revocations of tokens that have expired; returns the number deleted"""
+    deleted = 0
+    now = timezone.now()
+    while True:
+        ids = list(RevokedToken.objects.filter(expires_at__lte=now).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        deleted += RevokedToken.objects.filter(id__in=ids).delete()[0]
+    if deleted:
+        bump_revocation_version()
+    return deleted
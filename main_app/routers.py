@@ -0,0 +1,103 @@
+"""
+Read-replica routing
+
+When a `replica` database is configured (DB_REPLICA_* in settings), views
+that opt in with ReplicaReadMixin run their GET/HEAD handlers against it.
+Everything else, and every write, uses `default`.
+
+Replicas lag behind the primary, so reads stay on the primary when:
+- the request has already written (later reads in it see its own writes),
+- the client recently made a write of its own: ReplicaPinMiddleware pins it
+  to the primary for REPLICA_PIN_SECONDS via a cookie, or the
+  X-DB-Pinned-Until header for clients without cookies,
+- the model must never be stale (cache entries and versions, rate-limit
+  counters, revoked tokens, users and API tokens).
+"""
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+REPLICA_DB_ALIAS = 'replica'
+PIN_COOKIE = 'db_pinned_until'
+PIN_HEADER = 'X-DB-Pinned-Until'
+
+# Read on the primary even inside replica-enabled views
+PRIMARY_ONLY_MODELS = {
+    'django_cache.cacheentry',
+    'main_app.cacheversion',
+    'main_app.ratelimitcounter',
+    'main_app.revokedtoken',
+    'auth.user',
+    'authtoken.token',
+}
+
+_use_replica = ContextVar('use_replica', default=False)
+_pinned = ContextVar('db_pinned', default=False)
+_wrote = ContextVar('db_wrote', default=False)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+def read_database():
+    """The alias reads in the current context go to"""
+    if _use_replica.get() and not _pinned.get() and not _wrote.get():
+        return REPLICA_DB_ALIAS
+    return DEFAULT_DB_ALIAS
+
+
+def pin_expiry():
+    return time.time() + settings.REPLICA_PIN_SECONDS
+
+
+def parse_pin(value):
+    """Whether a cookie/header pin value is still in the future (capped to one pin period)"""
+    try:
+        until = float(value)
+    except (TypeError, ValueError):
+        return False
+    now = time.time()
+    # +1: pins are written rounded to the millisecond, possibly up
+    return now < until <= now + settings.REPLICA_PIN_SECONDS + 1
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # Not label_lower: the database cache's stand-in model only has app_label and model_name
+        if f'{model._meta.app_label}.{model._meta.model_name}' in PRIMARY_ONLY_MODELS:
+            return DEFAULT_DB_ALIAS
+        return read_database()
+
+    def db_for_write(self, model, **hints):
+        if _use_replica.get():
+            _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+
+class ReplicaReadMixin:
+    """
+    For APIViews: run GET/HEAD handlers against the replica. Authentication
+    and permission checks run first, on the primary. Querysets consumed after
+    the view returns (streaming responses) should be bound with
+    `.using(read_database())` inside the handler.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in ('GET', 'HEAD') and replica_configured():
+            self._replica_token = _use_replica.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            _use_replica.reset(token)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
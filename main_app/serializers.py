@@ -1,7 +1,12 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
-from .models import Folder, File, FileTag, FileVersion, FilePermission, FilePreview, WaitlistEntry, ContactSubmission, ContactUs, UserSecurityQuestions
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from .revocation import is_token_revoked, revoke_token
+from .models import Folder, File, FileTag, FileVersion, FilePermission, FolderPermission, FilePreview, WaitlistEntry, ContactSubmission, ContactUs, UserSecurityQuestions, MobileErrorReport, AdminLoginLog
 import re
 
 
@@ -72,16 +77,74 @@ class EmailPasswordResetConfirmSerializer(serializers.Serializer):
         return value
 
 
-class FileTagSerializer(serializers.ModelSerializer):
-    files_count = serializers.SerializerMethodField()
+class RevokingTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh that honours revocation: revoked refresh tokens are rejected, a
+    rotated refresh token is revoked (so it works exactly once) and tokens
+    issued before a password change stop refreshing.
+    
+    Replaces simplejwt's validate(), which calls the token_blacklist app's
+    outstand() when rotating and fails without that app installed.
+    """
     
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if is_token_revoked(refresh):
+            raise InvalidToken('Token has been revoked')
+        
+        user = User.objects.filter(**{jwt_settings.USER_ID_FIELD: refresh.get(jwt_settings.USER_ID_CLAIM)}).first()
+        if user is None or not jwt_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        token_version = refresh.get(jwt_settings.REVOKE_TOKEN_CLAIM)
+        if token_version is not None and token_version != get_md5_hash_password(user.password):
+            raise InvalidToken("The user's password has been changed")
+        
+        data = {'access': str(refresh.access_token)}
+        
+        if jwt_settings.ROTATE_REFRESH_TOKENS:
+            # Revoking first makes concurrent refreshes with the same token fail
+            if jwt_settings.BLACKLIST_AFTER_ROTATION and not revoke_token(refresh):
+                raise InvalidToken('Token has been revoked')
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        
+        return data
+
+
+class TokenRevokeSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
+
+
+class BulkPermissionSerializer(serializers.Serializer):
+    """Targets of a bulk grant / revoke: every user on every file and folder"""
+    max_grants = 100000
+    
+    user_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    file_ids = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    folder_ids = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    
+    def validate(self, data):
+        for field in ('user_ids', 'file_ids', 'folder_ids'):
+            data[field] = list(dict.fromkeys(data[field]))
+        if not data['file_ids'] and not data['folder_ids']:
+            raise serializers.ValidationError('At least one file or folder ID is required')
+        if len(data['user_ids']) * (len(data['file_ids']) + len(data['folder_ids'])) > self.max_grants:
+            raise serializers.ValidationError(f'At most {self.max_grants} grants can be changed per request')
+        return data
+
+
+class BulkPermissionGrantSerializer(BulkPermissionSerializer):
+    permission_type = serializers.ChoiceField(choices=FilePermission.PERMISSION_CHOICES, default='read')
+    expires_at = serializers.DateTimeField(required=False, allow_null=True, default=None)
+
+
+class FileTagSerializer(serializers.ModelSerializer):
     class Meta:
         model = FileTag
         fields = ['id', 'name', 'color', 'files_count', 'created_by', 'created_at']
-        read_only_fields = ['id', 'created_by', 'created_at']
-    
-    def get_files_count(self, obj):
-        return obj.files.count()
+        read_only_fields = ['id', 'files_count', 'created_by', 'created_at']
 
 
 class FileVersionSerializer(serializers.ModelSerializer):
@@ -97,11 +160,22 @@ class FileVersionSerializer(serializers.ModelSerializer):
 class FilePermissionSerializer(serializers.ModelSerializer):
     user_username = serializers.ReadOnlyField(source='user.username')
     granted_by_username = serializers.ReadOnlyField(source='granted_by.username')
-    is_expired = serializers.ReadOnlyField(source='is_expired')
+    is_expired = serializers.ReadOnlyField()
     
     class Meta:
         model = FilePermission
-        fields = ['id', 'file', 'user', 'user_username', 'permission_type', 'granted_by', 'granted_by_username', 'granted_at', 'expires_at', 'is_expired']
+        fields = ['id', 'file', 'user', 'user_username', 'permission_type', 'granted_by', 'granted_by_username', 'granted_at', 'expires_at', 'is_expired', 'is_active']
+        read_only_fields = ['id', 'granted_by', 'granted_at']
+
+
+class FolderPermissionSerializer(serializers.ModelSerializer):
+    user_username = serializers.ReadOnlyField(source='user.username')
+    granted_by_username = serializers.ReadOnlyField(source='granted_by.username')
+    is_expired = serializers.ReadOnlyField()
+    
+    class Meta:
+        model = FolderPermission
+        fields = ['id', 'folder', 'user', 'user_username', 'permission_type', 'granted_by', 'granted_by_username', 'granted_at', 'expires_at', 'is_expired', 'is_active']
         read_only_fields = ['id', 'granted_by', 'granted_at']
 
 
@@ -185,7 +259,7 @@ class FileSerializer(serializers.ModelSerializer):
 class WaitlistEntrySerializer(serializers.ModelSerializer):
     class Meta:
         model = WaitlistEntry
-        fields = ['id', 'entry_id', 'email', 'created_at']
+        fields = ['id', 'entry_id', 'email', 'campaign', 'created_at']
         read_only_fields = ['id', 'entry_id', 'created_at']
     
     def validate_email(self, value):
@@ -266,5 +340,13 @@ class ContactUsSerializer(serializers.ModelSerializer):
         return data
 
 
+class MobileErrorReportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MobileErrorReport
+        fields = ['id', 'group', 'received_at', 'device', 'browser', 'user_agent', 'ip', 'page_url', 'message', 'stack', 'details']
 
 
+class AdminLoginLogSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AdminLoginLog
+        fields = ['id', 'user', 'username', 'login_time', 'ip_address', 'user_agent', 'success', 'failure_reason']
@@ -0,0 +1,91 @@
+"""
+Tag counts and tag queries
+
+`FileTag.files_count` is denormalized so tag listings never COUNT per tag.
+It is recomputed from the File.tags through table for just the tags touched
+by an M2M change or a file deletion (deleting a file removes its through rows
+without sending m2m_changed).
+
+Tag queries support AND (`all`), OR (`any`) and NOT (`none`) combinations.
+AND is a single GROUP BY / HAVING COUNT subquery over the through table and
+OR / NOT are EXISTS subqueries, so no combination adds joins or needs distinct().
+"""
+from django.db.models import Count, Exists, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import File, FileTag
+
+
+FileTagThrough = File.tags.through
+
+
+def refresh_tag_counts(tag_ids):
+    """Recompute files_count for the given tags with one UPDATE"""
+    tag_ids = set(tag_ids)
+    if not tag_ids:
+        return
+    counts = (
+        FileTagThrough.objects.filter(filetag_id=OuterRef('pk'))
+        .values('filetag_id')
+        .annotate(total=Count('file_id'))
+        .values('total')
+    )
+    FileTag.objects.filter(pk__in=tag_ids).update(
+        files_count=Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+    )
+
+
+def tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """m2m_changed receiver for File.tags"""
+    if action == 'pre_clear' and not reverse:
+        # The cleared tag ids are gone after the clear, so remember them now
+        instance._cleared_tag_ids = list(instance.tags.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        refresh_tag_counts([instance.pk] if reverse else pk_set or [])
+    elif action == 'post_clear':
+        refresh_tag_counts([instance.pk] if reverse else getattr(instance, '_cleared_tag_ids', []))
+
+
+def file_pre_delete(sender, instance, **kwargs):
+    instance._deleted_tag_ids = list(instance.tags.values_list('pk', flat=True))
+
+
+def file_post_delete(sender, instance, **kwargs):
+    refresh_tag_counts(getattr(instance, '_deleted_tag_ids', []))
+
+
+def parse_tag_ids(values):
+    """Parse tag ids from repeated and/or comma-separated query params"""
+    tag_ids = set()
+    for value in values:
+        for part in str(value).split(','):
+            part = part.strip()
+            if part:
+                tag_ids.add(int(part))
+    return tag_ids
+
+
+def filter_by_tags(queryset, all_tags=(), any_tags=(), no_tags=()):
+    """
+    Filter a File queryset to files that have every tag in `all_tags`, at
+    least one tag in `any_tags` and none of the tags in `no_tags`.
+    """
+    all_tags = set(all_tags)
+    if all_tags:
+        matching = (
+            FileTagThrough.objects.filter(filetag_id__in=all_tags)
+            .values('file_id')
+            .annotate(matched=Count('filetag_id'))
+            .filter(matched=len(all_tags))
+            .values('file_id')
+        )
+        queryset = queryset.filter(pk__in=matching)
+    if any_tags:
+        queryset = queryset.filter(Exists(
+            FileTagThrough.objects.filter(file_id=OuterRef('pk'), filetag_id__in=set(any_tags))
+        ))
+    if no_tags:
+        queryset = queryset.filter(~Exists(
+            FileTagThrough.objects.filter(file_id=OuterRef('pk'), filetag_id__in=set(no_tags))
+        ))
+    return queryset
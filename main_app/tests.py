@@ -1,3 +1,1255 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib
+import importlib.util
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import AsyncClient, AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .access import AccessResolver
+from . import bruteforce
+from .backends import UsernameOrEmailBackend
+from .hashers import HashingPool, HashingPoolBusy, fail_fast_hashing
+from .audit import filter_login_logs, login_log_buffer, login_summary, record_admin_login
+from .authentication import HeaderSchemeAuthentication
+from .buffering import BatchBuffer
+from .cache import bump_version, get_cache, get_version
+from .compression import brotli, choose_encoding
+from .ingestion import dedup_key, ingest_emails
+from . import routers
+from .revocation import BloomFilter, is_token_revoked, revocation_list
+from .log import JsonFormatter, QueueingHandler, RequestIdFilter, get_request_id
+from .metrics import registry as metrics_registry
+from . import outbox
+from .mobile_errors import error_buffer, error_summary, fingerprint, parse_reports, report_limits, stack_signature
+from .middleware import CompressionMiddleware, PerformanceMiddleware, ReplicaPinMiddleware, RequestIdMiddleware
+from .renderers import FastJSONRenderer
+from .ratelimit import DatabaseBackend, MemoryBackend, get_client_ip, sliding_window, token_bucket
+from .models import (
+    AdminLoginLog, ContactUs, EmailOutbox, File, FilePermission, FileTag, Folder, FolderPermission, MobileErrorCount, MobileErrorGroup,
+    MobileErrorReport, PasswordResetCode, UserSecurityQuestions, WaitlistEntry,
+)
+from .tagging import filter_by_tags, parse_tag_ids
+from .useragents import classify_user_agent, get_client_info, prefix_matcher
+
+
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+def use_temporary_media(test):
+    """Point MEDIA_ROOT at a throwaway directory for the rest of the test"""
+    media_root = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, media_root)
+    media = override_settings(MEDIA_ROOT=media_root)
+    media.enable()
+    test.addCleanup(media.disable)
+
+
+class WaitlistIngestionTests(TestCase):
+    def test_normalizes_validates_and_deduplicates(self):
+        result = ingest_emails([' A@Example.com', 'a@example.com', 'bad', 'noemail@x.com', 'b@example.com'])
+        self.assertEqual(result['received'], 5)
+        self.assertEqual(result['inserted'], 2)
+        self.assertEqual(result['duplicates'], 1)
+        self.assertEqual(result['rejected'], 2)
+        self.assertEqual(sorted(WaitlistEntry.objects.values_list('email', flat=True)), ['a@example.com', 'b@example.com'])
+
+    def test_existing_entries_are_duplicates(self):
+        WaitlistEntry.objects.create(email='A@example.com', campaign='spring')
+        result = ingest_emails(['a@example.com', 'c@example.com'], chunk_size=1)
+        self.assertEqual((result['inserted'], result['duplicates']), (1, 1))
+
+    def test_per_campaign_allows_same_email_in_other_campaigns(self):
+        WaitlistEntry.objects.create(email='a@example.com', campaign='spring')
+        result = ingest_emails(['a@example.com'], campaign='fall', per_campaign=True)
+        self.assertEqual(result['inserted'], 1)
+        result = ingest_emails(['a@example.com'], campaign='fall', per_campaign=True)
+        self.assertEqual((result['inserted'], result['duplicates']), (0, 1))
+
+    def test_rows_imported_after_the_check_are_skipped(self):
+        # A concurrent import lands between the duplicate check and the INSERT
+        allocate = WaitlistEntry.allocate_entry_ids
+
+        def allocate_after_import(count):
+            if not WaitlistEntry.objects.exists():
+                WaitlistEntry.objects.create(entry_id=allocate(1)[0], email='race@example.com',
+                                             dedup_key=dedup_key('race@example.com', '', False))
+            return allocate(count)
+
+        with mock.patch.object(WaitlistEntry, 'allocate_entry_ids', side_effect=allocate_after_import):
+            result = ingest_emails(['race@example.com', 'other@example.com'])
+        self.assertEqual((result['inserted'], result['duplicates']), (1, 1))
+        self.assertEqual(WaitlistEntry.objects.filter(email__iexact='race@example.com').count(), 1)
+
+    def test_bulk_endpoint_is_admin_only(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('user'))
+        self.assertEqual(client.post('/waitlist/bulk/', {'emails': ['a@example.com']}, format='json').status_code, 403)
+        client.force_authenticate(User.objects.create_superuser('admin'))
+        response = client.post('/waitlist/bulk/', {'emails': 'a@example.com, b@example.com'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['inserted'], 2)
+
+    def test_signups_may_repeat_an_email(self):
+        ingest_emails(['dup@example.com'])
+        client = APIClient()
+        for email in ('dup@example.com', 'DUP@example.com'):
+            self.assertEqual(client.post('/waitlist/', {'email': email}, format='json').status_code, 201)
+        self.assertEqual(WaitlistEntry.objects.filter(email__iexact='dup@example.com').count(), 3)
+        self.assertEqual(WaitlistEntry.objects.filter(dedup_key__isnull=False).count(), 1)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin'))
+
+    def export(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_neutralizes_formulas(self):
+        ContactUs.objects.create(first_name='=HYPERLINK("http://evil")', last_name='-1+2', email='a@example.com', message='@SUM(A1)')
+        ContactUs.objects.create(first_name='Ann', last_name='Lee', email='b@example.com', message='\tcmd')
+        rows = list(csv.DictReader(io.StringIO(self.export('/contactus/export/csv/'))))
+        self.assertEqual(rows[0]['first_name'], '\'=HYPERLINK("http://evil")')
+        self.assertEqual(rows[0]['last_name'], "'-1+2")
+        self.assertEqual(rows[0]['message'], "'@SUM(A1)")
+        self.assertEqual(rows[1]['first_name'], 'Ann')
+        self.assertEqual(rows[1]['message'], "'\tcmd")
+
+    def test_ndjson_keeps_values(self):
+        WaitlistEntry.objects.create(email='a@example.com', campaign='=x')
+        rows = [json.loads(line) for line in self.export('/waitlist/export/ndjson/').splitlines()]
+        self.assertEqual(rows[0]['campaign'], '=x')
+
+    def test_date_range_and_errors(self):
+        WaitlistEntry.objects.create(email='a@example.com')
+        self.assertEqual(len(self.export('/waitlist/export/csv/?end=2000-01-01').splitlines()), 1)
+        self.assertEqual(len(self.export('/waitlist/export/csv/?start=2000-01-01').splitlines()), 2)
+        self.assertEqual(self.client.get('/waitlist/export/csv/?start=nope').status_code, 400)
+        self.assertEqual(self.client.get('/waitlist/export/xml/').status_code, 400)
+
+
+class AccessTests(TestCase):
+    def setUp(self):
+        use_temporary_media(self)
+        self.owner = User.objects.create_user('owner')
+        self.user = User.objects.create_user('user')
+        self.parent = Folder.objects.create(name='parent', created_by=self.owner)
+        self.child = Folder.objects.create(name='child', parent=self.parent, created_by=self.owner)
+        self.other = Folder.objects.create(name='other', created_by=self.owner)
+        self.nested = File.objects.create(name='nested.txt', file='uploads/a.txt', folder=self.child, uploaded_by=self.owner)
+        self.private = File.objects.create(name='private.txt', file='uploads/a.txt', folder=self.other, uploaded_by=self.owner)
+        self.public = File.objects.create(name='public.txt', file='uploads/a.txt', uploaded_by=self.owner, is_public=True)
+
+    def test_folder_grants_are_inherited(self):
+        FolderPermission.objects.create(folder=self.parent, user=self.user, permission_type='write', granted_by=self.owner)
+        resolver = AccessResolver(self.user)
+        self.assertTrue(resolver.has_file_access(self.nested, 'write'))
+        self.assertFalse(resolver.has_file_access(self.nested, 'admin'))
+        self.assertFalse(resolver.has_file_access(self.private))
+        self.assertTrue(resolver.has_file_access(self.public))
+        self.assertFalse(resolver.has_file_access(self.public, 'write'))
+
+    def test_expired_and_inactive_grants_are_ignored(self):
+        FilePermission.objects.create(file=self.private, user=self.user, granted_by=self.owner, expires_at=timezone.now() - timedelta(minutes=1))
+        FolderPermission.objects.create(folder=self.parent, user=self.user, granted_by=self.owner, is_active=False)
+        resolver = AccessResolver(self.user)
+        self.assertFalse(resolver.has_file_access(self.private))
+        self.assertFalse(resolver.has_file_access(self.nested))
+
+    def test_owner_has_admin(self):
+        self.assertTrue(AccessResolver(self.owner).has_file_access(self.private, 'admin'))
+
+    def test_grant_changes_invalidate_cached_levels(self):
+        self.assertFalse(AccessResolver(self.user).has_file_access(self.nested))
+        FolderPermission.objects.create(folder=self.parent, user=self.user, granted_by=self.owner)
+        self.assertTrue(AccessResolver(self.user).has_file_access(self.nested))
+
+    def test_resolves_a_batch_in_constant_queries(self):
+        FilePermission.objects.create(file=self.private, user=self.user, granted_by=self.owner)
+        resolver = AccessResolver(self.user)
+        resolver.folder_levels()
+        with self.assertNumQueries(1):
+            levels = resolver.resolve_files([self.nested, self.private, self.public])
+        self.assertEqual(levels, {self.nested.pk: 0, self.private.pk: 1, self.public.pk: 1})
+
+    def test_list_endpoints_filter_by_access(self):
+        FolderPermission.objects.create(folder=self.parent, user=self.user, granted_by=self.owner)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        files = client.get('/api/files/?page_size=100').json()
+        files = files['results'] if isinstance(files, dict) else files
+        self.assertEqual(sorted(f['name'] for f in files), ['nested.txt', 'public.txt'])
+        folders = client.get('/api/folders/').json()
+        folders = folders['results'] if isinstance(folders, dict) else folders
+        self.assertEqual(sorted(f['name'] for f in folders), ['child', 'parent'])
+        self.assertEqual(client.get(f'/api/folders/{self.other.pk}/').status_code, 404)
+        self.assertEqual(client.get(f'/api/files/{self.private.pk}/').status_code, 404)
+
+
+class BulkPermissionTests(TestCase):
+    def setUp(self):
+        use_temporary_media(self)
+        self.owner = User.objects.create_user('owner')
+        self.team = [User.objects.create_user(f'member{i}') for i in range(3)]
+        self.folder = Folder.objects.create(name='shared', created_by=self.owner)
+        self.file = File.objects.create(name='a.txt', file='uploads/a.txt', uploaded_by=self.owner)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def grant(self, **data):
+        return self.client.post('/api/permissions/bulk-grant/', data, format='json')
+
+    def test_grants_every_user_on_every_target_idempotently(self):
+        user_ids = [user.pk for user in self.team]
+        response = self.grant(user_ids=user_ids, file_ids=[self.file.pk], folder_ids=[self.folder.pk], permission_type='write')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'file_grants': 3, 'folder_grants': 3})
+        self.grant(user_ids=user_ids, folder_ids=[self.folder.pk], permission_type='read')
+        self.assertEqual(FolderPermission.objects.count(), 3)
+        self.assertEqual(set(FolderPermission.objects.values_list('permission_type', flat=True)), {'read'})
+
+        response = self.client.post('/api/permissions/bulk-revoke/', {'user_ids': user_ids, 'folder_ids': [self.folder.pk]}, format='json')
+        self.assertEqual(response.data, {'file_grants': 0, 'folder_grants': 3})
+
+    def test_invalid_input_is_a_400(self):
+        target = {'file_ids': [self.file.pk]}
+        for data in (
+            {'user_ids': [[1], {'a': 1}], **target},
+            {'user_ids': 'abc', **target},
+            {'user_ids': [], **target},
+            {'user_ids': [self.team[0].pk]},
+            {'user_ids': [self.team[0].pk], 'expires_at': 5, **target},
+            {'user_ids': [self.team[0].pk], 'expires_at': 'tomorrow', **target},
+            {'user_ids': [self.team[0].pk], 'permission_type': 'owner', **target},
+        ):
+            self.assertEqual(self.grant(**data).status_code, 400, data)
+
+    def test_requires_admin_access_to_targets(self):
+        other = User.objects.create_user('other')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.grant(user_ids=[other.pk], file_ids=[self.file.pk]).status_code, 404)
+        self.assertEqual(self.grant(user_ids=[other.pk], folder_ids=[self.folder.pk]).status_code, 403)
+
+    def test_sweeper_deactivates_expired_grants(self):
+        past = timezone.now() - timedelta(minutes=1)
+        FolderPermission.objects.create(folder=self.folder, user=self.team[0], granted_by=self.owner, expires_at=past)
+        FolderPermission.objects.create(folder=self.folder, user=self.team[1], granted_by=self.owner)
+        call_command('sweep_expired_permissions', stdout=io.StringIO())
+        self.assertEqual(list(FolderPermission.objects.filter(is_active=True).values_list('user', flat=True)), [self.team[1].pk])
+        call_command('sweep_expired_permissions', mode='delete', stdout=io.StringIO())
+        self.assertEqual(FolderPermission.objects.count(), 1)
+
+
+class TaggingTests(TestCase):
+    def setUp(self):
+        use_temporary_media(self)
+        self.user = User.objects.create_user('owner')
+        self.red, self.blue, self.green = (
+            FileTag.objects.create(name=name, created_by=self.user) for name in ('red', 'blue', 'green')
+        )
+        self.files = {
+            name: File.objects.create(name=name, file='uploads/a.txt', uploaded_by=self.user)
+            for name in ('rb', 'r', 'bg', 'none')
+        }
+        self.files['rb'].tags.add(self.red, self.blue)
+        self.files['r'].tags.add(self.red)
+        self.files['bg'].tags.add(self.blue, self.green)
+
+    def counts(self):
+        return dict(FileTag.objects.values_list('name', 'files_count'))
+
+    def names(self, **tags):
+        return sorted(filter_by_tags(File.objects.all(), **tags).values_list('name', flat=True))
+
+    def test_counts_follow_m2m_changes_and_deletes(self):
+        self.assertEqual(self.counts(), {'red': 2, 'blue': 2, 'green': 1})
+        self.files['rb'].tags.remove(self.blue)
+        self.red.files.clear()
+        self.assertEqual(self.counts(), {'red': 0, 'blue': 1, 'green': 1})
+        self.files['bg'].delete()
+        self.assertEqual(self.counts(), {'red': 0, 'blue': 0, 'green': 0})
+
+    def test_and_or_not(self):
+        self.assertEqual(self.names(all_tags=[self.red.pk, self.blue.pk]), ['rb'])
+        self.assertEqual(self.names(any_tags=[self.red.pk, self.green.pk]), ['bg', 'r', 'rb'])
+        self.assertEqual(self.names(any_tags=[self.blue.pk], no_tags=[self.red.pk]), ['bg'])
+        self.assertEqual(self.names(no_tags=[self.red.pk, self.blue.pk]), ['none'])
+        self.assertEqual(parse_tag_ids(['1,2', '3', ' ']), {1, 2, 3})
+
+    def test_by_tags_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(f'/api/files/by-tags/?all={self.red.pk},{self.blue.pk}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([f['name'] for f in response.data['results']], ['rb'])
+        self.assertEqual(client.get('/api/files/by-tags/?any=x').status_code, 400)
+
+
+class RateLimitTests(TestCase):
+    def exhaust(self, limiter, backend, limit=3):
+        results = [limiter(backend, 'test', limit, 60) for _ in range(limit + 1)]
+        self.assertTrue(all(result.allowed for result in results[:limit]))
+        self.assertEqual([result.remaining for result in results[:limit]], list(range(limit - 1, -1, -1)))
+        self.assertFalse(results[-1].allowed)
+        self.assertGreaterEqual(results[-1].retry_after, 1)
+
+    def test_algorithms_on_each_backend(self):
+        for backend in (MemoryBackend(), DatabaseBackend()):
+            for limiter in (sliding_window, token_bucket):
+                with self.subTest(backend=type(backend).__name__, limiter=limiter.__name__):
+                    backend.clear()
+                    self.exhaust(limiter, backend)
+
+    def test_backend_counters(self):
+        for backend in (MemoryBackend(), DatabaseBackend()):
+            self.assertEqual([backend.incr('k', 60) for _ in range(3)], [1, 2, 3])
+            self.assertEqual(backend.get('k'), 3)
+            self.assertEqual(backend.update('s', lambda state: ((state or 0) + 5, 'ok'), 60), 'ok')
+            self.assertEqual(backend.get_state('s'), 5)
+            backend.delete('k', 's')
+            self.assertEqual((backend.get('k'), backend.get_state('s')), (0, None))
+
+    def test_client_ip_behind_the_default_proxy(self):
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='6.6.6.6, 203.0.113.7')
+        self.assertEqual(get_client_ip(request), '203.0.113.7')
+        self.assertEqual(get_client_ip(RequestFactory().get('/', REMOTE_ADDR='10.0.0.1')), '10.0.0.1')
+        with override_settings(RATELIMIT_PROXY_COUNT=0):
+            self.assertEqual(get_client_ip(request), '10.0.0.1')
+        with override_settings(RATELIMIT_PROXY_COUNT=2):
+            self.assertEqual(get_client_ip(request), '6.6.6.6')
+
+    def test_endpoint_limits_per_client_with_headers(self):
+        client = APIClient()
+        for i in range(10):
+            response = client.post('/waitlist/', {'email': f'user{i}@example.com'}, format='json', HTTP_X_FORWARDED_FOR='198.51.100.1')
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(response['X-RateLimit-Limit'], '10')
+        self.assertEqual(response['X-RateLimit-Remaining'], '0')
+        response = client.post('/waitlist/', {'email': 'late@example.com'}, format='json', HTTP_X_FORWARDED_FOR='198.51.100.1')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        # Another client behind the same proxy has its own limit
+        response = client.post('/waitlist/', {'email': 'late@example.com'}, format='json', HTTP_X_FORWARDED_FOR='198.51.100.2')
+        self.assertEqual(response.status_code, 201)
+
+
+class CacheTests(TestCase):
+    def test_namespaced_cache_counts_hits_and_misses(self):
+        cache = get_cache('listings')
+        before = dict(cache.stats.local)
+        cache.get('missing')
+        cache.set('present', 1)
+        self.assertEqual(cache.get('present'), 1)
+        self.assertEqual(cache.get_or_set('computed', lambda: 2), 2)
+        self.assertEqual(cache.stats.local['hits'] - before['hits'], 1)
+        self.assertEqual(cache.stats.local['misses'] - before['misses'], 2)
+        self.assertIs(get_cache('no-such-namespace'), get_cache('default'))
+
+    def test_version_counter(self):
+        first = get_version('test')
+        self.assertEqual(get_version('test'), first)
+        bump_version('test')
+        bump_version('test')
+        self.assertEqual(get_version('test'), first + 2)
+        bump_version('fresh')
+        self.assertIsNotNone(get_version('fresh'))
+
+
+class ConcurrentVersionBumpTests(TransactionTestCase):
+    def test_concurrent_bumps_are_not_lost(self):
+        start = get_version('concurrent')
+
+        def bump():
+            try:
+                for _ in range(20):
+                    bump_version('concurrent')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=bump) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(get_version('concurrent'), start + 160)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class AuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('driver')
+        self.user.set_password('old-password')
+        self.user.save()
+
+    def authenticate(self, header):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=header)
+        return HeaderSchemeAuthentication().authenticate(request)
+
+    def test_dispatches_on_header_scheme(self):
+        user, _ = self.authenticate(f'Bearer {AccessToken.for_user(self.user)}')
+        self.assertEqual(user, self.user)
+        user, _ = self.authenticate(f'Token {Token.objects.get(user=self.user).key}')
+        self.assertEqual(user, self.user)
+        self.assertIsNone(self.authenticate('Basic abc'))
+        self.assertIsNone(self.authenticate(''))
+
+    def test_cached_user_needs_no_user_query(self):
+        header = f'Bearer {AccessToken.for_user(self.user)}'
+        self.authenticate(header)
+        with mock.patch.object(User.objects, 'get', side_effect=AssertionError('queried')):
+            user, _ = self.authenticate(header)
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_requests_get_their_own_user_instance(self):
+        header = f'Bearer {AccessToken.for_user(self.user)}'
+        first, _ = self.authenticate(header)
+        first.first_name = 'changed'
+        second, _ = self.authenticate(header)
+        self.assertIsNot(first, second)
+        self.assertEqual(second.first_name, '')
+
+    def test_password_change_and_deactivation_invalidate(self):
+        header = f'Bearer {AccessToken.for_user(self.user)}'
+        self.authenticate(header)
+        self.user.set_password('new-password')
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(header)
+
+        header = f'Bearer {AccessToken.for_user(self.user)}'
+        self.authenticate(header)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(header)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class UsernameOrEmailLoginTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('driver', email='Driver@Example.com', password='secret')
+        self.backend = UsernameOrEmailBackend()
+
+    def test_username_or_case_insensitive_email(self):
+        self.assertEqual(self.backend.authenticate(None, username='driver', password='secret'), self.user)
+        self.assertEqual(self.backend.authenticate(None, username=' driver@example.COM ', password='secret'), self.user)
+        self.assertIsNone(self.backend.authenticate(None, username='driver', password='wrong'))
+        self.assertIsNone(self.backend.authenticate(None, username='nobody', password='secret'))
+
+    def test_username_match_wins_over_email(self):
+        other = User.objects.create_user('driver@example.com', password='other')
+        self.assertEqual(self.backend.authenticate(None, username='driver@example.com', password='other'), other)
+
+    def test_one_query_per_attempt(self):
+        with self.assertNumQueries(1):
+            self.backend.authenticate(None, username='DRIVER@example.com', password='secret')
+
+    def test_inactive_users_cannot_log_in(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(self.backend.authenticate(None, username='driver', password='secret'))
+
+
+class HashingPoolTests(TestCase):
+    def occupy(self, pool):
+        """Fill the pool's only slot until the returned event is set"""
+        started, release = threading.Event(), threading.Event()
+
+        def hold():
+            started.set()
+            release.wait(5)
+
+        thread = threading.Thread(target=pool.run, args=(hold,))
+        thread.start()
+        started.wait(5)
+        return release, thread
+
+    def test_fails_fast_only_when_asked(self):
+        pool = HashingPool(max_workers=1, max_queue=0, timeout=5)
+        release, thread = self.occupy(pool)
+        with fail_fast_hashing():
+            with self.assertRaises(HashingPoolBusy):
+                pool.run(lambda: 'hashed')
+        # Outside fail_fast_hashing() callers wait for a slot instead of failing
+        threading.Timer(0.1, release.set).start()
+        self.assertEqual(pool.run(lambda: 'hashed'), 'hashed')
+        thread.join()
+
+    def test_nested_calls_run_inline(self):
+        pool = HashingPool(max_workers=1, max_queue=0, timeout=5)
+        self.assertEqual(pool.run(lambda: pool.run(lambda: 'inner')), 'inner')
+
+    def test_login_views_answer_503(self):
+        client = APIClient()
+        with mock.patch('main_app.views.authenticate', side_effect=HashingPoolBusy):
+            for url in ('/api/token/', '/api/admin/login/'):
+                response = client.post(url, {'username': 'driver', 'password': 'x'}, format='json')
+                self.assertEqual(response.status_code, 503, url)
+                self.assertEqual(response['Retry-After'], '1')
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('driver')
+        self.client = APIClient()
+        revocation_list.refresh(force=True)
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(capacity=1000)
+        for i in range(1000):
+            bloom.add(f'jti-{i}')
+        self.assertTrue(all(f'jti-{i}' in bloom for i in range(1000)))
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 100)
+
+    def test_logout_with_an_expired_access_token_still_revokes_the_refresh_token(self):
+        refresh = RefreshToken.for_user(self.user)
+        access = refresh.access_token
+        access.set_exp(lifetime=-timedelta(minutes=1))
+        response = self.client.post('/api/token/revoke/', {'refresh': str(refresh), 'access': str(access)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(is_token_revoked(refresh))
+        response = self.client.post('/api/token/refresh/', {'refresh': str(refresh)}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_logout_revokes_a_valid_access_token(self):
+        refresh = RefreshToken.for_user(self.user)
+        access = refresh.access_token
+        self.assertEqual(self.client.get('/api/files/', HTTP_AUTHORIZATION=f'Bearer {access}').status_code, 200)
+        self.client.post('/api/token/revoke/', {'refresh': str(refresh), 'access': str(access)}, format='json')
+        self.assertEqual(self.client.get('/api/files/', HTTP_AUTHORIZATION=f'Bearer {access}').status_code, 401)
+
+    def test_invalid_refresh_token_is_a_400(self):
+        response = self.client.post('/api/token/revoke/', {'refresh': 'garbage'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_rotated_refresh_tokens_work_once(self):
+        refresh = str(RefreshToken.for_user(self.user))
+        first = self.client.post('/api/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': refresh}, format='json').status_code, 401)
+
+
+class AsyncDownloadTests(TestCase):
+    def setUp(self):
+        use_temporary_media(self)
+
+        self.user = User.objects.create_user('driver')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.folder = Folder.objects.create(name='docs', created_by=self.user)
+        sub = Folder.objects.create(name='sub', parent=self.folder, created_by=self.user)
+        self.content = b'0123456789' * 20000
+        stored = default_storage.save('uploads/big.bin', ContentFile(self.content))
+        self.file = File.objects.create(name='big.bin', file=stored, folder=self.folder, uploaded_by=self.user)
+        File.objects.create(name='small.txt', file=default_storage.save('uploads/small.txt', ContentFile(b'hi')),
+                            folder=sub, uploaded_by=self.user)
+
+    def assert_archive(self, body):
+        with zipfile.ZipFile(io.BytesIO(body)) as archive:
+            self.assertEqual(sorted(archive.namelist()), ['big.bin', 'docs/sub/small.txt'])
+            self.assertEqual(archive.read('big.bin'), self.content)
+
+    def test_wsgi_streams_from_sync_iterators(self):
+        response = self.client.get(f'/api/async/files/{self.file.id}/download/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.is_async)
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(b''.join(chunks), self.content)
+
+        response = self.client.get(f'/api/async/folders/{self.folder.id}/download/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.is_async)
+        self.assert_archive(b''.join(response.streaming_content))
+
+    async def test_asgi_streams_from_async_iterators(self):
+        response = await AsyncClient().get(
+            f'/api/async/folders/{self.folder.id}/download/',
+            headers={'Authorization': self.auth['HTTP_AUTHORIZATION']},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        self.assert_archive(b''.join([chunk async for chunk in response.streaming_content]))
+
+    def test_folder_downloads_are_rate_limited(self):
+        response = self.client.get(f'/api/async/folders/{self.folder.id}/download/', **self.auth)
+        self.assertEqual(response['X-RateLimit-Limit'], '50')
+        response = self.client.get(f'/api/folders/{self.folder.id}/download/', **self.auth)
+        self.assertEqual(response['X-RateLimit-Limit'], '50')
+
+    def test_requires_authentication(self):
+        self.assertEqual(self.client.get(f'/api/async/folders/{self.folder.id}/download/').status_code, 401)
+
+    def test_folders_without_access_are_not_found(self):
+        # A public file doesn't make its folder downloadable
+        self.file.is_public = True
+        self.file.save()
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(User.objects.create_user("stranger"))}'}
+        for url in (f'/api/async/folders/{self.folder.id}/download/', f'/api/folders/{self.folder.id}/download/'):
+            self.assertEqual(self.client.get(url, **auth).status_code, 404)
+
+
+class ConnectionSettingsTests(TestCase):
+    def load_settings(self, **environ):
+        from marcdwebpage import settings as settings_module
+        with mock.patch.dict(os.environ):
+            for name in ('DB_CONN_MAX_AGE', 'DB_POOL'):
+                os.environ.pop(name, None)
+            os.environ.update(environ)
+            # a copy, so reloading doesn't touch the settings Django runs with
+            spec = importlib.util.find_spec(settings_module.__name__)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        return module
+
+    def test_persistent_connections_only_by_default_under_wsgi(self):
+        self.assertEqual(self.load_settings(SERVER_MODE='wsgi').DATABASES['default']['CONN_MAX_AGE'], 60)
+        self.assertEqual(self.load_settings(SERVER_MODE='asgi').DATABASES['default']['CONN_MAX_AGE'], 0)
+        asgi = self.load_settings(SERVER_MODE='ASGI', DB_CONN_MAX_AGE='30')
+        self.assertEqual(asgi.SERVER_MODE, 'asgi')
+        self.assertEqual(asgi.DATABASES['default']['CONN_MAX_AGE'], 30)
+
+
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        patcher = mock.patch.object(routers, 'replica_configured', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def in_replica_view(self, func, pinned=False):
+        tokens = [(var, var.set(value)) for var, value in (
+            (routers._use_replica, True), (routers._pinned, pinned), (routers._wrote, False),
+        )]
+        try:
+            return func()
+        finally:
+            for var, token in reversed(tokens):
+                var.reset(token)
+
+    def test_reads_go_to_the_replica_only_inside_replica_views(self):
+        self.assertEqual(self.router.db_for_read(File), 'default')
+        self.assertEqual(self.in_replica_view(lambda: self.router.db_for_read(File)), 'replica')
+        self.assertEqual(self.in_replica_view(lambda: self.router.db_for_read(User)), 'default')
+        self.assertEqual(self.in_replica_view(lambda: self.router.db_for_read(File), pinned=True), 'default')
+
+    def test_reads_after_a_write_stay_on_the_primary(self):
+        def write_then_read():
+            self.assertEqual(self.router.db_for_write(File), 'default')
+            return self.router.db_for_read(File)
+        self.assertEqual(self.in_replica_view(write_then_read), 'default')
+
+    def test_pins_expire_and_are_capped(self):
+        now = timezone.now().timestamp()
+        self.assertTrue(routers.parse_pin(str(now + 5)))
+        self.assertFalse(routers.parse_pin(str(now - 1)))
+        self.assertFalse(routers.parse_pin(str(now + 3600)))
+        self.assertFalse(routers.parse_pin('soon'))
+
+    def test_mixin_routes_get_handlers_only(self):
+        class View(routers.ReplicaReadMixin, APIView):
+            permission_classes = []
+
+            def get(self, request):
+                return Response({'db': routers.read_database()})
+
+            def post(self, request):
+                return Response({'db': routers.read_database()})
+
+        factory = RequestFactory()
+        self.assertEqual(View.as_view()(factory.get('/')).data, {'db': 'replica'})
+        self.assertEqual(View.as_view()(factory.post('/')).data, {'db': 'default'})
+        self.assertEqual(routers.read_database(), 'default')
+
+    def test_middleware_pins_clients_after_writes(self):
+        seen = []
+
+        def view(request):
+            seen.append(routers._pinned.get())
+            return HttpResponse(status=201 if request.method == 'POST' else 200)
+
+        middleware = ReplicaPinMiddleware(view)
+        factory = RequestFactory()
+        self.assertNotIn(routers.PIN_HEADER, middleware(factory.get('/')))
+        response = middleware(factory.post('/'))
+        until = response[routers.PIN_HEADER]
+        self.assertEqual(response.cookies[routers.PIN_COOKIE].value, until)
+
+        request = factory.get('/')
+        request.COOKIES[routers.PIN_COOKIE] = until
+        middleware(request)
+        middleware(factory.get('/', HTTP_X_DB_PINNED_UNTIL=until))
+        self.assertEqual(seen, [False, False, True, True])
+
+
+@override_settings(SERVER_TIMING_ENABLED=True, METRICS_TOKEN='scrape')
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics_registry.reset()
+        self.addCleanup(metrics_registry.reset)
+
+    def test_records_routes_queries_and_sizes(self):
+        user = User.objects.create_user('driver')
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get('/api/files/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+        body = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape').content.decode()
+        self.assertIn('http_requests_total{route="/api/files/",method="GET",status="200"} 1', body)
+        self.assertIn(f'http_response_bytes_total{{route="/api/files/",method="GET"}} {len(response.content)}', body)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+    async def test_async_stack(self):
+        async def view(request):
+            async def chunks():
+                yield b'abc'
+                yield b'de'
+            return StreamingHttpResponse(chunks())
+
+        middleware = PerformanceMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(AsyncRequestFactory().get('/'))
+        self.assertIn('app;dur=', response['Server-Timing'])
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), b'abcde')
+
+        body = metrics_registry.render()
+        self.assertIn('http_requests_total{route="unmatched",method="GET",status="200"} 1', body)
+        self.assertIn('http_response_bytes_total{route="unmatched",method="GET"} 5', body)
+
+
+class LoggingTests(TestCase):
+    def record(self, msg='hello', **extra):
+        record = logging.LogRecord('main_app.test', logging.INFO, __file__, 1, msg, (), None)
+        record.__dict__.update(extra)
+        return record
+
+    def test_request_ids_are_echoed_or_generated(self):
+        self.assertEqual(self.client.get('/api/async/contact/', HTTP_X_REQUEST_ID='abc-123')['X-Request-ID'], 'abc-123')
+        generated = self.client.get('/api/async/contact/', HTTP_X_REQUEST_ID='not an id!')['X-Request-ID']
+        self.assertRegex(generated, r'^[0-9a-f]{32}$')
+
+    def test_records_carry_the_request_id(self):
+        seen = []
+
+        def view(request):
+            record = self.record()
+            RequestIdFilter().filter(record)
+            seen.append(record.request_id)
+            return HttpResponse()
+
+        RequestIdMiddleware(view)(RequestFactory().get('/', HTTP_X_REQUEST_ID='req-1'))
+        self.assertEqual(seen, ['req-1'])
+        self.assertIsNone(get_request_id())
+
+    async def test_async_stack(self):
+        async def view(request):
+            return HttpResponse(get_request_id())
+
+        middleware = RequestIdMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(AsyncRequestFactory().get('/', headers={'X-Request-ID': 'req-2'}))
+        self.assertEqual((response.content, response['X-Request-ID']), (b'req-2', 'req-2'))
+
+    def test_json_lines_include_extra_fields(self):
+        entry = json.loads(JsonFormatter().format(self.record('saved %s', request_id='req-3', file_id=7)))
+        self.assertEqual(entry['request_id'], 'req-3')
+        self.assertEqual(entry['file_id'], 7)
+        self.assertEqual(entry['level'], 'INFO')
+
+    def test_full_queue_drops_records(self):
+        handler = QueueingHandler(queue_size=1, stream=io.StringIO())
+        with mock.patch.object(handler, '_ensure_listener'):
+            handler.handle(self.record())
+            handler.handle(self.record())
+        self.assertEqual(handler.dropped, 1)
+
+    def test_failed_folder_deletes_are_logged_as_warnings(self):
+        # The stored file is deleted before the row is; keep the repo's media out of it
+        use_temporary_media(self)
+        user = User.objects.create_user('driver')
+        folder = Folder.objects.create(name='docs', created_by=user)
+        File.objects.create(name='a.txt', file='uploads/a.txt', folder=folder, uploaded_by=user)
+        client = APIClient()
+        client.force_authenticate(user)
+        with mock.patch.object(File, 'delete', side_effect=RuntimeError('disk on fire')), \
+                self.assertLogs('main_app.views', 'WARNING') as logs:
+            response = client.delete(f'/api/folders/{folder.id}/')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(any(line.startswith('WARNING:main_app.views:Error deleting file') for line in logs.output))
+        self.assertTrue(Folder.objects.filter(id=folder.id).exists())
+
+
+class MobileErrorTests(TestCase):
+    IPHONE = 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Version/17.0 Mobile/15E148 Safari/604.1'
+
+    def setUp(self):
+        # Flushed explicitly, in the test's transaction
+        patcher = mock.patch.object(error_buffer, '_ensure_thread')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(error_buffer.flush)
+        report_limits.clear()
+
+    def report(self, user_id=1, line=10):
+        return {
+            'error_type': 'TypeError',
+            'error_message': f'Cannot read properties of undefined (reading "name") for user {user_id}',
+            'error_stack': f'at render (https://cdn.example.com/static/main.3f9a8c2b.js:{line}:7)\nat commit (react.js:1:2)',
+        }
+
+    def test_fingerprint_ignores_variable_parts(self):
+        first, second = self.report(user_id=1, line=10), self.report(user_id=2, line=99)
+        keys = {
+            fingerprint(r['error_type'], r['error_message'], stack_signature(r['error_stack'])) for r in (first, second)
+        }
+        self.assertEqual(len(keys), 1)
+        self.assertEqual(stack_signature(first['error_stack']), 'at render (main.js)\nat commit (react.js)')
+
+    def test_payload_validation(self):
+        self.assertEqual(len(parse_reports({'reports': [{}, {}]})), 2)
+        self.assertEqual(len(parse_reports({'error_type': 'x'})), 1)
+        for payload in ([], [{}] * 51, ['nope']):
+            with self.assertRaises(ValueError):
+                parse_reports(payload)
+
+    @override_settings(MOBILE_ERROR_SAMPLES_PER_FLUSH=2)
+    def test_reports_are_counted_exactly_and_sampled(self):
+        response = self.client.post(
+            '/api/mobile/error-reports/', {'reports': [self.report(user_id=i) for i in range(5)]},
+            content_type='application/json', HTTP_USER_AGENT=self.IPHONE,
+        )
+        self.assertEqual(response.json()['accepted'], 5)
+        self.assertEqual(MobileErrorGroup.objects.count(), 0)
+        error_buffer.flush()
+        self.client.post('/api/mobile/error-report/', self.report(), content_type='application/json', HTTP_USER_AGENT=self.IPHONE)
+        error_buffer.flush()
+
+        group = MobileErrorGroup.objects.get()
+        self.assertEqual(group.occurrences, 6)
+        self.assertEqual(MobileErrorReport.objects.count(), 3)
+        count = MobileErrorCount.objects.get()
+        self.assertEqual((count.device, count.browser, count.count), ('mobile', 'safari', 6))
+        summary = error_summary(timezone.now() - timedelta(hours=1))
+        self.assertEqual(summary['total'], 6)
+        self.assertEqual(summary['top_errors'][0]['fingerprint'], group.fingerprint)
+
+    def test_reports_are_rate_limited_without_queries(self):
+        with mock.patch('main_app.views.record_reports', return_value=([], 0)), self.assertNumQueries(0):
+            response = self.client.post('/api/mobile/error-report/', self.report(), content_type='application/json')
+        self.assertEqual(response['X-RateLimit-Remaining'], '59')
+
+    def test_summary_rejects_out_of_range_hours(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser('admin'))
+        self.assertEqual(client.get('/api/admin/mobile-errors/?hours=24').status_code, 200)
+        for hours in ('0', '-5', '9999999999999', 'x'):
+            self.assertEqual(client.get(f'/api/admin/mobile-errors/?hours={hours}').status_code, 400)
+
+    def test_buffer_drops_beyond_its_limit_and_survives_failed_flushes(self):
+        batches = []
+        buffer = BatchBuffer('test', batches.append, flush_size=2, max_pending=3)
+        with mock.patch.object(buffer, '_ensure_thread'):
+            self.assertEqual(buffer.extend([1, 2]), 2)
+            self.assertTrue(buffer.add(3))
+            self.assertFalse(buffer.add(4))
+        self.assertEqual(buffer.dropped, 1)
+        buffer.flush()
+        self.assertEqual(batches, [[1, 2], [3]])
+
+        failing = BatchBuffer('test', mock.Mock(side_effect=RuntimeError))
+        with mock.patch.object(failing, '_ensure_thread'):
+            failing.add(1)
+        with self.assertLogs('main_app.buffering', 'ERROR'):
+            failing.flush()
+        self.assertEqual(failing.pending(), 0)
+
+
+class ClientClassificationTests(TestCase):
+    def test_devices_and_browsers(self):
+        cases = {
+            'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) Version/17.0 Mobile/15E148 Safari/604.1': ('mobile', 'safari'),
+            'Mozilla/5.0 (iPad; CPU OS 17_0 like Mac OS X) CriOS/120.0 Mobile/15E148 Safari/604.1': ('tablet', 'chrome'),
+            'Mozilla/5.0 (Linux; Android 14; SM-X700) AppleWebKit/537.36 Chrome/120.0 Safari/537.36': ('tablet', 'chrome'),
+            'Mozilla/5.0 (Linux; Android 14) AppleWebKit/537.36 SamsungBrowser/23.0 Chrome/115.0 Mobile Safari/537.36': ('mobile', 'samsung'),
+            'Mozilla/5.0 (Windows NT 10.0) AppleWebKit/537.36 Chrome/120.0 Safari/537.36 Edg/120.0': ('desktop', 'edge'),
+            'Mozilla/5.0 (Windows NT 10.0; rv:121.0) Gecko/20100101 Firefox/121.0': ('desktop', 'firefox'),
+            'curl/8.4.0': ('desktop', 'other'),
+            '': ('unknown', 'unknown'),
+        }
+        for user_agent, expected in cases.items():
+            info = classify_user_agent(user_agent)
+            self.assertEqual((info.device, info.browser), expected, user_agent)
+            self.assertEqual(info.is_mobile, expected[0] in ('mobile', 'tablet'), user_agent)
+
+    def test_classified_once_per_request(self):
+        request = RequestFactory().get('/', HTTP_USER_AGENT='Mozilla/5.0 (iPhone) Mobile Safari/604.1')
+        with mock.patch('main_app.useragents.classify_user_agent', wraps=classify_user_agent) as classify:
+            self.assertTrue(get_client_info(request).is_mobile)
+            self.assertTrue(get_client_info(request).is_mobile)
+        classify.assert_called_once()
+
+    def test_prefix_matcher(self):
+        matches = prefix_matcher(['/api/', '/login/'])
+        self.assertTrue(matches('/api/files/'))
+        self.assertTrue(matches('/login/'))
+        self.assertFalse(matches('/admin/api/'))
+        self.assertFalse(matches('/apiary/'))
+
+    def test_mobile_headers_and_csrf_exemption(self):
+        response = self.client.post(
+            '/api/async/contact/', {'name': 'A', 'email': 'a@example.com', 'subject': 'Hi', 'message': 'Hello'},
+            HTTP_USER_AGENT='Mozilla/5.0 (iPhone) Mobile Safari/604.1',
+        )
+        self.assertNotEqual(response.status_code, 403)
+        self.assertEqual(response['Cache-Control'], 'no-cache, no-store, must-revalidate')
+        self.assertNotIn('Pragma', self.client.get('/api/async/contact/', HTTP_USER_AGENT='curl/8.4.0'))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class AdminLoginAuditTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(login_log_buffer, '_ensure_thread')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(login_log_buffer.flush)
+
+    def test_attempts_are_buffered_and_written_in_batches(self):
+        boss = User.objects.create_user('boss', password='right', is_staff=True)
+        for password in ('wrong', 'right'):
+            self.client.post('/api/admin/login/', {'username': 'boss', 'password': password},
+                             content_type='application/json', HTTP_X_FORWARDED_FOR='203.0.113.9')
+        self.client.post('/api/admin/login/', {'username': 'nobody', 'password': 'x'}, content_type='application/json')
+        self.assertFalse(AdminLoginLog.objects.exists())
+
+        with self.assertNumQueries(2):  # the username lookup and one INSERT
+            login_log_buffer.flush()
+        logs = list(AdminLoginLog.objects.order_by('id').values_list('username', 'user_id', 'success', 'failure_reason'))
+        self.assertEqual(logs, [
+            ('boss', boss.id, False, 'Invalid credentials'),
+            ('boss', boss.id, True, ''),
+            ('nobody', None, False, 'Invalid credentials'),
+        ])
+
+    def test_invalid_ips_and_overflow(self):
+        request = RequestFactory().post('/', REMOTE_ADDR='not-an-ip')
+        with mock.patch.object(login_log_buffer, 'max_pending', 1):
+            self.assertTrue(record_admin_login('a', request, success=False))
+            self.assertFalse(record_admin_login('b', request, success=False))
+        login_log_buffer.flush()
+        self.assertIsNone(AdminLoginLog.objects.get().ip_address)
+
+    def test_username_backfill_uses_the_migrating_database(self):
+        # 0027 runs on whichever alias is being migrated (e.g. --database replica)
+        migration = importlib.import_module('main_app.migrations.0027_admin_login_log_username')
+        user = User.objects.create_user('boss')
+        log = AdminLoginLog.objects.create(user=user)
+        schema_editor = mock.Mock(connection=connection)
+        with mock.patch.object(User.objects, 'using', wraps=User.objects.using) as using:
+            migration.backfill_usernames(django_apps, schema_editor)
+        using.assert_called_with(connection.alias)
+        log.refresh_from_db()
+        self.assertEqual(log.username, 'boss')
+
+
+class AdminLoginAnalyticsTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', is_staff=True)
+        now = timezone.now()
+        rows = [
+            ('admin', self.admin, '198.51.100.1', True, now - timedelta(hours=1)),
+            ('admin', self.admin, '198.51.100.1', False, now - timedelta(hours=1)),
+            ('root', None, '203.0.113.9', False, now - timedelta(hours=2)),
+            ('root', None, '203.0.113.9', False, now - timedelta(hours=2)),
+            ('root', None, '203.0.113.9', False, now - timedelta(days=10)),
+        ]
+        AdminLoginLog.objects.bulk_create([
+            AdminLoginLog(username=username, user=user, ip_address=ip, success=success, login_time=when)
+            for username, user, ip, success, when in rows
+        ])
+
+    def test_summary_from_one_query(self):
+        logs = filter_login_logs(AdminLoginLog.objects.all(), {'days': '7'})
+        with self.assertNumQueries(1):
+            summary = login_summary(logs, interval='hour', limit=1)
+        self.assertEqual((summary['total'], summary['successful'], summary['failed']), (4, 1, 3))
+        self.assertEqual(summary['by_username'], [{'username': 'root', 'user_id': None, 'total': 2, 'successful': 0, 'failed': 2}])
+        self.assertEqual(summary['by_ip'][0]['ip_address'], '203.0.113.9')
+        self.assertEqual([bucket['total'] for bucket in summary['buckets']], [2, 2])
+        self.assertTrue(all(timezone.is_aware(bucket['start']) for bucket in summary['buckets']))
+
+    def test_filters(self):
+        logs = AdminLoginLog.objects.all()
+        self.assertEqual(filter_login_logs(logs, {'days': '30'}).count(), 5)
+        self.assertEqual(filter_login_logs(logs, {'username': 'admin', 'success': 'false'}).count(), 1)
+        self.assertEqual(filter_login_logs(logs, {'ip': '203.0.113.9', 'days': '7'}).count(), 2)
+        for params in ({'days': '0'}, {'success': 'maybe'}, {'ip': 'nope'}):
+            with self.assertRaises(ValueError):
+                filter_login_logs(logs, params)
+
+    def test_endpoints(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.get('/api/admin/login-analytics/', {'days': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['interval'], 'hour')
+        self.assertEqual(client.get('/api/admin/login-analytics/', {'days': 30}).data['interval'], 'day')
+        self.assertEqual(client.get('/api/admin/login-analytics/', {'interval': 'minute'}).status_code, 400)
+        self.assertEqual(client.get('/api/admin/login-logs/', {'success': 'false', 'days': 7}).data['count'], 3)
+
+        client.force_authenticate(User.objects.create_user('someone'))
+        self.assertEqual(client.get('/api/admin/login-analytics/').status_code, 403)
+
+
+@override_settings(
+    PASSWORD_HASHERS=FAST_HASHERS, BRUTEFORCE_IP_LIMIT=2, BRUTEFORCE_SUBNET_LIMIT=100, BRUTEFORCE_USERNAME_LIMIT=100,
+)
+class BruteForceTests(TestCase):
+    PUBLIC_IP = '93.184.216.34'
+
+    def setUp(self):
+        bruteforce.local_lockouts.clear()
+        self.addCleanup(bruteforce.local_lockouts.clear)
+
+    def scopes(self, ip):
+        return [scope for scope, _, _ in bruteforce.login_keys('driver', ip)]
+
+    def test_shared_addresses_get_no_ip_or_subnet_scopes(self):
+        self.assertEqual(self.scopes(self.PUBLIC_IP), ['username', 'ip', 'subnet'])
+        for ip in ('10.1.2.3', '127.0.0.1', '100.64.0.7', 'fd00::1', '::ffff:192.168.0.1', 'garbage'):
+            self.assertEqual(self.scopes(ip), ['username'], ip)
+        with override_settings(BRUTEFORCE_TRUSTED_PROXIES=['93.184.216.0/24']):
+            self.assertEqual(self.scopes(self.PUBLIC_IP), ['username'])
+
+    def attempt(self, username, ip):
+        return self.client.post('/api/token/', {'username': username, 'password': 'wrong'},
+                                content_type='application/json', HTTP_X_FORWARDED_FOR=ip)
+
+    def test_public_ips_are_locked_out(self):
+        self.assertEqual(self.attempt('a', self.PUBLIC_IP).status_code, 401)
+        self.assertEqual(self.attempt('b', self.PUBLIC_IP).status_code, 401)
+        response = self.attempt('c', self.PUBLIC_IP)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_proxy_addresses_are_not_locked_out(self):
+        for username in 'abcd':
+            self.assertEqual(self.attempt(username, '10.0.0.2').status_code, 401)
+
+
+@override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2, EMAIL_OUTBOX_RETRY_DELAY=30)
+class EmailOutboxTests(TestCase):
+    def test_queued_emails_wake_the_worker_after_commit(self):
+        with mock.patch.object(outbox.worker, 'wake') as wake, self.captureOnCommitCallbacks(execute=True):
+            outbox.queue_email('a@example.com', 'Hi', 'Body')
+            wake.assert_not_called()
+        wake.assert_called_once()
+
+    def test_sends_and_retries_with_backoff(self):
+        entry = outbox.queue_email('a@example.com', 'Hi', 'Body')
+        with mock.patch.object(outbox, 'get_connection', side_effect=ConnectionRefusedError('down')):
+            self.assertEqual(outbox.drain_outbox(), (0, 1))
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.attempts), (EmailOutbox.PENDING, 1))
+        self.assertIn('ConnectionRefusedError', entry.last_error)
+        self.assertGreater(entry.next_attempt_at, timezone.now() + timedelta(seconds=25))
+        # Not due yet
+        self.assertEqual(outbox.drain_outbox(), (0, 0))
+
+        EmailOutbox.objects.filter(pk=entry.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(outbox.drain_outbox(), (1, 0))
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.body), (EmailOutbox.SENT, ''))
+        self.assertEqual(mail.outbox[0].subject, 'Hi')
+
+    def test_gives_up_after_max_attempts(self):
+        entry = outbox.queue_email('a@example.com', 'Hi', 'Body')
+        with mock.patch.object(outbox, 'get_connection', side_effect=ConnectionRefusedError('down')):
+            for _ in range(2):
+                EmailOutbox.objects.filter(pk=entry.pk).update(next_attempt_at=timezone.now())
+                outbox.drain_outbox()
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.attempts), (EmailOutbox.FAILED, 2))
+
+    def test_worker_starts_with_the_first_request(self):
+        # So retries left by a restart are sent even if this process never queues an email
+        with mock.patch.object(outbox.worker, '_ensure_thread') as ensure_thread:
+            self.client.get('/api/async/contact/')
+        ensure_thread.assert_called()
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, PASSWORD_RESET_MAX_ATTEMPTS=3)
+class PasswordResetCodeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('driver', email='Driver@example.com')
+
+    def test_only_a_user_scoped_hash_is_stored(self):
+        reset_code = PasswordResetCode.create_for_user(self.user)
+        stored = PasswordResetCode.objects.get(pk=reset_code.pk)
+        self.assertNotIn(reset_code.code, stored.code_hash)
+        self.assertEqual(stored.code_hash, PasswordResetCode.hash_code(self.user.pk, reset_code.code))
+        self.assertNotEqual(stored.code_hash, PasswordResetCode.hash_code(self.user.pk + 1, reset_code.code))
+
+    def test_new_codes_replace_old_ones(self):
+        with mock.patch.object(PasswordResetCode, 'generate_code', side_effect=['123456', '654321']):
+            first = PasswordResetCode.create_for_user(self.user)
+            second = PasswordResetCode.create_for_user(self.user)
+        self.assertIsNone(PasswordResetCode.check_code('driver@example.com', first.code))
+        self.assertEqual(PasswordResetCode.check_code(' DRIVER@example.com', second.code).pk, second.pk)
+
+    def test_wrong_guesses_use_up_the_code(self):
+        reset_code = PasswordResetCode.create_for_user(self.user)
+        for _ in range(3):
+            self.assertIsNone(PasswordResetCode.check_code('driver@example.com', 'wrong!'))
+        self.assertIsNone(PasswordResetCode.check_code('driver@example.com', reset_code.code))
+
+    def test_expired_codes_are_rejected_and_pruned(self):
+        reset_code = PasswordResetCode.create_for_user(self.user)
+        PasswordResetCode.objects.filter(pk=reset_code.pk).update(expires_at=timezone.now())
+        self.assertIsNone(PasswordResetCode.check_code('driver@example.com', reset_code.code))
+        self.assertEqual(PasswordResetCode.prune(), 1)
+
+    def test_reset_flow_consumes_the_code_once(self):
+        with mock.patch.object(outbox.worker, 'wake'), self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/password/reset/email/request/', {'email': 'Driver@example.com'}, content_type='application/json')
+        code = EmailOutbox.objects.get().body.split('reset code is: ')[1][:6]
+
+        data = {'email': 'driver@example.com', 'code': code}
+        self.assertEqual(self.client.post('/api/password/reset/email/verify/', data, content_type='application/json').status_code, 200)
+        data['new_password'] = 'n3w-pass'
+        self.assertEqual(self.client.post('/api/password/reset/email/confirm/', data, content_type='application/json').status_code, 200)
+        self.assertEqual(self.client.post('/api/password/reset/email/confirm/', data, content_type='application/json').status_code, 400)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('n3w-pass'))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, SECURITY_ANSWER_ATTEMPTS=2)
+class SecurityAnswerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('driver')
+        self.questions = UserSecurityQuestions(user=self.user)
+        self.questions.set_answers('  Blue   Whale ', 'Williams')
+        self.questions.save()
+
+    def test_answers_are_hashed_and_normalized(self):
+        self.assertNotIn('whale', self.questions.security_answer.lower())
+        self.assertTrue(self.questions.verify_security_answer('blue whale'))
+        self.assertTrue(self.questions.verify_security_answer('BLUE WHALE'))
+        self.assertFalse(self.questions.verify_security_answer('blue'))
+        self.assertFalse(self.questions.verify_security_answer(''))
+        blank = UserSecurityQuestions(user=self.user)
+        blank.set_answers('', 'Williams')
+        self.assertEqual(blank.security_answer, '')
+
+    def reset(self, answer, ip):
+        data = {'username': 'driver', 'security_answer': answer, 'professor_last_name': 'williams', 'new_password': 'n3w-pass'}
+        return self.client.post('/api/password/reset/confirm/', data, content_type='application/json', HTTP_X_FORWARDED_FOR=ip)
+
+    def test_attempts_are_limited_per_account_across_ips(self):
+        self.assertEqual(self.reset('wrong', '93.184.216.1').status_code, 400)
+        self.assertEqual(self.reset('blue whale', '93.184.216.2').status_code, 200)
+        response = self.reset('blue whale', '93.184.216.3')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_migration_hashes_plaintext_answers(self):
+        migration = importlib.import_module('main_app.migrations.0031_hash_security_answers')
+        UserSecurityQuestions.objects.filter(pk=self.questions.pk).update(security_answer=' Red  Fox', professor_last_name='')
+        migration.hash_answers(django_apps, mock.Mock(connection=connection))
+        self.questions.refresh_from_db()
+        self.assertTrue(self.questions.verify_security_answer('red fox'))
+        self.assertEqual(self.questions.professor_last_name, '')
+
+
+class RenderingAndCompressionTests(TestCase):
+    def test_fast_renderer_matches_drf(self):
+        data = {
+            'when': timezone.make_aware(datetime(2026, 1, 2, 3, 4, 5)), 'price': Decimal('1.50'),
+            'text': 'line\u2028break', 'big': 2 ** 70, 'nested': [{'a': None}],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2'),
+        )
+
+    def test_encoding_negotiation(self):
+        best = 'br' if brotli is not None else 'gzip'
+        self.assertEqual(choose_encoding('gzip, deflate, br'), best)
+        self.assertEqual(choose_encoding('gzip;q=1.0, br;q=0.5'), 'gzip')
+        self.assertEqual(choose_encoding('*'), best)
+        self.assertIsNone(choose_encoding('gzip;q=0, br;q=0'))
+        self.assertIsNone(choose_encoding('identity'))
+        self.assertIsNone(choose_encoding(''))
+
+    def response(self, size, **headers):
+        response = HttpResponse(b'{"k": "' + b'x' * size + b'"}', content_type='application/json')
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    def test_compresses_large_json_only(self):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        middleware = CompressionMiddleware(lambda request: self.response(5000, ETag='"v1"'))
+        response = middleware(request)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['ETag'], 'W/"v1"')
+        self.assertEqual(len(gzip.decompress(response.content)), 5009)
+
+        self.assertFalse(CompressionMiddleware(lambda request: self.response(10))(request).has_header('Content-Encoding'))
+        download = CompressionMiddleware(lambda request: self.response(5000, **{'Content-Disposition': 'attachment'}))
+        self.assertFalse(download(request).has_header('Content-Encoding'))
+
+    async def test_async_stack(self):
+        async def view(request):
+            return self.response(5000)
+
+        middleware = CompressionMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(AsyncRequestFactory().get('/', headers={'Accept-Encoding': 'gzip'}))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_api_responses_are_compressed(self):
+        user = User.objects.create_user('driver')
+        FileTag.objects.bulk_create([FileTag(name=f'tag-{i}', created_by=user) for i in range(50)])
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get('/api/file-tags/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))), 50)
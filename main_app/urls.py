@@ -1,11 +1,15 @@
 from django.urls import path
+from . import async_views
 from .views import (
     Landing,
     FeaturesView,
     ContactView,
     ContactUsViewSet,
+    ContactExportView,
     WaitlistView,
     WaitlistListView,
+    WaitlistBulkView,
+    WaitlistExportView,
     WaitlistEntryViewSet,
     FileViewSet,
     FolderViewSet,
@@ -22,6 +26,10 @@ from .views import (
     FileVersionUploadView,
     FileVersionDownloadView,
     FilePermissionGrantView,
+    FolderPermissionViewSet,
+    FolderPermissionGrantView,
+    PermissionBulkGrantView,
+    PermissionBulkRevokeView,
     FileByTagView,
     TestAuthView,
     FileDuplicateView,
@@ -36,8 +44,15 @@ from .views import (
     EmailPasswordResetConfirmView,
     AdminLoginView,
     AdminLoginLogView,
+    AdminLoginAnalyticsView,
+    LoginLockoutView,
+    CacheStatsView,
+    DatabaseStatsView,
+    MetricsView,
     mobile_debug_view,
-    mobile_error_report,
+    MobileErrorReportView,
+    MobileErrorSummaryView,
+    MobileErrorReportListView,
 )
 
 urlpatterns = [
@@ -46,6 +61,8 @@ urlpatterns = [
     path('contact/', ContactView.as_view(), name='contact'),
     path('waitlist/', WaitlistView.as_view(), name='waitlist'),
     path('waitlist/list/', WaitlistListView.as_view(), name='waitlist-list'),
+    path('waitlist/bulk/', WaitlistBulkView.as_view(), name='waitlist-bulk'),
+    path('waitlist/export/<str:export_format>/', WaitlistExportView.as_view(), name='waitlist-export'),
     path('waitlist-entries/', WaitlistEntryViewSet.as_view({'get': 'list', 'post': 'create'}), name='waitlist-entries-list'),
     path('waitlist-entries/<int:id>/', WaitlistEntryViewSet.as_view({
         'get': 'retrieve',
@@ -54,6 +71,7 @@ urlpatterns = [
         'delete': 'destroy'
     }), name='waitlist-entries-detail'),
     path('contactus/', ContactUsViewSet.as_view({'get': 'list', 'post': 'create'}), name='contactus-list'),
+    path('contactus/export/<str:export_format>/', ContactExportView.as_view(), name='contactus-export'),
     path('contactus/<int:id>/', ContactUsViewSet.as_view({
         'get': 'retrieve',
         'put': 'update',
@@ -64,11 +82,19 @@ urlpatterns = [
     # Test authentication endpoint
     path('api/test-auth/', TestAuthView.as_view(), name='test-auth'),
     path('api/debug/mobile/', mobile_debug_view, name='mobile_debug'),
-    path('api/mobile/error-report/', mobile_error_report, name='mobile-error-report'),
+    path('api/mobile/error-report/', MobileErrorReportView.as_view(), name='mobile-error-report'),
+    path('api/mobile/error-reports/', MobileErrorReportView.as_view(), name='mobile-error-reports-batch'),
+    path('api/admin/mobile-errors/', MobileErrorSummaryView.as_view(), name='admin-mobile-errors'),
+    path('api/admin/mobile-errors/<int:pk>/reports/', MobileErrorReportListView.as_view(), name='admin-mobile-error-reports'),
     
     # Admin login and logging routes
     path('api/admin/login/', AdminLoginView.as_view(), name='admin-login'),
     path('api/admin/login-logs/', AdminLoginLogView.as_view(), name='admin-login-logs'),
+    path('api/admin/login-analytics/', AdminLoginAnalyticsView.as_view(), name='admin-login-analytics'),
+    path('api/admin/login-lockouts/', LoginLockoutView.as_view(), name='admin-login-lockouts'),
+    path('api/admin/cache-stats/', CacheStatsView.as_view(), name='admin-cache-stats'),
+    path('api/admin/db-stats/', DatabaseStatsView.as_view(), name='admin-db-stats'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
     
     # Password management routes
     path('api/password/change/', PasswordChangeView.as_view(), name='password-change'),
@@ -103,6 +129,8 @@ urlpatterns = [
     # File permissions routes
     path('api/files/<int:file_id>/permissions/', FilePermissionViewSet.as_view({'get': 'list'}), name='file-permissions-list'),
     path('api/files/<int:file_id>/permissions/grant/', FilePermissionGrantView.as_view(), name='file-permission-grant'),
+    path('api/permissions/bulk-grant/', PermissionBulkGrantView.as_view(), name='permissions-bulk-grant'),
+    path('api/permissions/bulk-revoke/', PermissionBulkRevokeView.as_view(), name='permissions-bulk-revoke'),
     
     # Folder management routes
     path('api/folders/', FolderViewSet.as_view({'get': 'list', 'post': 'create'}), name='folders-list'),
@@ -115,6 +143,8 @@ urlpatterns = [
     path('api/folders/<int:pk>/move/', FolderMoveView.as_view(), name='folder-move'),
     path('api/folders/<int:pk>/duplicate/', FolderDuplicateView.as_view(), name='folder-duplicate'),
     path('api/folders/<int:pk>/download/', FolderDownloadView.as_view(), name='folder-download'),
+    path('api/folders/<int:pk>/permissions/', FolderPermissionViewSet.as_view({'get': 'list'}), name='folder-permissions-list'),
+    path('api/folders/<int:pk>/permissions/grant/', FolderPermissionGrantView.as_view(), name='folder-permission-grant'),
     
     # File tags routes
     path('api/file-tags/', FileTagViewSet.as_view({'get': 'list', 'post': 'create'}), name='file-tags-list'),
@@ -133,4 +163,11 @@ urlpatterns = [
         'patch': 'partial_update',
         'delete': 'destroy'
     }), name='file-previews-detail'),
+    
+    # Async variants of the I/O-bound endpoints (for ASGI deployments)
+    path('api/async/files/upload/', async_views.file_upload, name='async-file-upload'),
+    path('api/async/files/<int:pk>/download/', async_views.file_download, name='async-file-download'),
+    path('api/async/folders/<int:pk>/download/', async_views.folder_download, name='async-folder-download'),
+    path('api/async/waitlist/', async_views.waitlist_signup, name='async-waitlist'),
+    path('api/async/contact/', async_views.contact_submit, name='async-contact'),
 ]
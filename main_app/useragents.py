@@ -0,0 +1,64 @@
+"""
+Request classification
+
+One place that decides what kind of client sent a request. The User-Agent is
+classified once per distinct string (LRU cache) with precompiled patterns,
+and the result is kept on the request, so middleware and views that all
+ask "is this a phone?" share a single pass over the header.
+"""
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+
+MOBILE_PATTERN = re.compile(r'mobile|android|iphone|ipad|ipod|blackberry|webos')
+TABLET_PATTERN = re.compile(r'ipad|tablet')
+# Checked in order, first match wins (Edge and Opera also claim to be Chrome,
+# Chrome claims to be Safari, and the claims come first in the string)
+BROWSER_PATTERNS = (
+    ('edge', re.compile(r'edg(?:a|ios)?/')),
+    ('opera', re.compile(r'opr/|opera')),
+    ('samsung', re.compile(r'samsungbrowser')),
+    ('firefox', re.compile(r'firefox|fxios')),
+    ('chrome', re.compile(r'chrome|crios')),
+    ('safari', re.compile(r'safari')),
+)
+MAX_USER_AGENT_LENGTH = 512
+
+
+class ClientInfo(NamedTuple):
+    is_mobile: bool
+    device: str  # 'mobile', 'tablet', 'desktop' or 'unknown'
+    browser: str  # 'edge', 'opera', 'samsung', 'firefox', 'chrome', 'safari', 'other' or 'unknown'
+
+
+@lru_cache(maxsize=2048)
+def classify_user_agent(user_agent):
+    if not user_agent:
+        return ClientInfo(False, 'unknown', 'unknown')
+    ua = user_agent[:MAX_USER_AGENT_LENGTH].lower()
+    mobile = MOBILE_PATTERN.search(ua)
+    if TABLET_PATTERN.search(ua) or ('android' in ua and 'mobile' not in ua):
+        device = 'tablet'
+    elif mobile:
+        device = 'mobile'
+    else:
+        device = 'desktop'
+    browser = next((name for name, pattern in BROWSER_PATTERNS if pattern.search(ua)), 'other')
+    return ClientInfo(mobile is not None, device, browser)
+
+
+def get_client_info(request):
+    """ClientInfo for a Django or DRF request, computed once per request"""
+    request = getattr(request, '_request', request)
+    info = getattr(request, '_client_info', None)
+    if info is None:
+        # Truncated before the cache lookup, so huge headers can't bloat the cache keys
+        info = request._client_info = classify_user_agent(request.META.get('HTTP_USER_AGENT', '')[:MAX_USER_AGENT_LENGTH])
+    return info
+
+
+def prefix_matcher(prefixes):
+    """A compiled `path.startswith(any of prefixes)` test"""
+    pattern = re.compile('|'.join(re.escape(prefix) for prefix in sorted(prefixes, key=len, reverse=True)))
+    return lambda path: pattern.match(path) is not None
@@ -3,14 +3,18 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.generics import ListAPIView
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAdminUser
 from rest_framework.authentication import TokenAuthentication
 from rest_framework import viewsets, permissions
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework.exceptions import PermissionDenied
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
 from django.http import HttpResponse, Http404
 from django.conf import settings
 from django.shortcuts import get_object_or_404
@@ -26,43 +30,18 @@ from django.utils import timezone
 from django.core.cache import cache
 from django.views.decorators.cache import cache_page
 from django.utils.decorators import method_decorator
+import io
+import logging
+from datetime import timedelta
+from ipaddress import ip_address
 import os
+import re
 import mimetypes
 import zipfile
 import tempfile
 from django.http import FileResponse
 
 
-def rate_limit(key_prefix, limit=100, period=3600):
-    """
-    Rate limiting decorator
-    key_prefix: prefix for cache key
-    limit: maximum requests per period
-    period: time period in seconds
-    """
-    def decorator(view_func):
-        def wrapper(self, request, *args, **kwargs):
-            # Create cache key based on user and action
-            user_id = request.user.id if request.user.is_authenticated else 'anonymous'
-            cache_key = f"{key_prefix}:{user_id}"
-            
-            # Get current count
-            current_count = cache.get(cache_key, 0)
-            
-            if current_count >= limit:
-                return Response(
-                    {'error': 'Rate limit exceeded. Please try again later.'},
-                    status=status.HTTP_429_TOO_MANY_REQUESTS
-                )
-            
-            # Increment count
-            cache.set(cache_key, current_count + 1, period)
-            
-            return view_func(self, request, *args, **kwargs)
-        return wrapper
-    return decorator
-
-
 from .models import (
     ContactUs,
     WaitlistEntry,
@@ -71,10 +50,12 @@ from .models import (
     FileTag,
     FileVersion,
     FilePermission,
+    FolderPermission,
     FilePreview,
     UserSecurityQuestions,
     PasswordResetCode,
-    AdminLoginLog
+    AdminLoginLog,
+    MobileErrorReport,
 )
 from .serializers import (
     ContactUsSerializer,
@@ -84,14 +65,50 @@ from .serializers import (
     FileTagSerializer,
     FileVersionSerializer,
     FilePermissionSerializer,
+    FolderPermissionSerializer,
+    BulkPermissionSerializer,
+    BulkPermissionGrantSerializer,
     FilePreviewSerializer,
     UserSecurityQuestionsSerializer,
+    SecurityQuestionsSetupSerializer,
     PasswordChangeSerializer,
     PasswordResetRequestSerializer,
     PasswordResetConfirmSerializer,
     EmailPasswordResetRequestSerializer,
     EmailPasswordResetVerifySerializer,
-    EmailPasswordResetConfirmSerializer
+    EmailPasswordResetConfirmSerializer,
+    TokenRevokeSerializer,
+    MobileErrorReportSerializer,
+    AdminLoginLogSerializer,
+)
+from .ingestion import ingest_emails, iter_csv_emails
+from .tagging import filter_by_tags, parse_tag_ids
+from .ratelimit import check_subject_rate_limit, get_client_ip, rate_limit
+from .useragents import get_client_info
+from .mobile_errors import MAX_SUMMARY_HOURS, error_summary, parse_reports, record_reports, report_limits
+from .audit import filter_login_logs, login_summary
+from .outbox import queue_email
+from . import bruteforce
+from .cache import cache_stats
+from .db import connection_stats
+from .metrics import registry as metrics_registry
+from .routers import ReplicaReadMixin, read_database
+from .authentication import CachedJWTAuthentication
+from .hashers import HashingPoolBusy, fail_fast_hashing
+from .revocation import revoke_token
+from .access import (
+    HasFileAccess,
+    HasFolderAccess,
+    get_access_resolver,
+    grant_permissions,
+    revoke_permissions,
+)
+from .exports import (
+    EXPORT_FORMATS,
+    WAITLIST_EXPORT_FIELDS,
+    CONTACT_EXPORT_FIELDS,
+    apply_date_range,
+    streaming_export_response,
 )
 import json
 import os
@@ -99,7 +116,7 @@ import zipfile
 import tempfile
 import mimetypes
 from functools import wraps
-from django.core.mail import send_mail
+from django.db import transaction
 from django.conf import settings
 from django.contrib.auth import authenticate, login as django_login
 from django.contrib.auth.forms import AuthenticationForm
@@ -107,6 +124,19 @@ from django.shortcuts import render, redirect
 from django.contrib import messages
 
 
+logger = logging.getLogger(__name__)
+
+
+def hashing_busy_response():
+    """503 for a login turned away because the password hashing pool is full"""
+    response = Response(
+        {'error': 'Too many login attempts are being processed. Please try again shortly.'},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+    response['Retry-After'] = str(HashingPoolBusy.retry_after)
+    return response
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class CustomTokenObtainPairView(APIView):
     """
@@ -118,26 +148,23 @@ class CustomTokenObtainPairView(APIView):
     
     def log_mobile_request(self, request, success=True, error_msg=None):
         """Log mobile requests for debugging"""
-        user_agent = request.META.get('HTTP_USER_AGENT', '')
-        is_mobile = any(indicator in user_agent.lower() for indicator in ['mobile', 'android', 'iphone', 'ipad'])
-        
-        if is_mobile:
-            log_data = {
-                'timestamp': timezone.now().isoformat(),
+        if get_client_info(request).is_mobile:
+            # Field names only: the body holds the password
+            logger.debug('Mobile login request', extra={
                 'method': request.method,
                 'path': request.path,
-                'user_agent': user_agent,
+                'user_agent': request.META.get('HTTP_USER_AGENT', ''),
                 'ip': request.META.get('REMOTE_ADDR', ''),
                 'success': success,
                 'error': error_msg,
-                'data': request.data if hasattr(request, 'data') else None,
-            }
-            print(f"MOBILE_LOGIN_DEBUG: {log_data}")
+                'fields': sorted(request.data.keys()) if hasattr(request, 'data') else None,
+            })
     
     @csrf_exempt
     def dispatch(self, request, *args, **kwargs):
         return super().dispatch(request, *args, **kwargs)
     
+    @rate_limit('login', limit=10, period=60, key='ip')  # 10 attempts per minute
     def post(self, request, *args, **kwargs):
         try:
             # Log mobile request at start
@@ -172,14 +199,11 @@ class CustomTokenObtainPairView(APIView):
             )
             password = data.get('password', '')
             
-            # Log the request data for debugging
-            if settings.DEBUG:
-                print(f"CustomTokenObtainPairView - Login attempt")
-                print(f"Request method: {request.method}")
-                print(f"Content type: {request.content_type}")
-                print(f"Data keys: {list(data.keys()) if data else 'No data'}")
-                print(f"Username/Email extracted: '{username_or_email}'")
-                print(f"Password provided: {'Yes' if password else 'No'}")
+            logger.debug('Login attempt', extra={
+                'content_type': request.content_type,
+                'fields': sorted(data.keys()) if data else [],
+                'password_provided': bool(password),
+            })
             
             if not username_or_email or not password:
                 self.log_mobile_request(request, success=False, error_msg="Missing credentials")
@@ -193,26 +217,19 @@ class CustomTokenObtainPairView(APIView):
                     } if settings.DEBUG else None
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # Try to authenticate with username first
-            user = authenticate(username=username_or_email, password=password)
+            # Locked-out attempts are rejected before any password hashing
+            client_ip = get_client_ip(request)
+            retry_after = bruteforce.check_login(username_or_email, client_ip)
+            if retry_after:
+                self.log_mobile_request(request, success=False, error_msg="Locked out")
+                return bruteforce.lockout_response(retry_after)
             
-            # If that fails, try to find user by email and authenticate
-            if user is None:
-                try:
-                    user_obj = User.objects.get(email=username_or_email)
-                    user = authenticate(username=user_obj.username, password=password)
-                except User.DoesNotExist:
-                    user = None
-                except User.MultipleObjectsReturned:
-                    # If multiple users have the same email, try the first one
-                    try:
-                        user_obj = User.objects.filter(email=username_or_email).first()
-                        if user_obj:
-                            user = authenticate(username=user_obj.username, password=password)
-                    except:
-                        user = None
+            # Resolves username or email in one query and checks the password once
+            with fail_fast_hashing():
+                user = authenticate(request, username=username_or_email, password=password)
             
             if user is None:
+                bruteforce.record_failure(username_or_email, client_ip)
                 self.log_mobile_request(request, success=False, error_msg="Invalid credentials")
                 return Response({
                     'error': 'Invalid credentials. Please check your username/email and password.',
@@ -225,6 +242,8 @@ class CustomTokenObtainPairView(APIView):
                     'error': 'Account is disabled.'
                 }, status=status.HTTP_401_UNAUTHORIZED)
             
+            bruteforce.record_success(username_or_email, client_ip)
+            
             # Generate JWT tokens
             from rest_framework_simplejwt.tokens import RefreshToken
             refresh = RefreshToken.for_user(user)
@@ -247,13 +266,13 @@ class CustomTokenObtainPairView(APIView):
                 }
             }, status=status.HTTP_200_OK)
             
+        except HashingPoolBusy:
+            self.log_mobile_request(request, success=False, error_msg="Hashing pool busy")
+            return hashing_busy_response()
         except Exception as e:
             # Log the full error for debugging
             self.log_mobile_request(request, success=False, error_msg=f"Exception: {str(e)}")
-            if settings.DEBUG:
-                print(f"CustomTokenObtainPairView error: {str(e)}")
-                import traceback
-                print(f"Traceback: {traceback.format_exc()}")
+            logger.exception('Login failed with an unexpected error')
             
             return Response({
                 'error': 'An unexpected error occurred during authentication.',
@@ -261,6 +280,36 @@ class CustomTokenObtainPairView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class TokenRevokeView(APIView):
+    """
+    Log out by revoking a refresh token, and optionally the current access
+    token. Holding the refresh token is enough to revoke it, so this works
+    even after the access token has expired.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+    
+    def post(self, request):
+        serializer = TokenRevokeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        try:
+            refresh = RefreshToken(serializer.validated_data['refresh'])
+        except TokenError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        revoke_token(refresh)
+        
+        if request.data.get('access'):
+            try:
+                access = AccessToken(request.data['access'])
+            except TokenError:
+                # Expired or invalid: it can't authenticate anything anyway
+                pass
+            else:
+                revoke_token(access)
+        return Response({'message': 'Token revoked'}, status=status.HTTP_200_OK)
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class MobileLoginTestView(APIView):
     """
@@ -317,6 +366,7 @@ class WaitlistView(APIView):
     authentication_classes = []  # No authentication required
     permission_classes = [permissions.AllowAny]  # Public access
     
+    @rate_limit('waitlist', limit=10, period=3600, key='ip')  # 10 signups per hour
     def post(self, request):
         serializer = WaitlistEntrySerializer(data=request.data)
         if serializer.is_valid():
@@ -341,6 +391,63 @@ class WaitlistListView(ListAPIView):
     search_fields = ['email', 'created_at']
 
 
+class WaitlistBulkView(APIView):
+    """Bulk-ingest waitlist emails from a JSON list or an uploaded CSV (admin only)"""
+    permission_classes = [IsAdminUser]
+    max_emails = 50000
+    
+    def post(self, request):
+        uploaded_file = request.FILES.get('file')
+        if uploaded_file:
+            lines = io.TextIOWrapper(uploaded_file.file, encoding='utf-8-sig', newline='')
+            emails = list(iter_csv_emails(lines))
+        else:
+            if hasattr(request.data, 'getlist'):
+                emails = request.data.getlist('emails')
+                if len(emails) == 1:
+                    emails = emails[0]
+            else:
+                emails = request.data.get('emails')
+            if isinstance(emails, str):
+                # Accept a newline/comma separated blob as well as a list
+                emails = [email for email in re.split(r'[\s,;]+', emails) if email]
+        
+        if not emails or not isinstance(emails, list):
+            return Response({'error': 'Provide a list of emails or a CSV file'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(emails) > self.max_emails:
+            return Response({'error': f'At most {self.max_emails} emails can be submitted per request'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        campaign = (request.data.get('campaign') or '').strip()
+        if len(campaign) > 100:
+            return Response({'error': 'Campaign cannot be longer than 100 characters'}, status=status.HTTP_400_BAD_REQUEST)
+        per_campaign = request.data.get('per_campaign', False) in [True, 'true', 'True', '1', 1]
+        
+        result = ingest_emails(emails, campaign=campaign, per_campaign=per_campaign)
+        return Response(result, status=status.HTTP_200_OK)
+
+
+class WaitlistExportView(ReplicaReadMixin, APIView):
+    """Stream waitlist entries as CSV or NDJSON (admin only)"""
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request, export_format):
+        if export_format not in EXPORT_FORMATS:
+            return Response({'error': f"Unsupported export format. Use one of: {', '.join(EXPORT_FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        queryset = WaitlistEntry.objects.using(read_database()).order_by('created_at')
+        try:
+            queryset = apply_date_range(queryset, request.query_params, 'created_at')
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        campaign = request.query_params.get('campaign')
+        if campaign is not None:
+            queryset = queryset.filter(campaign=campaign)
+        
+        filename = f"waitlist-{timezone.now():%Y%m%d-%H%M%S}"
+        return streaming_export_response(queryset, WAITLIST_EXPORT_FIELDS, export_format, filename)
+
+
 class WaitlistEntryViewSet(viewsets.ModelViewSet):
     queryset = WaitlistEntry.objects.all()
     serializer_class = WaitlistEntrySerializer
@@ -351,11 +458,17 @@ class WaitlistEntryViewSet(viewsets.ModelViewSet):
             return [permissions.IsAdminUser()]
         return [permissions.AllowAny()]
 
+    # Shares its budget with the public waitlist form endpoint
+    @rate_limit('waitlist', limit=10, period=3600, key='ip')
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
 
 class ContactView(APIView):
     authentication_classes = []  # No authentication required
     permission_classes = [permissions.AllowAny]  # Public access
     
+    @rate_limit('contact', limit=5, period=3600, key='ip')  # 5 messages per hour
     def post(self, request):
         serializer = ContactUsSerializer(data=request.data)
         if serializer.is_valid():
@@ -372,6 +485,32 @@ class ContactListView(ListAPIView):
     search_fields = ['id', 'contact_id', 'first_name', 'last_name', 'email', 'feedback_type', 'message']
 
 
+class ContactExportView(ReplicaReadMixin, APIView):
+    """Stream contact submissions as CSV or NDJSON (admin only)"""
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request, export_format):
+        if export_format not in EXPORT_FORMATS:
+            return Response({'error': f"Unsupported export format. Use one of: {', '.join(EXPORT_FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        queryset = ContactUs.objects.using(read_database()).order_by('created_at')
+        try:
+            queryset = apply_date_range(queryset, request.query_params, 'created_at')
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        feedback_type = request.query_params.get('feedback_type')
+        if feedback_type:
+            queryset = queryset.filter(feedback_type=feedback_type)
+        
+        is_read = request.query_params.get('is_read')
+        if is_read is not None:
+            queryset = queryset.filter(is_read=is_read.lower() in ['true', '1'])
+        
+        filename = f"contacts-{timezone.now():%Y%m%d-%H%M%S}"
+        return streaming_export_response(queryset, CONTACT_EXPORT_FIELDS, export_format, filename)
+
+
 class ContactUsViewSet(viewsets.ModelViewSet):
     queryset = ContactUs.objects.all()
     serializer_class = ContactUsSerializer
@@ -382,27 +521,31 @@ class ContactUsViewSet(viewsets.ModelViewSet):
             return [permissions.IsAuthenticated()]
         return [permissions.AllowAny()]
 
+    # Shares its budget with the public contact form endpoint
+    @rate_limit('contact', limit=5, period=3600, key='ip')
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
     def partial_update(self, request, *args, **kwargs):
         """Custom partial_update method with debugging"""
         instance = self.get_object()
-        print(f"Updating contact {instance.id} with data: {request.data}")
-        print(f"Current is_read value: {instance.is_read}")
+        logger.debug('Updating contact %s fields %s', instance.id, sorted(request.data.keys()))
         
         serializer = self.get_serializer(instance, data=request.data, partial=True)
         if serializer.is_valid():
             updated_instance = serializer.save()
-            print(f"Updated is_read value: {updated_instance.is_read}")
+            logger.debug('Contact %s is_read=%s', updated_instance.id, updated_instance.is_read)
             return Response(serializer.data)
         else:
-            print(f"Serializer errors: {serializer.errors}")
+            logger.debug('Contact %s update rejected: %s', instance.id, serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class FileViewSet(viewsets.ModelViewSet):
+class FileViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = File.objects.all()
     serializer_class = FileSerializer
-    permission_classes = [permissions.IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated, HasFileAccess]
+    authentication_classes = [CachedJWTAuthentication]
     # filter_backends = [SearchFilter]
     search_fields = ['name', 'file_type', 'uploaded_by__username']
     lookup_field = 'pk'
@@ -411,7 +554,7 @@ class FileViewSet(viewsets.ModelViewSet):
         serializer.save(uploaded_by=self.request.user)
     
     def get_queryset(self):
-        queryset = File.objects.all()
+        queryset = get_access_resolver(self.request).filter_files(File.objects.all())
         folder_id = self.request.query_params.get('folder', None)
         if folder_id:
             if folder_id == 'null':
@@ -423,34 +566,32 @@ class FileViewSet(viewsets.ModelViewSet):
     def partial_update(self, request, *args, **kwargs):
         """Handle PATCH requests for updating file properties including moving files"""
         try:
-            print(f"FileViewSet partial_update called with data: {request.data}")
             instance = self.get_object()
-            print(f"File instance: {instance.name}, current folder: {instance.folder}")
+            logger.debug('Updating file %s fields %s', instance.id, sorted(request.data.keys()))
             
             # Check if this is a move operation
             if 'folder' in request.data:
                 target_folder_id = request.data.get('folder')
-                print(f"Moving file to folder ID: {target_folder_id}")
                 
                 # Get target folder if specified
                 target_folder = None
                 if target_folder_id:
                     try:
                         target_folder = Folder.objects.get(id=target_folder_id)
-                        print(f"Found target folder: {target_folder.name}")
                     except Folder.DoesNotExist:
-                        print(f"Target folder {target_folder_id} not found")
                         return Response({'error': 'Target folder not found'}, status=status.HTTP_404_NOT_FOUND)
                 
+                if not get_access_resolver(request).has_folder_access(target_folder, 'write'):
+                    return Response({'error': 'You do not have write access to the target folder'}, status=status.HTTP_403_FORBIDDEN)
+                
                 # Check if file with same name exists in target folder
                 if File.objects.filter(name=instance.name, folder=target_folder).exclude(id=instance.id).exists():
-                    print(f"File with same name already exists in target folder")
                     return Response({'error': 'A file with this name already exists in the target folder'}, status=status.HTTP_400_BAD_REQUEST)
                 
                 # Move file
                 instance.folder = target_folder
                 instance.save()
-                print(f"File moved successfully to folder: {target_folder.name if target_folder else 'root'}")
+                logger.info('Moved file %s to folder %s', instance.id, target_folder.id if target_folder else None)
                 
                 serializer = self.get_serializer(instance)
                 return Response(serializer.data, status=status.HTTP_200_OK)
@@ -458,7 +599,6 @@ class FileViewSet(viewsets.ModelViewSet):
             # Check if this is a rename operation
             if 'name' in request.data:
                 new_name = request.data.get('name')
-                print(f"Renaming file to: {new_name}")
                 
                 # Validate new name
                 if not new_name or new_name.strip() == '':
@@ -476,19 +616,17 @@ class FileViewSet(viewsets.ModelViewSet):
                 return Response(serializer.data, status=status.HTTP_200_OK)
             
             # Handle other partial updates (description, tags, is_public, etc.)
-            print(f"Handling other partial updates")
             serializer = self.get_serializer(instance, data=request.data, partial=True)
             if serializer.is_valid():
                 serializer.save()
                 return Response(serializer.data, status=status.HTTP_200_OK)
             else:
-                print(f"Serializer errors: {serializer.errors}")
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
                 
+        except (Http404, PermissionDenied):
+            raise
         except Exception as e:
-            print(f"Error in FileViewSet partial_update: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception('Error updating file %s', kwargs.get('pk'))
             return Response({'error': f'Server error: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     def destroy(self, request, *args, **kwargs):
@@ -503,24 +641,29 @@ class FileViewSet(viewsets.ModelViewSet):
                     pass  # Continue even if file deletion fails
             instance.delete()
             return Response({'message': 'File deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
+        except (Http404, PermissionDenied):
+            raise
         except Exception as e:
             return Response({'error': f'Server error: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class FolderViewSet(viewsets.ModelViewSet):
+class FolderViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Folder.objects.all()
     serializer_class = FolderSerializer
-    permission_classes = [permissions.IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated, HasFolderAccess]
+    authentication_classes = [CachedJWTAuthentication]
     # filter_backends = [SearchFilter]
     search_fields = ['name', 'created_by__username']
     lookup_field = 'pk'
     
     def perform_create(self, serializer):
+        parent = serializer.validated_data.get('parent')
+        if not get_access_resolver(self.request).has_folder_access(parent, 'write'):
+            raise PermissionDenied('You do not have write access to the parent folder')
         serializer.save(created_by=self.request.user)
     
     def get_queryset(self):
-        queryset = Folder.objects.all()
+        queryset = get_access_resolver(self.request).filter_folders(Folder.objects.all())
         parent_id = self.request.query_params.get('parent', None)
         if parent_id:
             if parent_id == 'null':
@@ -565,6 +708,8 @@ class FolderViewSet(viewsets.ModelViewSet):
             instance = self.get_object()
             self.perform_destroy(instance)
             return Response({'message': 'Folder deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
+        except (Http404, PermissionDenied):
+            raise
         except ValidationError as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
@@ -577,7 +722,7 @@ class FolderViewSet(viewsets.ModelViewSet):
             instance.delete()
         except Exception as e:
             # Log the error for debugging
-            print(f"Error deleting folder {instance.id}: {str(e)}")
+            logger.exception('Error deleting folder %s', instance.id)
             raise ValidationError(f"The folder may contain files or there is a backend issue: {str(e)}")
 
     def _delete_folder_contents(self, folder):
@@ -618,26 +763,25 @@ class FolderViewSet(viewsets.ModelViewSet):
                             pass
                     file_obj.delete()
                 except Exception as e:
-                    print(f"Error deleting file {file_obj.id}: {str(e)}")
+                    logger.warning('Error deleting file %s: %s', file_obj.id, e)
                     raise
-            
+
             # Recursively delete all subfolders
             for subfolder in folder.children.all():
                 try:
                     self._delete_folder_contents(subfolder)
                     subfolder.delete()
                 except Exception as e:
-                    print(f"Error deleting subfolder {subfolder.id}: {str(e)}")
+                    logger.warning('Error deleting subfolder %s: %s', subfolder.id, e)
                     raise
-                    
         except Exception as e:
-            print(f"Error in _delete_folder_contents for folder {folder.id}: {str(e)}")
+            logger.warning('Error deleting the contents of folder %s: %s', folder.id, e)
             raise
 
 
 class FileUploadView(APIView):
     permission_classes = [permissions.IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     
     @rate_limit('file_upload', limit=50, period=3600)  # 50 uploads per hour
     def post(self, request):
@@ -659,16 +803,13 @@ class FileUploadView(APIView):
             if overwrite:
                 replace_existing = True
             
-            # Debug logging
-            print(f"DEBUG: Upload request received")
-            print(f"DEBUG: folder_id = {folder_id} (type: {type(folder_id)})")
-            print(f"DEBUG: replace_existing_raw = {replace_existing_raw} (type: {type(replace_existing_raw)})")
-            print(f"DEBUG: replace_existing = {replace_existing}")
-            print(f"DEBUG: upload_as_duplicate_raw = {upload_as_duplicate_raw} (type: {type(upload_as_duplicate_raw)})")
-            print(f"DEBUG: upload_as_duplicate = {upload_as_duplicate}")
-            print(f"DEBUG: overwrite_raw = {overwrite_raw} (type: {type(overwrite_raw)})")
-            print(f"DEBUG: overwrite = {overwrite}")
-            print(f"DEBUG: All request.data = {request.data}")
+            logger.debug('Upload request', extra={
+                'folder_id': folder_id,
+                'replace_existing': replace_existing,
+                'upload_as_duplicate': upload_as_duplicate,
+                'overwrite': overwrite,
+                'fields': sorted(request.data.keys()),
+            })
             
             if not uploaded_file:
                 return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
@@ -681,6 +822,10 @@ class FileUploadView(APIView):
                 except Folder.DoesNotExist:
                     return Response({'error': 'Folder not found'}, status=status.HTTP_404_NOT_FOUND)
             
+            resolver = get_access_resolver(request)
+            if not resolver.has_folder_access(folder, 'write'):
+                return Response({'error': 'You do not have write access to this folder'}, status=status.HTTP_403_FORBIDDEN)
+            
             # Use custom name if provided, otherwise use original filename
             file_name = custom_name if custom_name else uploaded_file.name
             
@@ -689,6 +834,9 @@ class FileUploadView(APIView):
             
             if existing_file:
                 if replace_existing:
+                    if not resolver.has_file_access(existing_file, 'write'):
+                        return Response({'error': 'You do not have write access to the existing file'}, status=status.HTTP_403_FORBIDDEN)
+                    
                     # Delete the existing file from storage
                     if existing_file.file and default_storage.exists(existing_file.file.name):
                         default_storage.delete(existing_file.file.name)
@@ -752,12 +900,12 @@ class FileUploadView(APIView):
 
 class FileDownloadView(APIView):
     permission_classes = [permissions.IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     
     @rate_limit('file_download', limit=200, period=3600)  # 200 downloads per hour
     def get(self, request, pk):
         try:
-            file_obj = get_object_or_404(File, id=pk)
+            file_obj = get_object_or_404(get_access_resolver(request).filter_files(File.objects.all()), id=pk)
             
             if not file_obj.file:
                 return Response({'error': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -781,6 +929,8 @@ class FileDownloadView(APIView):
             
             return response
             
+        except Http404:
+            raise
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -790,7 +940,8 @@ class FileMoveView(APIView):
     
     def post(self, request, pk):
         try:
-            file_obj = get_object_or_404(File, id=pk)
+            resolver = get_access_resolver(request)
+            file_obj = get_object_or_404(resolver.filter_files(File.objects.all(), 'write'), id=pk)
             target_folder_id = request.data.get('target_folder')
             
             # Get target folder if specified
@@ -801,6 +952,9 @@ class FileMoveView(APIView):
                 except Folder.DoesNotExist:
                     return Response({'error': 'Target folder not found'}, status=status.HTTP_404_NOT_FOUND)
             
+            if not resolver.has_folder_access(target_folder, 'write'):
+                return Response({'error': 'You do not have write access to the target folder'}, status=status.HTTP_403_FORBIDDEN)
+            
             # Check if file with same name exists in target folder
             if File.objects.filter(name=file_obj.name, folder=target_folder).exists():
                 return Response({'error': 'A file with this name already exists in the target folder'}, status=status.HTTP_400_BAD_REQUEST)
@@ -812,6 +966,8 @@ class FileMoveView(APIView):
             serializer = FileSerializer(file_obj)
             return Response(serializer.data, status=status.HTTP_200_OK)
             
+        except Http404:
+            raise
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -823,6 +979,9 @@ class FolderMoveView(APIView):
         try:
             folder_obj = get_object_or_404(Folder, id=pk)
             target_parent_id = request.data.get('target_parent')
+            resolver = get_access_resolver(request)
+            if not resolver.has_folder_access(folder_obj, 'write'):
+                return Response({'error': 'You do not have write access to this folder'}, status=status.HTTP_403_FORBIDDEN)
             
             # Get target parent folder if specified
             target_parent = None
@@ -835,6 +994,9 @@ class FolderMoveView(APIView):
                 except Folder.DoesNotExist:
                     return Response({'error': 'Target parent folder not found'}, status=status.HTTP_404_NOT_FOUND)
             
+            if not resolver.has_folder_access(target_parent, 'write'):
+                return Response({'error': 'You do not have write access to the target folder'}, status=status.HTTP_403_FORBIDDEN)
+            
             # Check if folder with same name exists in target parent
             if Folder.objects.filter(name=folder_obj.name, parent=target_parent).exists():
                 return Response({'error': 'A folder with this name already exists in the target location'}, status=status.HTTP_400_BAD_REQUEST)
@@ -846,17 +1008,26 @@ class FolderMoveView(APIView):
             serializer = FolderSerializer(folder_obj)
             return Response(serializer.data, status=status.HTTP_200_OK)
             
+        except Http404:
+            raise
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class FileTagViewSet(viewsets.ModelViewSet):
+class FileTagViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = FileTag.objects.all()
     serializer_class = FileTagSerializer
     permission_classes = [permissions.IsAuthenticated]
     # filter_backends = [SearchFilter]
     search_fields = ['name']
     
+    def get_queryset(self):
+        queryset = FileTag.objects.all()
+        # ?ordering=popular lists the most used tags first, straight from the stored counts
+        if self.request.query_params.get('ordering') == 'popular':
+            queryset = queryset.order_by('-files_count', 'name')
+        return queryset
+    
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
@@ -866,7 +1037,16 @@ class FileVersionViewSet(viewsets.ModelViewSet):
     serializer_class = FileVersionSerializer
     permission_classes = [permissions.IsAuthenticated]
     
+    def get_queryset(self):
+        readable_files = get_access_resolver(self.request).filter_files(File.objects.all())
+        queryset = FileVersion.objects.filter(file__in=readable_files)
+        if 'file_id' in self.kwargs:
+            queryset = queryset.filter(file_id=self.kwargs['file_id'])
+        return queryset
+    
     def perform_create(self, serializer):
+        if not get_access_resolver(self.request).has_file_access(serializer.validated_data['file'], 'write'):
+            raise PermissionDenied('You do not have write access to this file')
         serializer.save(created_by=self.request.user)
 
 
@@ -875,17 +1055,43 @@ class FilePermissionViewSet(viewsets.ModelViewSet):
     serializer_class = FilePermissionSerializer
     permission_classes = [permissions.IsAuthenticated]
     
+    def get_queryset(self):
+        # Only users who can administer a file may see who else has access to it
+        managed_files = get_access_resolver(self.request).filter_files(File.objects.all(), 'admin')
+        queryset = FilePermission.objects.filter(file__in=managed_files).select_related('user', 'granted_by')
+        if 'file_id' in self.kwargs:
+            queryset = queryset.filter(file_id=self.kwargs['file_id'])
+        return queryset
+    
     def perform_create(self, serializer):
+        if not get_access_resolver(self.request).has_file_access(serializer.validated_data['file'], 'admin'):
+            raise PermissionDenied('You do not have admin access to this file')
         serializer.save(granted_by=self.request.user)
 
 
+class FolderPermissionViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = FolderPermissionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [CachedJWTAuthentication]
+    
+    def get_queryset(self):
+        folder = get_object_or_404(Folder, pk=self.kwargs['pk'])
+        if not get_access_resolver(self.request).has_folder_access(folder, 'admin'):
+            raise PermissionDenied('You do not have admin access to this folder')
+        return FolderPermission.objects.filter(folder=folder).select_related('user', 'granted_by')
+
+
 class FilePreviewViewSet(viewsets.ModelViewSet):
     queryset = FilePreview.objects.all()
     serializer_class = FilePreviewSerializer
     permission_classes = [permissions.IsAuthenticated]
+    
+    def get_queryset(self):
+        readable_files = get_access_resolver(self.request).filter_files(File.objects.all())
+        return FilePreview.objects.filter(file__in=readable_files)
 
 
-class FileSearchView(APIView):
+class FileSearchView(ReplicaReadMixin, APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request):
@@ -897,7 +1103,7 @@ class FileSearchView(APIView):
         search_vector = SearchVector('name', 'description')
         search_query = SearchQuery(query)
         
-        files = File.objects.annotate(
+        files = get_access_resolver(request).filter_files(File.objects.all()).annotate(
             search=search_vector,
             rank=SearchRank(search_vector, search_query)
         ).filter(search=search_query).order_by('-rank')
@@ -911,7 +1117,7 @@ class FileVersionUploadView(APIView):
     
     def post(self, request, file_id):
         try:
-            file_obj = get_object_or_404(File, id=file_id)
+            file_obj = get_object_or_404(get_access_resolver(request).filter_files(File.objects.all(), 'write'), id=file_id)
             uploaded_file = request.FILES.get('file')
             change_description = request.data.get('change_description', '')
             
@@ -934,6 +1140,8 @@ class FileVersionUploadView(APIView):
             serializer = FileVersionSerializer(version)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
             
+        except Http404:
+            raise
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -943,7 +1151,12 @@ class FileVersionDownloadView(APIView):
     
     def get(self, request, file_id, version_number):
         try:
-            version = get_object_or_404(FileVersion, file_id=file_id, version_number=version_number)
+            readable_files = get_access_resolver(request).filter_files(File.objects.all())
+            version = get_object_or_404(
+                FileVersion.objects.filter(file__in=readable_files),
+                file_id=file_id,
+                version_number=version_number
+            )
             
             if not version.version_file:
                 return Response({'error': 'Version file not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -967,6 +1180,8 @@ class FileVersionDownloadView(APIView):
             
             return response
             
+        except Http404:
+            raise
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -976,7 +1191,7 @@ class FilePermissionGrantView(APIView):
     
     def post(self, request, file_id):
         try:
-            file_obj = get_object_or_404(File, id=file_id)
+            file_obj = get_object_or_404(get_access_resolver(request).filter_files(File.objects.all(), 'admin'), id=file_id)
             user_id = request.data.get('user_id')
             permission_type = request.data.get('permission_type', 'read')
             expires_at = request.data.get('expires_at')
@@ -984,46 +1199,177 @@ class FilePermissionGrantView(APIView):
             if not user_id:
                 return Response({'error': 'User ID is required'}, status=status.HTTP_400_BAD_REQUEST)
             
+            if permission_type not in dict(FilePermission.PERMISSION_CHOICES):
+                return Response({'error': 'Invalid permission type'}, status=status.HTTP_400_BAD_REQUEST)
+            
             try:
                 user = User.objects.get(id=user_id)
             except User.DoesNotExist:
                 return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
             
-            # Check if permission already exists
-            permission, created = FilePermission.objects.get_or_create(
-                file=file_obj,
-                user=user,
-                defaults={
-                    'permission_type': permission_type,
-                    'granted_by': request.user,
-                    'expires_at': expires_at
-                }
-            )
-            
-            if not created:
-                # Update existing permission
-                permission.permission_type = permission_type
-                permission.expires_at = expires_at
-                permission.save()
+            # Creates the permission or updates (and reactivates) an existing one
+            grant_permissions(request.user, [user], files=[file_obj], permission_type=permission_type, expires_at=expires_at)
+            permission = FilePermission.objects.select_related('user', 'granted_by').get(file=file_obj, user=user)
             
             serializer = FilePermissionSerializer(permission)
             return Response(serializer.data, status=status.HTTP_200_OK)
             
+        except Http404:
+            raise
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class FolderPermissionGrantView(APIView):
+    """Grant a user access to a folder and everything beneath it"""
+    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [CachedJWTAuthentication]
+    
+    def post(self, request, pk):
+        try:
+            folder = get_object_or_404(Folder, id=pk)
+            if not get_access_resolver(request).has_folder_access(folder, 'admin'):
+                return Response({'error': 'You do not have admin access to this folder'}, status=status.HTTP_403_FORBIDDEN)
+            
+            user_id = request.data.get('user_id')
+            permission_type = request.data.get('permission_type', 'read')
+            expires_at = request.data.get('expires_at')
+            
+            if not user_id:
+                return Response({'error': 'User ID is required'}, status=status.HTTP_400_BAD_REQUEST)
+            if permission_type not in dict(FilePermission.PERMISSION_CHOICES):
+                return Response({'error': 'Invalid permission type'}, status=status.HTTP_400_BAD_REQUEST)
+            
+            try:
+                user = User.objects.get(id=user_id)
+            except User.DoesNotExist:
+                return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+            
+            grant_permissions(request.user, [user], folders=[folder], permission_type=permission_type, expires_at=expires_at)
+            permission = FolderPermission.objects.select_related('user', 'granted_by').get(folder=folder, user=user)
+            
+            serializer = FolderPermissionSerializer(permission)
+            return Response(serializer.data, status=status.HTTP_200_OK)
+            
+        except Http404:
+            raise
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class FileByTagView(APIView):
+class BulkPermissionView(APIView):
+    """Shared parsing for the bulk grant / revoke endpoints"""
     permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [CachedJWTAuthentication]
+    serializer_class = BulkPermissionSerializer
+    
+    def get_targets(self, request):
+        """Return (validated data, users, files, folders) from the request body, or an error Response"""
+        serializer = self.serializer_class(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        
+        users = list(User.objects.filter(id__in=data['user_ids']))
+        resolver = get_access_resolver(request)
+        files = list(resolver.filter_files(File.objects.filter(id__in=data['file_ids']), 'admin'))
+        folders = list(Folder.objects.filter(id__in=data['folder_ids']))
+        
+        if len(users) != len(data['user_ids']):
+            return Response({'error': 'One or more users were not found'}, status=status.HTTP_404_NOT_FOUND)
+        if len(files) != len(data['file_ids']):
+            return Response({'error': 'One or more files were not found or you do not have admin access to them'}, status=status.HTTP_404_NOT_FOUND)
+        if len(folders) != len(data['folder_ids']):
+            return Response({'error': 'One or more folders were not found'}, status=status.HTTP_404_NOT_FOUND)
+        if not all(resolver.has_folder_access(folder, 'admin') for folder in folders):
+            return Response({'error': 'You do not have admin access to one or more folders'}, status=status.HTTP_403_FORBIDDEN)
+        
+        return data, users, files, folders
+
+
+class PermissionBulkGrantView(BulkPermissionView):
+    """Grant many users access to many files and/or folder subtrees in one request"""
+    serializer_class = BulkPermissionGrantSerializer
+    
+    def post(self, request):
+        targets = self.get_targets(request)
+        if isinstance(targets, Response):
+            return targets
+        data, users, files, folders = targets
+        
+        result = grant_permissions(
+            request.user,
+            users,
+            files=files,
+            folders=folders,
+            permission_type=data['permission_type'],
+            expires_at=data['expires_at']
+        )
+        return Response(result, status=status.HTTP_200_OK)
+
+
+class PermissionBulkRevokeView(BulkPermissionView):
+    """Revoke many users' grants on many files and/or folders in one request"""
+    
+    def post(self, request):
+        targets = self.get_targets(request)
+        if isinstance(targets, Response):
+            return targets
+        _, users, files, folders = targets
+        
+        result = revoke_permissions(users, files=files, folders=folders)
+        return Response(result, status=status.HTTP_200_OK)
+
+
+class TagQueryPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class FileByTagView(ReplicaReadMixin, APIView):
+    """
+    Files matching a tag query: `all` (AND), `any` (OR) and `none` (NOT) take
+    tag ids, repeated or comma-separated. `tags` is kept as an alias of `any`.
+    Optionally scoped to `folder` (an id, or `root`), including subfolders
+    when `recursive=true`.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = TagQueryPagination
     
     def get(self, request):
-        tag_ids = request.query_params.getlist('tags')
-        if not tag_ids:
+        params = request.query_params
+        try:
+            all_tags = parse_tag_ids(params.getlist('all'))
+            any_tags = parse_tag_ids(params.getlist('any') + params.getlist('tags'))
+            no_tags = parse_tag_ids(params.getlist('none'))
+        except ValueError:
+            return Response({'error': 'Tag IDs must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if not (all_tags or any_tags or no_tags):
             return Response({'error': 'At least one tag is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        files = File.objects.filter(tags__id__in=tag_ids).distinct()
-        serializer = FileSerializer(files, many=True)
-        return Response(serializer.data)
+        files = filter_by_tags(File.objects.all(), all_tags, any_tags, no_tags)
+        
+        folder_param = params.get('folder')
+        if folder_param == 'root':
+            files = files.filter(folder__isnull=True)
+        elif folder_param:
+            try:
+                folder = Folder.objects.get(pk=int(folder_param))
+            except (ValueError, Folder.DoesNotExist):
+                return Response({'error': 'Folder not found'}, status=status.HTTP_404_NOT_FOUND)
+            if params.get('recursive', '').lower() in ('1', 'true', 'yes'):
+                files = files.filter(folder_id__in=folder.get_descendant_ids())
+            else:
+                files = files.filter(folder=folder)
+        
+        files = get_access_resolver(request).filter_files(files)
+        files = files.select_related('uploaded_by', 'folder').prefetch_related('tags').order_by('-uploaded_at', '-id')
+        
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(files, request, view=self)
+        serializer = FileSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 
 class TestAuthView(APIView):
@@ -1060,12 +1406,15 @@ class TestFileOperationsView(APIView):
 
 class FileDuplicateView(APIView):
     permission_classes = [permissions.IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     
     def post(self, request, pk):
         """Duplicate a file"""
         try:
-            original_file = get_object_or_404(File, pk=pk)
+            resolver = get_access_resolver(request)
+            original_file = get_object_or_404(resolver.filter_files(File.objects.all()), pk=pk)
+            if not resolver.has_folder_access(original_file.folder, 'write'):
+                return Response({'error': 'You do not have write access to this folder'}, status=status.HTTP_403_FORBIDDEN)
             
             # Create a copy of the file with proper extension handling
             base_name, extension = os.path.splitext(original_file.name)
@@ -1094,20 +1443,23 @@ class FileDuplicateView(APIView):
             serializer = FileSerializer(new_file)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
             
+        except Http404:
+            raise
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 class FolderDuplicateView(APIView):
     permission_classes = [permissions.IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     
     def post(self, request, pk):
         """Duplicate a folder"""
         try:
-            print(f"Starting folder duplication for pk={pk}")
             original_folder = get_object_or_404(Folder, pk=pk)
-            print(f"Found original folder: {original_folder.name}")
+            resolver = get_access_resolver(request)
+            if not resolver.has_folder_access(original_folder.parent, 'write'):
+                return Response({'error': 'You do not have write access to the parent folder'}, status=status.HTTP_403_FORBIDDEN)
             
             # Create a copy of the folder with unique naming
             duplicate_name = f"{original_folder.name} (Copy)"
@@ -1124,14 +1476,12 @@ class FolderDuplicateView(APIView):
                 created_by=request.user,
                 parent=original_folder.parent
             )
-            print(f"Created new folder: {new_folder.name}")
+            logger.debug('Duplicating folder %s into %s', original_folder.id, new_folder.id)
             
             # Copy files from original folder to new folder
-            files_in_original = File.objects.filter(folder=original_folder)
-            print(f"Found {files_in_original.count()} files to copy")
+            files_in_original = resolver.filter_files(File.objects.filter(folder=original_folder))
             
             for file_obj in files_in_original:
-                print(f"Copying file: {file_obj.name}")
                 new_file = File.objects.create(
                     name=file_obj.name,
                     file=file_obj.file,
@@ -1144,40 +1494,36 @@ class FolderDuplicateView(APIView):
                 
                 # Copy tags separately (many-to-many relationship)
                 if file_obj.tags.exists():
-                    print(f"Copying tags for file: {file_obj.name}")
                     new_file.tags.set(file_obj.tags.all())
             
             serializer = FolderSerializer(new_folder)
-            print(f"Folder duplication completed successfully")
             return Response(serializer.data, status=status.HTTP_201_CREATED)
             
+        except Http404:
+            raise
         except Exception as e:
-            print(f"Error duplicating folder: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception('Error duplicating folder %s', pk)
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 class FolderDownloadView(APIView):
     permission_classes = [permissions.IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     
+    @rate_limit('folder_download', limit=50, period=3600)  # 50 archives per hour
     def get(self, request, pk):
         """Download a folder as a ZIP file containing all its contents"""
         try:
-            folder = get_object_or_404(Folder, pk=pk)
-            print(f"Starting download for folder: {folder.name} (ID: {folder.id})")
+            folder = get_object_or_404(get_access_resolver(request).filter_folders(Folder.objects.all()), pk=pk)
             
             # Create a temporary ZIP file
             temp_zip_path = tempfile.mktemp(suffix='.zip')
             
             with zipfile.ZipFile(temp_zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
                 # Add all files in the current folder to the ZIP
-                files_in_folder = File.objects.filter(folder=folder)
-                print(f"Found {files_in_folder.count()} files in folder {folder.name}")
+                files_in_folder = get_access_resolver(request).filter_files(File.objects.filter(folder=folder))
                 
                 for file_obj in files_in_folder:
-                    print(f"Processing file: {file_obj.name}")
                     if file_obj.file:
                         if default_storage.exists(file_obj.file.name):
                             try:
@@ -1187,20 +1533,17 @@ class FolderDownloadView(APIView):
                                 
                                 # Add to ZIP with the file name
                                 zip_file.writestr(file_obj.name, file_content)
-                                print(f"Added file to ZIP: {file_obj.name}")
-                            except Exception as e:
-                                print(f"Error adding file {file_obj.name} to ZIP: {e}")
+                            except Exception:
+                                logger.warning('Could not add file %s to the ZIP of folder %s', file_obj.id, folder.id, exc_info=True)
                                 continue
                         else:
-                            print(f"File not found in storage: {file_obj.name} (path: {file_obj.file.name})")
+                            logger.warning('File %s missing from storage (%s)', file_obj.id, file_obj.file.name)
                             # Create a placeholder file in the ZIP to indicate the missing file
                             placeholder_content = f"File '{file_obj.name}' was not found in storage.\nThis file may have been deleted or the upload failed.\nOriginal path: {file_obj.file.name}\nFile size in database: {file_obj.get_file_size_display()}"
                             zip_file.writestr(f"MISSING_{file_obj.name}.txt", placeholder_content)
-                    else:
-                        print(f"File object has no file field: {file_obj.name}")
                 
                 # Recursively add files from subfolders
-                self._add_subfolder_contents(zip_file, folder, folder.name)
+                self._add_subfolder_contents(zip_file, folder, folder.name, get_access_resolver(request))
             
             # Read the ZIP file content
             with open(temp_zip_path, 'rb') as zip_file:
@@ -1209,7 +1552,7 @@ class FolderDownloadView(APIView):
             # Clean up the temporary file
             os.unlink(temp_zip_path)
             
-            print(f"ZIP file created successfully. Size: {len(zip_content)} bytes")
+            logger.debug('Built ZIP of folder %s: %s bytes', folder.id, len(zip_content))
             
             # Create response with proper headers
             response = HttpResponse(zip_content, content_type='application/zip')
@@ -1218,45 +1561,38 @@ class FolderDownloadView(APIView):
             
             return response
                 
+        except Http404:
+            raise
         except Exception as e:
-            print(f"Error downloading folder: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception('Error downloading folder %s', pk)
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
-    def _add_subfolder_contents(self, zip_file, folder, base_path):
+    def _add_subfolder_contents(self, zip_file, folder, base_path, resolver):
         """Recursively add contents of subfolders to the ZIP"""
-        print(f"Checking subfolders for: {folder.name}")
         for subfolder in folder.children.all():
             subfolder_path = f"{base_path}/{subfolder.name}"
-            print(f"Processing subfolder: {subfolder.name} at path: {subfolder_path}")
             
             # Add files in this subfolder
-            files_in_subfolder = File.objects.filter(folder=subfolder)
-            print(f"Found {files_in_subfolder.count()} files in subfolder {subfolder.name}")
+            files_in_subfolder = resolver.filter_files(File.objects.filter(folder=subfolder))
             
             for file_obj in files_in_subfolder:
-                print(f"Processing subfolder file: {file_obj.name}")
                 if file_obj.file and default_storage.exists(file_obj.file.name):
                     try:
                         with default_storage.open(file_obj.file.name, 'rb') as f:
                             file_content = f.read()
                         zip_file.writestr(f"{subfolder_path}/{file_obj.name}", file_content)
-                        print(f"Added subfolder file to ZIP: {subfolder_path}/{file_obj.name}")
-                    except Exception as e:
-                        print(f"Error adding subfolder file {file_obj.name} to ZIP: {e}")
+                    except Exception:
+                        logger.warning('Could not add file %s to the ZIP of folder %s', file_obj.id, subfolder.id, exc_info=True)
                         continue
-                else:
-                    print(f"Subfolder file not found: {file_obj.name}")
             
             # Recursively add subfolders
-            self._add_subfolder_contents(zip_file, subfolder, subfolder_path)
+            self._add_subfolder_contents(zip_file, subfolder, subfolder_path, resolver)
 
 
 class PasswordChangeView(APIView):
     """Allow authenticated users to change their password"""
     permission_classes = [permissions.IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     
     def post(self, request):
         serializer = PasswordChangeSerializer(data=request.data)
@@ -1278,36 +1614,60 @@ class PasswordChangeView(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def verify_security_questions(username, security_answer, professor_lastname):
+    """
+    (user, None) if the answers are right, else (None, error response).
+    The user and their security questions are loaded in one query, and
+    attempts are limited per account (in the shared rate limit backend)
+    before any answer is hashed, so guessing one account's answers from
+    many IPs gets nowhere either.
+    """
+    user = User.objects.select_related('security_questions').filter(username=username).first()
+    if user is None:
+        return None, Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    if getattr(settings, 'RATELIMIT_ENABLED', True):
+        result = check_subject_rate_limit(
+            'security_answers', f'user:{user.pk}', settings.SECURITY_ANSWER_ATTEMPTS, settings.SECURITY_ANSWER_PERIOD
+        )
+        if not result.allowed:
+            response = Response(
+                {'error': 'Too many attempts for this account. Please try again later.', 'retry_after': result.retry_after},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+            response['Retry-After'] = str(result.retry_after)
+            return None, response
+    
+    # Verify professor's last name (always required)
+    if UserSecurityQuestions.normalize_answer(professor_lastname) != 'williams':
+        return None, Response({'error': 'Professor last name is incorrect'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Check if user has security questions set up (optional)
+    try:
+        security_questions = user.security_questions
+    except UserSecurityQuestions.DoesNotExist:
+        # If no security questions set up, that's okay - just verify professor's name
+        return user, None
+    if security_questions.security_answer and not security_questions.verify_security_answer(security_answer):
+        return None, Response({'error': 'Security answer is incorrect'}, status=status.HTTP_400_BAD_REQUEST)
+    return user, None
+
+
 class PasswordResetRequestView(APIView):
     """Verify security questions for password reset"""
     permission_classes = [permissions.AllowAny]
     
+    @rate_limit('password_reset', limit=5, period=900, key='ip')  # 5 attempts per 15 minutes
     def post(self, request):
         serializer = PasswordResetRequestSerializer(data=request.data)
         if serializer.is_valid():
-            username = serializer.validated_data['username']
-            security_answer = serializer.validated_data.get('security_answer', '')
-            professor_lastname = serializer.validated_data['professor_last_name']
-            
-            try:
-                user = User.objects.get(username=username)
-            except User.DoesNotExist:
-                return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
-            
-            # Verify professor's last name (always required)
-            if professor_lastname.lower() != 'williams':
-                return Response({'error': 'Professor last name is incorrect'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Check if user has security questions set up (optional)
-            try:
-                security_questions = user.security_questions
-                if security_questions.security_answer:
-                    # If security questions exist, verify them
-                    if not security_questions.verify_security_answer(security_answer):
-                        return Response({'error': 'Security answer is incorrect'}, status=status.HTTP_400_BAD_REQUEST)
-            except UserSecurityQuestions.DoesNotExist:
-                # If no security questions set up, that's okay - just verify professor's name
-                pass
+            user, error = verify_security_questions(
+                serializer.validated_data['username'],
+                serializer.validated_data.get('security_answer', ''),
+                serializer.validated_data['professor_last_name'],
+            )
+            if error is not None:
+                return error
             
             return Response({'message': 'Verification successful'}, status=status.HTTP_200_OK)
         else:
@@ -1318,36 +1678,20 @@ class PasswordResetConfirmView(APIView):
     """Reset password after security questions verification"""
     permission_classes = [permissions.AllowAny]
     
+    @rate_limit('password_reset_confirm', limit=5, period=900, key='ip')
     def post(self, request):
         serializer = PasswordResetConfirmSerializer(data=request.data)
         if serializer.is_valid():
-            username = serializer.validated_data['username']
-            security_answer = serializer.validated_data.get('security_answer', '')
-            professor_lastname = serializer.validated_data['professor_last_name']
-            new_password = serializer.validated_data['new_password']
-            
-            try:
-                user = User.objects.get(username=username)
-            except User.DoesNotExist:
-                return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
-            
-            # Verify professor's last name (always required)
-            if professor_lastname.lower() != 'williams':
-                return Response({'error': 'Professor last name is incorrect'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Check if user has security questions set up (optional)
-            try:
-                security_questions = user.security_questions
-                if security_questions.security_answer:
-                    # If security questions exist, verify them
-                    if not security_questions.verify_security_answer(security_answer):
-                        return Response({'error': 'Security answer is incorrect'}, status=status.HTTP_400_BAD_REQUEST)
-            except UserSecurityQuestions.DoesNotExist:
-                # If no security questions set up, that's okay - just verify professor's name
-                pass
+            user, error = verify_security_questions(
+                serializer.validated_data['username'],
+                serializer.validated_data.get('security_answer', ''),
+                serializer.validated_data['professor_last_name'],
+            )
+            if error is not None:
+                return error
             
             # Set new password (skip Django's password validation for resets)
-            user.set_password(new_password)
+            user.set_password(serializer.validated_data['new_password'])
             user.save()
             
             return Response({'message': 'Password reset successfully'}, status=status.HTTP_200_OK)
@@ -1358,7 +1702,7 @@ class PasswordResetConfirmView(APIView):
 class SecurityQuestionsSetupView(APIView):
     """Allow users to set up security questions"""
     permission_classes = [permissions.IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     
     def post(self, request):
         serializer = SecurityQuestionsSetupSerializer(data=request.data)
@@ -1370,11 +1714,12 @@ class SecurityQuestionsSetupView(APIView):
                 return Response({'error': 'Security questions already set up'}, status=status.HTTP_400_BAD_REQUEST)
             
             # Create security questions - professor_last_name is required
-            security_questions = UserSecurityQuestions.objects.create(
-                user=user,
-                security_answer=serializer.validated_data['security_answer'],
-                professor_last_name=serializer.validated_data['professor_last_name']
+            security_questions = UserSecurityQuestions(user=user)
+            security_questions.set_answers(
+                serializer.validated_data['security_answer'],
+                serializer.validated_data['professor_last_name']
             )
+            security_questions.save()
             
             response_serializer = UserSecurityQuestionsSerializer(security_questions)
             return Response(response_serializer.data, status=status.HTTP_201_CREATED)
@@ -1385,27 +1730,20 @@ class SecurityQuestionsSetupView(APIView):
 class SecurityQuestionsUpdateView(APIView):
     """Allow users to update their security questions"""
     permission_classes = [permissions.IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     
     def put(self, request):
         serializer = SecurityQuestionsSetupSerializer(data=request.data)
         if serializer.is_valid():
             user = request.user
             
-            # Get or create security questions - professor_last_name is required
-            security_questions, created = UserSecurityQuestions.objects.get_or_create(
-                user=user,
-                defaults={
-                    'security_answer': serializer.validated_data['security_answer'],
-                    'professor_last_name': serializer.validated_data['professor_last_name']
-                }
+            # Create or replace security questions - professor_last_name is required
+            security_questions = UserSecurityQuestions.objects.filter(user=user).first() or UserSecurityQuestions(user=user)
+            security_questions.set_answers(
+                serializer.validated_data['security_answer'],
+                serializer.validated_data['professor_last_name']
             )
-            
-            if not created:
-                # Update existing security questions
-                security_questions.security_answer = serializer.validated_data['security_answer']
-                security_questions.professor_last_name = serializer.validated_data['professor_last_name']
-                security_questions.save()
+            security_questions.save()
             
             response_serializer = UserSecurityQuestionsSerializer(security_questions)
             return Response(response_serializer.data, status=status.HTTP_200_OK)
@@ -1417,6 +1755,7 @@ class EmailPasswordResetRequestView(APIView):
     """Send password reset code to user's email"""
     permission_classes = [permissions.AllowAny]
     
+    @rate_limit('email_password_reset', limit=5, period=3600, key='ip')  # 5 emails per hour
     def post(self, request):
         serializer = EmailPasswordResetRequestSerializer(data=request.data)
         if serializer.is_valid():
@@ -1428,13 +1767,16 @@ class EmailPasswordResetRequestView(APIView):
                 # Don't reveal if email exists or not for security
                 return Response({'message': 'If an account with this email exists, a reset code has been sent.'}, status=status.HTTP_200_OK)
             
-            # Create reset code
-            reset_code = PasswordResetCode.create_for_user(user)
-            
-            # Send email with reset code
+            # The code and its email are committed together; the email is
+            # sent from the outbox after commit, so a slow mail server can't
+            # hold up or fail the request
             try:
-                subject = 'Password Reset Code - Marc-D'
-                message = f"""
+                with transaction.atomic():
+                    reset_code = PasswordResetCode.create_for_user(user)
+                    queue_email(
+                        to_email=email,
+                        subject='Password Reset Code - Marc-D',
+                        body=f"""
 Hello {user.username},
 
 You have requested a password reset for your Marc-D account.
@@ -1447,22 +1789,13 @@ If you did not request this password reset, please ignore this email.
 
 Best regards,
 The Marc-D Team
-                """
-                
-                send_mail(
-                    subject=subject,
-                    message=message,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[email],
-                    fail_silently=False,
-                )
-                
-                return Response({'message': 'Password reset code sent to your email.'}, status=status.HTTP_200_OK)
-                
-            except Exception as e:
-                # Log the error but don't expose it to the user
-                print(f"Error sending email: {e}")
+                """,
+                    )
+            except Exception:
+                logger.exception('Error queueing password reset email')
                 return Response({'error': 'Failed to send reset code. Please try again later.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            
+            return Response({'message': 'Password reset code sent to your email.'}, status=status.HTTP_200_OK)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -1471,31 +1804,17 @@ class EmailPasswordResetVerifyView(APIView):
     """Verify the reset code"""
     permission_classes = [permissions.AllowAny]
     
+    @rate_limit('email_password_reset_verify', limit=10, period=900, key='ip')
     def post(self, request):
         serializer = EmailPasswordResetVerifySerializer(data=request.data)
         if serializer.is_valid():
             email = serializer.validated_data['email']
             code = serializer.validated_data['code']
             
-            try:
-                user = User.objects.get(email=email)
-            except User.DoesNotExist:
-                return Response({'error': 'Invalid email or code.'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Find the reset code
-            try:
-                reset_code = PasswordResetCode.objects.get(
-                    user=user,
-                    code=code,
-                    is_used=False
-                )
-            except PasswordResetCode.DoesNotExist:
+            # Unknown email, wrong, expired, used and over-guessed codes all look the same
+            if PasswordResetCode.check_code(email, code) is None:
                 return Response({'error': 'Invalid email or code.'}, status=status.HTTP_400_BAD_REQUEST)
             
-            # Check if code is valid
-            if not reset_code.is_valid():
-                return Response({'error': 'Reset code has expired or is invalid.'}, status=status.HTTP_400_BAD_REQUEST)
-            
             return Response({'message': 'Reset code verified successfully.'}, status=status.HTTP_200_OK)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -1505,6 +1824,7 @@ class EmailPasswordResetConfirmView(APIView):
     """Reset password using email code"""
     permission_classes = [permissions.AllowAny]
     
+    @rate_limit('email_password_reset_confirm', limit=5, period=900, key='ip')
     def post(self, request):
         serializer = EmailPasswordResetConfirmSerializer(data=request.data)
         if serializer.is_valid():
@@ -1512,30 +1832,13 @@ class EmailPasswordResetConfirmView(APIView):
             code = serializer.validated_data['code']
             new_password = serializer.validated_data['new_password']
             
-            try:
-                user = User.objects.get(email=email)
-            except User.DoesNotExist:
-                return Response({'error': 'Invalid email or code.'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Find the reset code
-            try:
-                reset_code = PasswordResetCode.objects.get(
-                    user=user,
-                    code=code,
-                    is_used=False
-                )
-            except PasswordResetCode.DoesNotExist:
+            # Marks the code used if it matches, so it works exactly once
+            reset_code = PasswordResetCode.check_code(email, code, consume=True)
+            if reset_code is None:
                 return Response({'error': 'Invalid email or code.'}, status=status.HTTP_400_BAD_REQUEST)
             
-            # Check if code is valid
-            if not reset_code.is_valid():
-                return Response({'error': 'Reset code has expired or is invalid.'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Mark code as used
-            reset_code.is_used = True
-            reset_code.save()
-            
             # Set new password
+            user = reset_code.user
             user.set_password(new_password)
             user.save()
             
@@ -1548,6 +1851,7 @@ class AdminLoginView(APIView):
     """Custom admin login view with logging"""
     permission_classes = [permissions.AllowAny]
     
+    @rate_limit('admin_login', limit=10, period=60, key='ip')
     def post(self, request):
         """Handle admin login with logging"""
         username = request.data.get('username')
@@ -1561,10 +1865,22 @@ class AdminLoginView(APIView):
             )
             return Response({'error': 'Username and password are required'}, status=status.HTTP_400_BAD_REQUEST)
         
+        # Locked-out attempts are rejected before any password hashing
+        client_ip = get_client_ip(request)
+        retry_after = bruteforce.check_login(username, client_ip)
+        if retry_after:
+            AdminLoginLog.log_failed_login(username, request, 'Locked out')
+            return bruteforce.lockout_response(retry_after)
+        
         # Authenticate user
-        user = authenticate(request, username=username, password=password)
+        try:
+            with fail_fast_hashing():
+                user = authenticate(request, username=username, password=password)
+        except HashingPoolBusy:
+            return hashing_busy_response()
         
         if user is None:
+            bruteforce.record_failure(username, client_ip)
             # Log failed login
             AdminLoginLog.log_failed_login(
                 username,
@@ -1583,6 +1899,7 @@ class AdminLoginView(APIView):
             return Response({'error': 'Access denied. Admin privileges required.'}, status=status.HTTP_403_FORBIDDEN)
         
         # Log successful login
+        bruteforce.record_success(username, client_ip)
         AdminLoginLog.log_successful_login(user, request)
         
         # Perform Django login
@@ -1604,58 +1921,114 @@ class AdminLoginView(APIView):
         return render(request, 'admin/login.html')
 
 
-class AdminLoginLogView(APIView):
-    """View admin login logs (admin only)"""
-    permission_classes = [permissions.IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+class AdminLoginLogView(ReplicaReadMixin, ListAPIView):
+    """Admin login logs, newest first, paginated (admin only); filters as in filter_login_logs"""
+    serializer_class = AdminLoginLogSerializer
+    permission_classes = [IsAdminUser]
+    authentication_classes = [CachedJWTAuthentication]
+    pagination_class = TagQueryPagination
+    
+    def list(self, request, *args, **kwargs):
+        try:
+            return super().list(request, *args, **kwargs)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    def get_queryset(self):
+        return filter_login_logs(AdminLoginLog.objects.all(), self.request.query_params)
+
+
+class AdminLoginAnalyticsView(ReplicaReadMixin, APIView):
+    """
+    Admin login totals, success/failure split, top usernames and IPs by
+    failures and hourly or daily buckets over the last `days` (admin only)
+    """
+    permission_classes = [IsAdminUser]
+    authentication_classes = [CachedJWTAuthentication]
     
     def get(self, request):
-        """Get admin login logs"""
-        if not request.user.is_staff:
-            return Response({'error': 'Admin access required'}, status=status.HTTP_403_FORBIDDEN)
-        
-        # Get query parameters for filtering
-        days = request.query_params.get('days', 30)
-        user_id = request.query_params.get('user_id')
-        success_only = request.query_params.get('success_only', 'false').lower() == 'true'
-        
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        # Filter by date range
-        cutoff_date = timezone.now() - timedelta(days=int(days))
-        logs = AdminLoginLog.objects.filter(login_time__gte=cutoff_date)
-        
-        # Filter by user if specified
-        if user_id:
-            logs = logs.filter(user_id=user_id)
-        
-        # Filter by success if specified
-        if success_only:
-            logs = logs.filter(success=True)
-        
-        # Prepare response data
-        log_data = []
-        for log in logs[:100]:  # Limit to 100 most recent
-            log_data.append({
-                'id': log.id,
-                'user': {
-                    'id': log.user.id if log.user else None,
-                    'username': log.user.username if log.user else 'Unknown'
-                },
-                'login_time': log.login_time,
-                'ip_address': log.ip_address,
-                'user_agent': log.user_agent,
-                'success': log.success,
-                'failure_reason': log.failure_reason
-            })
-        
-        return Response({
-            'logs': log_data,
-            'total_count': logs.count(),
-            'successful_logins': logs.filter(success=True).count(),
-            'failed_logins': logs.filter(success=False).count()
-        }, status=status.HTTP_200_OK)
+        params = request.query_params
+        try:
+            logs = filter_login_logs(AdminLoginLog.objects.all(), {'days': 7, **params.dict()})
+            limit = min(int(params.get('limit', 10)), 100)
+            if limit <= 0:
+                raise ValueError('limit must be positive')
+            # Hourly buckets for short ranges, daily ones beyond two days
+            interval = params.get('interval') or ('hour' if int(params.get('days', 7)) <= 2 else 'day')
+            return Response(login_summary(logs, interval=interval, limit=limit))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class CacheStatsView(APIView):
+    """Cache hit rates per namespace (admin only)"""
+    permission_classes = [IsAdminUser]
+    authentication_classes = [CachedJWTAuthentication]
+    
+    def get(self, request):
+        return Response(cache_stats())
+
+
+class DatabaseStatsView(APIView):
+    """Database connection reuse and pool usage for the worker serving the request (admin only)"""
+    permission_classes = [IsAdminUser]
+    authentication_classes = [CachedJWTAuthentication]
+    
+    def get(self, request):
+        return Response(connection_stats())
+
+
+class HasMetricsToken(permissions.BasePermission):
+    """Bearer METRICS_TOKEN, as sent by Prometheus; open in DEBUG when no token is set"""
+    
+    def has_permission(self, request, view):
+        if not settings.METRICS_TOKEN:
+            return settings.DEBUG
+        return constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}')
+
+
+class MetricsView(APIView):
+    """Per-route request metrics for the worker serving the request, in Prometheus text format"""
+    authentication_classes = []
+    permission_classes = [HasMetricsToken]
+    
+    def get(self, request):
+        body = metrics_registry.render() + bruteforce.stats.render()
+        return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class LoginLockoutView(APIView):
+    """
+    Brute-force lockout state for a `username` and/or `ip` (and its subnet);
+    DELETE clears their failures and lockouts (admin only)
+    """
+    permission_classes = [IsAdminUser]
+    authentication_classes = [CachedJWTAuthentication]
+    
+    def _target(self, params):
+        username = params.get('username') or None
+        ip = params.get('ip') or None
+        if not username and not ip:
+            raise ValueError('username or ip is required')
+        if ip:
+            ip_address(ip)
+        return username, ip
+    
+    def get(self, request):
+        try:
+            username, ip = self._target(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'lockouts': bruteforce.lockout_status(username, ip)})
+    
+    def delete(self, request):
+        try:
+            username, ip = self._target(request.data or request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        cleared = bruteforce.unlock(username, ip)
+        logger.info('Login lockouts cleared', extra={'cleared': cleared, 'by': request.user.username})
+        return Response({'message': 'Lockouts cleared', 'cleared': cleared})
 
 
 # Debug endpoint for mobile testing (can be removed in production)
@@ -1663,13 +2036,15 @@ class AdminLoginLogView(APIView):
 @permission_classes([permissions.AllowAny])
 def mobile_debug_view(request):
     """Debug endpoint to test mobile requests"""
-    user_agent = request.META.get('HTTP_USER_AGENT', '')
+    client = get_client_info(request)
     
     debug_info = {
         'method': request.method,
         'path': request.path,
-        'user_agent': user_agent,
-        'is_mobile': any(indicator in user_agent.lower() for indicator in ['mobile', 'android', 'iphone', 'ipad']),
+        'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+        'is_mobile': client.is_mobile,
+        'device': client.device,
+        'browser': client.browser,
         'csrf_exempt': getattr(request, '_dont_enforce_csrf_checks', False),
         'status': 'Mobile compatibility fixes working correctly!'
     }
@@ -1678,39 +2053,72 @@ def mobile_debug_view(request):
 
 
 # Mobile error reporting endpoint
-@api_view(['POST'])
-@permission_classes([permissions.AllowAny])
-def mobile_error_report(request):
-    """Endpoint for mobile devices to report errors"""
-    try:
-        data = request.data
-        user_agent = request.META.get('HTTP_USER_AGENT', '')
-        ip = request.META.get('REMOTE_ADDR', '')
-        
-        error_report = {
-            'timestamp': timezone.now().isoformat(),
-            'user_agent': user_agent,
-            'ip': ip,
-            'error_type': data.get('error_type', 'unknown'),
-            'error_message': data.get('error_message', ''),
-            'error_stack': data.get('error_stack', ''),
-            'page_url': data.get('page_url', ''),
-            'browser_info': data.get('browser_info', {}),
-            'network_info': data.get('network_info', {}),
-        }
+class MobileErrorReportView(APIView):
+    """Accept one error report or a batch from mobile-error-reporter.js; stored asynchronously"""
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+    
+    @rate_limit('mobile_error_report', limit=60, period=60, key='ip', backend=report_limits)
+    def post(self, request):
+        try:
+            raw_reports = parse_reports(request.data)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        print(f"MOBILE_ERROR_REPORT: {error_report}")
+        try:
+            fingerprints, dropped = record_reports(
+                raw_reports, request.META.get('HTTP_USER_AGENT', ''), get_client_info(request), get_client_ip(request)
+            )
+        except Exception:
+            # Reporting errors must never produce errors for the client to report
+            logger.exception('Error in mobile error report')
+            return Response({'status': 'Error report received'}, status=status.HTTP_200_OK)
         
-        return Response({
+        response = {
             'status': 'Error reported successfully',
-            'error_id': f"ERR-{int(timezone.now().timestamp())}"
-        }, status=status.HTTP_200_OK)
+            'accepted': len(fingerprints),
+            'dropped': dropped,
+        }
+        if fingerprints:
+            response['error_id'] = f"ERR-{fingerprints[0][:12]}"
+        return Response(response, status=status.HTTP_200_OK)
+
+
+class MobileErrorSummaryView(APIView):
+    """Top mobile errors and device/browser breakdowns over the last `hours` (admin only)"""
+    permission_classes = [IsAdminUser]
+    authentication_classes = [CachedJWTAuthentication]
+    
+    def get(self, request):
+        try:
+            hours = int(request.query_params.get('hours', 24))
+            limit = min(int(request.query_params.get('limit', 20)), 100)
+        except ValueError:
+            return Response({'error': 'hours and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < hours <= MAX_SUMMARY_HOURS:
+            return Response(
+                {'error': f'hours must be between 1 and {MAX_SUMMARY_HOURS}'}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if limit <= 0:
+            return Response({'error': 'limit must be positive'}, status=status.HTTP_400_BAD_REQUEST)
         
-    except Exception as e:
-        print(f"Error in mobile_error_report: {str(e)}")
-        return Response({
-            'status': 'Error report received'
-        }, status=status.HTTP_200_OK)
+        return Response(error_summary(
+            timezone.now() - timedelta(hours=hours),
+            limit=limit,
+            device=request.query_params.get('device'),
+            browser=request.query_params.get('browser'),
+        ))
+
+
+class MobileErrorReportListView(ListAPIView):
+    """Stored sample reports of one error group, newest first (admin only)"""
+    serializer_class = MobileErrorReportSerializer
+    permission_classes = [IsAdminUser]
+    authentication_classes = [CachedJWTAuthentication]
+    pagination_class = TagQueryPagination
+    
+    def get_queryset(self):
+        return MobileErrorReport.objects.filter(group_id=self.kwargs['pk'])
 
 
 
@@ -24,6 +24,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main_app.middleware.RequestIdMiddleware',
+    'main_app.middleware.PerformanceMiddleware',
+    'main_app.middleware.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'main_app.middleware.MobileCompatibilityMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -35,6 +38,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'main_app.middleware.AdminLoginLoggingMiddleware',
+    'main_app.middleware.ReplicaPinMiddleware',
 ]
 
 CORS_ALLOWED_ORIGINS = [
@@ -87,10 +91,22 @@ CORS_ALLOW_HEADERS = [
     'sec-fetch-dest',
     'sec-fetch-mode',
     'sec-fetch-site',
+    'x-db-pinned-until',
+    'x-request-id',
 ]
 
 # Allow credentials and handle preflight requests
-CORS_EXPOSE_HEADERS = ['content-type', 'authorization']
+CORS_EXPOSE_HEADERS = [
+    'content-type',
+    'authorization',
+    'retry-after',
+    'x-ratelimit-limit',
+    'x-ratelimit-remaining',
+    'x-ratelimit-reset',
+    'x-db-pinned-until',
+    'server-timing',
+    'x-request-id',
+]
 CORS_ALLOW_ALL_HEADERS = True
 CORS_PREFLIGHT_MAX_AGE = 86400
 CORS_ALLOW_ORIGIN_ALLOW_ALL = DEBUG
@@ -110,13 +126,13 @@ CSRF_TRUSTED_ORIGINS = [
 ROOT_URLCONF = 'marcdwebpage.urls'
 
 REST_FRAMEWORK = {
+    # JSON through orjson (see main_app/renderers.py); the browsable API only in DEBUG
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
-    ),
+        'main_app.renderers.FastJSONRenderer',
+    ) + (('rest_framework.renderers.BrowsableAPIRenderer',) if DEBUG else ()),
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Bearer -> cached JWT auth, Token -> DRF token auth
+        'main_app.authentication.HeaderSchemeAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -143,6 +159,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'marcdwebpage.wsgi.application'
 
+# 'wsgi' or 'asgi'; the same variable picks the server in gunicorn.conf.py
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi').lower()
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -151,9 +170,164 @@ DATABASES = {
         'PASSWORD': os.getenv('PGPASSWORD', 'marcd_password'),
         'HOST': os.getenv('PGHOST', 'localhost'),
         'PORT': os.getenv('PGPORT', '5432'),
+        # Keep connections open between requests instead of reconnecting (and
+        # re-doing the TLS handshake) every time; checked before reuse.
+        # Not under ASGI: queries run on whichever pool thread picks them up,
+        # so each thread would hold its own idle connection; use DB_POOL there.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '0' if SERVER_MODE == 'asgi' else '60')),
+        'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
+        'OPTIONS': {},
+    }
+}
 
+# DB_POOL=True shares a connection pool between a worker's threads instead of
+# one persistent connection per thread. Needs psycopg 3 with its pool
+# (`pip install "psycopg[binary,pool]"`); Django then uses it instead of psycopg2.
+# Size it per worker: workers x DB_POOL_MAX_SIZE must fit the server's max_connections.
+DB_POOL = os.environ.get('DB_POOL', 'False') == 'True'
+if DB_POOL:
+    DATABASES['default']['CONN_MAX_AGE'] = 0  # the pool keeps the connections open
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', os.environ.get('GUNICORN_THREADS', '4'))),
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+        'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', '300')),
     }
+
+
+# Logging (see main_app/log.py): records are queued and written as JSON lines
+# by a background thread, tagged with the request id.
+# LOG_LEVEL sets the level for main_app; LOG_LEVELS overrides single loggers,
+# e.g. LOG_LEVELS="main_app.views=DEBUG,django.db.backends=DEBUG".
+# LOG_DEBUG_SAMPLE_RATE keeps that share of requests' DEBUG records.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'DEBUG' if DEBUG else 'INFO')
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')  # 'json' or 'text'
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {'()': 'main_app.log.RequestIdFilter'},
+        'sampling': {
+            '()': 'main_app.log.SamplingFilter',
+            'rate': float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', '1.0' if DEBUG else '0.1')),
+        },
+    },
+    'formatters': {
+        'json': {'()': 'main_app.log.JsonFormatter'},
+        'text': {'format': '%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'},
+    },
+    'handlers': {
+        'queue': {
+            'class': 'main_app.log.QueueingHandler',
+            'queue_size': int(os.environ.get('LOG_QUEUE_SIZE', '10000')),
+            'formatter': LOG_FORMAT,
+            'filters': ['request_id', 'sampling'],
+        },
+    },
+    'root': {'handlers': ['queue'], 'level': 'WARNING'},
+    'loggers': {
+        'django': {'level': os.environ.get('DJANGO_LOG_LEVEL', 'INFO'), 'propagate': True},
+        'main_app': {'level': LOG_LEVEL, 'propagate': True},
+    },
+}
+for _override in filter(None, os.environ.get('LOG_LEVELS', '').split(',')):
+    _name, _, _level = _override.partition('=')
+    LOGGING['loggers'].setdefault(_name.strip(), {'propagate': True})['level'] = _level.strip().upper()
+
+
+# Request metrics (see main_app/metrics.py). Server-Timing headers show each
+# response's app, database and cache time in browser dev tools. /metrics serves
+# Prometheus metrics to requests with `Authorization: Bearer <METRICS_TOKEN>`
+# (or to anyone in DEBUG when no token is set).
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING_ENABLED', str(DEBUG)) == 'True'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+
+# Response compression (see main_app/compression.py): JSON and text responses of
+# at least COMPRESSION_MIN_SIZE bytes are sent with brotli (needs `pip install brotli`)
+# or gzip, whichever the client accepts. Streaming downloads are never compressed.
+# Use `python manage.py benchmark_compression` to compare sizes and CPU cost.
+COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', 'True') == 'True'
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6'))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '5'))
+# No text/html by default: compressing pages with CSRF tokens enables BREACH
+COMPRESSION_CONTENT_TYPES = set(os.environ.get(
+    'COMPRESSION_CONTENT_TYPES',
+    'application/json,text/csv,text/plain,application/javascript,text/css,application/xml',
+).split(','))
+
+# Mobile error reports (see main_app/mobile_errors.py) are buffered per worker
+# and written in batches; every report is counted, but only a few samples per
+# error group and flush are stored. `python manage.py prune_mobile_errors`
+# applies the retention periods.
+MOBILE_ERROR_FLUSH_INTERVAL = float(os.environ.get('MOBILE_ERROR_FLUSH_INTERVAL', '5'))
+MOBILE_ERROR_BUFFER_SIZE = int(os.environ.get('MOBILE_ERROR_BUFFER_SIZE', '10000'))
+MOBILE_ERROR_SAMPLES_PER_FLUSH = int(os.environ.get('MOBILE_ERROR_SAMPLES_PER_FLUSH', '5'))
+MOBILE_ERROR_REPORT_RETENTION_DAYS = int(os.environ.get('MOBILE_ERROR_REPORT_RETENTION_DAYS', '14'))
+MOBILE_ERROR_COUNT_RETENTION_DAYS = int(os.environ.get('MOBILE_ERROR_COUNT_RETENTION_DAYS', '90'))
+
+
+# Admin login attempts (see main_app/audit.py) are buffered per worker and
+# written in batches, so the login path never waits on the audit log.
+ADMIN_LOGIN_LOG_FLUSH_INTERVAL = float(os.environ.get('ADMIN_LOGIN_LOG_FLUSH_INTERVAL', '2'))
+ADMIN_LOGIN_LOG_BUFFER_SIZE = int(os.environ.get('ADMIN_LOGIN_LOG_BUFFER_SIZE', '10000'))
+
+
+# Optional read replica (see main_app/routers.py). Heavy read-only endpoints
+# read from it; a client that just wrote reads from the primary for
+# REPLICA_PIN_SECONDS. Unset DB_REPLICA_HOST and DB_REPLICA_NAME = no replica.
+if os.environ.get('DB_REPLICA_HOST') or os.environ.get('DB_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ.get('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'USER': os.environ.get('DB_REPLICA_USER', DATABASES['default']['USER']),
+        'PASSWORD': os.environ.get('DB_REPLICA_PASSWORD', DATABASES['default']['PASSWORD']),
+        'HOST': os.environ.get('DB_REPLICA_HOST', DATABASES['default']['HOST']),
+        'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['main_app.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', '10'))
+
+
+# Log in with a username or an email address (see main_app/backends.py)
+AUTHENTICATION_BACKENDS = ['main_app.backends.UsernameOrEmailBackend']
+
+
+# Password hashing (see main_app/hashers.py)
+# PASSWORD_HASHER picks the algorithm for new hashes: 'pbkdf2', 'scrypt' or 'argon2'
+# (argon2 needs `pip install argon2-cffi`). Existing hashes keep verifying and are
+# upgraded to the preferred algorithm and costs on the user's next login.
+# Use `python manage.py benchmark_hashers` to pick costs for this machine.
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'pbkdf2')
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', '0'))  # 0 = Django's default
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.environ.get('PASSWORD_SCRYPT_WORK_FACTOR', str(2 ** 14)))
+PASSWORD_SCRYPT_BLOCK_SIZE = int(os.environ.get('PASSWORD_SCRYPT_BLOCK_SIZE', '8'))
+PASSWORD_SCRYPT_PARALLELISM = int(os.environ.get('PASSWORD_SCRYPT_PARALLELISM', '1'))
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_ARGON2_TIME_COST', '2'))
+PASSWORD_ARGON2_MEMORY_COST = int(os.environ.get('PASSWORD_ARGON2_MEMORY_COST', '65536'))  # KiB
+PASSWORD_ARGON2_PARALLELISM = int(os.environ.get('PASSWORD_ARGON2_PARALLELISM', '1'))
+
+_PASSWORD_HASHERS = {
+    'pbkdf2': 'main_app.hashers.TunedPBKDF2PasswordHasher',
+    'scrypt': 'main_app.hashers.TunedScryptPasswordHasher',
+    'argon2': 'main_app.hashers.TunedArgon2PasswordHasher',
 }
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    hasher for name, hasher in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER
+] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
+# At most this many password hashes run at once per worker process; more wait. The
+# API login endpoints answer 503 with Retry-After once HASHING_POOL_QUEUE hashes are
+# waiting or a hash waited HASHING_POOL_TIMEOUT seconds; other callers just wait.
+HASHING_POOL_WORKERS = int(os.environ.get('HASHING_POOL_WORKERS', str(max(1, (os.cpu_count() or 2) // 2))))
+HASHING_POOL_QUEUE = int(os.environ.get('HASHING_POOL_QUEUE', '16'))
+HASHING_POOL_TIMEOUT = float(os.environ.get('HASHING_POOL_TIMEOUT', '10'))
 
 
 # Password validation
@@ -209,8 +383,12 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': True,
+    # Rotated refresh tokens are revoked by main_app.revocation (token_blacklist isn't installed)
     'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_REFRESH_SERIALIZER': 'main_app.serializers.RevokingTokenRefreshSerializer',
     'UPDATE_LAST_LOGIN': False,
+    # Embed a hash of the password hash so changing the password revokes older tokens
+    'CHECK_REVOKE_TOKEN': True,
 
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
@@ -236,3 +414,105 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_LIFETIME': timedelta(minutes=5),
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
+
+# Caching
+# CACHE_BACKEND: 'db' (shared database tables, run `python manage.py createcachetable`),
+# 'redis' (shared, needs the `redis` package and CACHE_URL) or 'locmem' (per process, development only)
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'db')
+CACHE_URL = os.environ.get('CACHE_URL', 'redis://127.0.0.1:6379/1')
+# Bump to invalidate every cached value at once, e.g. when a cached data format changes
+CACHE_VERSION = int(os.environ.get('CACHE_VERSION', '1'))
+
+# One alias per subsystem, so each gets its own key prefix (and table, for 'db')
+CACHE_NAMESPACES = {
+    'default': 300,
+    'ratelimit': 3600,
+    'permissions': 60,
+    'listings': 300,
+    'auth': 300,
+}
+
+
+def _cache_config(namespace, timeout):
+    config = {
+        'KEY_PREFIX': f'marcd:{namespace}',
+        'VERSION': CACHE_VERSION,
+        'TIMEOUT': timeout,
+    }
+    if CACHE_BACKEND == 'redis':
+        config.update(BACKEND='django.core.cache.backends.redis.RedisCache', LOCATION=CACHE_URL)
+    elif CACHE_BACKEND == 'locmem':
+        config.update(BACKEND='django.core.cache.backends.locmem.LocMemCache', LOCATION=namespace)
+    else:
+        config.update(
+            BACKEND='django.core.cache.backends.db.DatabaseCache',
+            LOCATION=f'cache_{namespace}',
+            OPTIONS={'MAX_ENTRIES': 50000},
+        )
+    return config
+
+
+CACHES = {namespace: _cache_config(namespace, timeout) for namespace, timeout in CACHE_NAMESPACES.items()}
+
+# Rate limiting (see main_app/ratelimit.py)
+# Backends: 'cache' (shared when the cache is), 'db' or 'memory' (per process).
+# The database cache has no atomic incr, so it rate limits through the 'db' backend instead.
+RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'True') == 'True'
+RATELIMIT_BACKEND = os.environ.get('RATELIMIT_BACKEND', 'db' if CACHE_BACKEND == 'db' else 'cache')
+RATELIMIT_CACHE_ALIAS = os.environ.get('RATELIMIT_CACHE_ALIAS', 'ratelimit')
+RATELIMIT_ALGORITHM = os.environ.get('RATELIMIT_ALGORITHM', 'sliding_window')  # or 'token_bucket'
+# Number of reverse proxies in front of the app whose X-Forwarded-For entries can be trusted.
+# Production runs behind one (Railway's); with 0 every client would share the proxy's
+# address and its limits. Set 0 only when clients connect to the app directly.
+RATELIMIT_PROXY_COUNT = int(os.environ.get('RATELIMIT_PROXY_COUNT', '1'))
+
+# Email. For local testing without a mail server use
+# EMAIL_BACKEND=django.core.mail.backends.filebased.EmailBackend (written to
+# EMAIL_FILE_PATH) or the console backend.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'False') == 'True'
+EMAIL_USE_SSL = os.environ.get('EMAIL_USE_SSL', 'False') == 'True'
+EMAIL_TIMEOUT = int(os.environ.get('EMAIL_TIMEOUT', '10'))
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', str(BASE_DIR / 'sent_emails'))
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'webmaster@localhost')
+
+# Outgoing email goes through the EmailOutbox table (see main_app/outbox.py):
+# sent after the request's transaction commits, in batches over one
+# connection, retried with backoff (EMAIL_OUTBOX_RETRY_DELAY, doubling).
+# EMAIL_OUTBOX_WORKER sends from a thread in each server process; turn it off
+# when `manage.py drain_email_outbox` runs from cron or with --loop instead.
+EMAIL_OUTBOX_WORKER = os.environ.get('EMAIL_OUTBOX_WORKER', 'True') == 'True'
+EMAIL_OUTBOX_BATCH_SIZE = int(os.environ.get('EMAIL_OUTBOX_BATCH_SIZE', '50'))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', '6'))
+EMAIL_OUTBOX_RETRY_DELAY = int(os.environ.get('EMAIL_OUTBOX_RETRY_DELAY', '30'))
+EMAIL_OUTBOX_POLL_INTERVAL = float(os.environ.get('EMAIL_OUTBOX_POLL_INTERVAL', '60'))
+
+# Wrong guesses allowed per password reset code before it stops working.
+# `python manage.py prune_password_reset_codes` deletes used and expired codes.
+PASSWORD_RESET_MAX_ATTEMPTS = int(os.environ.get('PASSWORD_RESET_MAX_ATTEMPTS', '5'))
+
+# Security-question password reset attempts allowed per account and period
+# (seconds), on top of the per-IP limits.
+SECURITY_ANSWER_ATTEMPTS = int(os.environ.get('SECURITY_ANSWER_ATTEMPTS', '5'))
+SECURITY_ANSWER_PERIOD = int(os.environ.get('SECURITY_ANSWER_PERIOD', '3600'))
+
+# Brute-force lockouts for the login endpoints (see main_app/bruteforce.py),
+# stored in the rate limit backend. Failures are counted per username, IP and
+# subnet over BRUTEFORCE_WINDOW seconds; each lockout of the same username/IP/
+# subnet lasts twice as long as the previous one, up to the maximum.
+BRUTEFORCE_ENABLED = os.environ.get('BRUTEFORCE_ENABLED', 'True') == 'True'
+BRUTEFORCE_WINDOW = int(os.environ.get('BRUTEFORCE_WINDOW', '900'))
+BRUTEFORCE_USERNAME_LIMIT = int(os.environ.get('BRUTEFORCE_USERNAME_LIMIT', '5'))
+BRUTEFORCE_IP_LIMIT = int(os.environ.get('BRUTEFORCE_IP_LIMIT', '20'))
+BRUTEFORCE_SUBNET_LIMIT = int(os.environ.get('BRUTEFORCE_SUBNET_LIMIT', '100'))
+BRUTEFORCE_LOCKOUT_SECONDS = int(os.environ.get('BRUTEFORCE_LOCKOUT_SECONDS', '60'))
+BRUTEFORCE_MAX_LOCKOUT_SECONDS = int(os.environ.get('BRUTEFORCE_MAX_LOCKOUT_SECONDS', '86400'))
+BRUTEFORCE_LOCAL_CACHE_SECONDS = float(os.environ.get('BRUTEFORCE_LOCAL_CACHE_SECONDS', '5'))
+# Proxy addresses/networks (comma-separated) that never get IP or subnet
+# lockouts, e.g. when RATELIMIT_PROXY_COUNT is too low and the proxy's address
+# is taken for the client's. Non-public addresses are always skipped.
+BRUTEFORCE_TRUSTED_PROXIES = [p for p in os.environ.get('BRUTEFORCE_TRUSTED_PROXIES', '').split(',') if p.strip()]
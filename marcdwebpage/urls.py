@@ -19,13 +19,14 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework_simplejwt.views import TokenRefreshView
-from main_app.views import CustomTokenObtainPairView, MobileLoginTestView
+from main_app.views import CustomTokenObtainPairView, MobileLoginTestView, TokenRevokeView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('main_app.urls')),
     path('api/token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/revoke/', TokenRevokeView.as_view(), name='token_revoke'),
     path('login/', CustomTokenObtainPairView.as_view(), name='login'),  # Alias for frontend compatibility
     path('api/login/', CustomTokenObtainPairView.as_view(), name='api_login'),  # Additional alias
     path('api/auth/login/', CustomTokenObtainPairView.as_view(), name='auth_login'),  # Additional alias
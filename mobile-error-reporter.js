@@ -2,9 +2,20 @@
 // Add this to your frontend to capture mobile errors
 
 class MobileErrorReporter {
-    constructor(backendUrl = 'https://your-backend-url.com') {
+    constructor(backendUrl = 'https://your-backend-url.com', options = {}) {
         this.backendUrl = backendUrl;
+        // Reports are queued and sent in batches; repeats of the same error
+        // within a batch are sent once
+        this.batchSize = options.batchSize || 20;
+        this.flushInterval = options.flushInterval || 5000;
+        this.maxQueue = options.maxQueue || 100;
+        this.queue = [];
+        this.seen = new Set();
+        this.flushTimer = null;
+        // Reports are sent with the original fetch, so a failing report can't report itself
+        this.originalFetch = window.fetch.bind(window);
         this.setupErrorHandling();
+        window.addEventListener('pagehide', () => this.flush(true));
     }
 
     setupErrorHandling() {
@@ -37,7 +48,7 @@ class MobileErrorReporter {
     }
 
     interceptFetch() {
-        const originalFetch = window.fetch;
+        const originalFetch = this.originalFetch;
         window.fetch = async (...args) => {
             try {
                 const response = await originalFetch(...args);
@@ -98,21 +109,46 @@ class MobileErrorReporter {
         };
     }
 
-    async reportError(errorData) {
+    reportError(errorData) {
+        const key = `${errorData.error_type}|${errorData.error_message}|${(errorData.error_stack || '').slice(0, 200)}`;
+        if (this.seen.has(key) || this.queue.length >= this.maxQueue) {
+            return;
+        }
+        this.seen.add(key);
+        this.queue.push(errorData);
+        
+        if (this.queue.length >= this.batchSize) {
+            this.flush();
+        } else if (!this.flushTimer) {
+            this.flushTimer = setTimeout(() => this.flush(), this.flushInterval);
+        }
+    }
+
+    async flush(unloading = false) {
+        clearTimeout(this.flushTimer);
+        this.flushTimer = null;
+        if (!this.queue.length) {
+            return;
+        }
+        const body = JSON.stringify(this.queue.splice(0, 50));
+        this.seen.clear();
+        const url = `${this.backendUrl}/api/mobile/error-reports/`;
+        
+        if (unloading && navigator.sendBeacon) {
+            navigator.sendBeacon(url, new Blob([body], { type: 'application/json' }));
+            return;
+        }
         try {
-            const response = await fetch(`${this.backendUrl}/api/mobile/error-report/`, {
+            await this.originalFetch(url, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify(errorData)
+                body,
+                keepalive: true
             });
-            
-            if (response.ok) {
-                console.log('Error reported successfully');
-            }
         } catch (error) {
-            console.error('Failed to report error:', error);
+            console.error('Failed to report errors:', error);
         }
     }
 